@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Add the indexes used by the analytics dashboard's time-window aggregations
+"""
+import os
+import sys
+from dotenv import load_dotenv
+
+# Add current directory to path
+sys.path.append(os.path.dirname(__file__))
+
+# Load environment variables
+load_dotenv(os.path.join(os.path.dirname(__file__), '.env'))
+
+# Now import database modules
+from database import engine
+
+INDEXES = [
+    ("event timestamp index", "user_analytics", "ix_user_analytics_timestamp", "(timestamp)"),
+    ("event user index", "user_analytics", "ix_user_analytics_user_timestamp", "(user_id, timestamp)"),
+    ("event type index", "user_analytics", "ix_user_analytics_event_timestamp", "(event_type, timestamp)"),
+    ("portfolio created index", "portfolios", "ix_portfolios_created_at", "(created_at)"),
+    ("CV processed index", "uploaded_files", "ix_uploaded_files_processed_at", "(processed_at)"),
+    ("AI job completed index", "ai_jobs", "ix_ai_jobs_completed_at", "(completed_at)"),
+]
+
+def add_analytics_indexes():
+    """Create the analytics indexes without blocking inserts"""
+    try:
+        from sqlalchemy import text
+        from partitioning import is_partitioned
+
+        postgres = engine.dialect.name == "postgresql"
+        # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            print("Adding analytics indexes...")
+
+            for description, table, name, columns in INDEXES:
+                # Partitioned tables do not support CONCURRENTLY; partition_tables.py creates their indexes
+                concurrently = "CONCURRENTLY " if postgres and not is_partitioned(connection, table) else ""
+                try:
+                    connection.execute(text(
+                        f"CREATE INDEX {concurrently}IF NOT EXISTS {name} ON {table} {columns};"
+                    ))
+                    print(f"✅ Added {description}")
+                except Exception as e:
+                    print(f"❌ Error adding {description}: {e}")
+                    return False
+
+            print("\n✅ Analytics indexes added successfully!")
+
+        return True
+
+    except Exception as e:
+        print(f"❌ Error adding indexes: {e}")
+        return False
+
+if __name__ == "__main__":
+    add_analytics_indexes()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Add the composite indexes used by log listings and their keyset cursors to system_logs
+"""
+import os
+import sys
+from dotenv import load_dotenv
+
+# Add current directory to path
+sys.path.append(os.path.dirname(__file__))
+
+# Load environment variables
+load_dotenv(os.path.join(os.path.dirname(__file__), '.env'))
+
+# Now import database modules
+from database import engine
+
+INDEXES = [
+    ("timestamp index", "ix_system_logs_timestamp_id", "(timestamp, id)"),
+    ("level index", "ix_system_logs_level_timestamp", "(level, timestamp, id)"),
+    ("module index", "ix_system_logs_module_timestamp", "(module, timestamp, id)"),
+    ("user index", "ix_system_logs_user_timestamp", "(user_id, timestamp, id)"),
+]
+
+def add_log_indexes():
+    """Create the system_logs indexes without blocking log inserts"""
+    try:
+        from sqlalchemy import text
+        from partitioning import is_partitioned
+
+        # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            print("Adding system_logs indexes...")
+
+            # Partitioned tables do not support CONCURRENTLY; partition_tables.py creates their indexes
+            postgres = engine.dialect.name == "postgresql"
+            concurrently = "CONCURRENTLY " if postgres and not is_partitioned(connection, "system_logs") else ""
+
+            for description, name, columns in INDEXES:
+                try:
+                    connection.execute(text(
+                        f"CREATE INDEX {concurrently}IF NOT EXISTS {name} ON system_logs {columns};"
+                    ))
+                    print(f"✅ Added {description}")
+                except Exception as e:
+                    print(f"❌ Error adding {description}: {e}")
+                    return False
+
+            print("\n✅ System log indexes added successfully!")
+
+        return True
+
+    except Exception as e:
+        print(f"❌ Error adding indexes: {e}")
+        return False
+
+if __name__ == "__main__":
+    add_log_indexes()
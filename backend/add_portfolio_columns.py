@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Add the columns needed to store generated portfolios in the portfolios table
+"""
+import os
+import sys
+from dotenv import load_dotenv
+
+# Add current directory to path
+sys.path.append(os.path.dirname(__file__))
+
+# Load environment variables
+load_dotenv(os.path.join(os.path.dirname(__file__), '.env'))
+
+# Now import database modules
+from database import engine
+
+STATEMENTS = [
+    ("public_id column", "ALTER TABLE portfolios ADD COLUMN IF NOT EXISTS public_id VARCHAR;"),
+    ("cv_data column", "ALTER TABLE portfolios ADD COLUMN IF NOT EXISTS cv_data JSON;"),
+    ("customizations column", "ALTER TABLE portfolios ADD COLUMN IF NOT EXISTS customizations JSON;"),
+    ("sections column", "ALTER TABLE portfolios ADD COLUMN IF NOT EXISTS sections JSON;"),
+    ("version column", "ALTER TABLE portfolios ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 1;"),
+    ("public_id index", "CREATE UNIQUE INDEX IF NOT EXISTS ix_portfolios_public_id ON portfolios (public_id);"),
+    ("user_id index", "CREATE INDEX IF NOT EXISTS ix_portfolios_user_id ON portfolios (user_id);"),
+    ("custom_domain index", "CREATE UNIQUE INDEX IF NOT EXISTS ix_portfolios_custom_domain ON portfolios (custom_domain);"),
+]
+
+def add_portfolio_columns():
+    """Add portfolio content columns and indexes"""
+    try:
+        from sqlalchemy import text
+
+        with engine.connect() as connection:
+            print("Adding portfolio storage columns...")
+
+            for description, statement in STATEMENTS:
+                try:
+                    connection.execute(text(statement))
+                    print(f"✅ Added {description}")
+                except Exception as e:
+                    print(f"❌ Error adding {description}: {e}")
+                    return False
+
+            connection.commit()
+            print("\n✅ Portfolio storage columns added successfully!")
+
+        return True
+
+    except Exception as e:
+        print(f"❌ Error adding columns: {e}")
+        return False
+
+if __name__ == "__main__":
+    add_portfolio_columns()
@@ -1,11 +1,12 @@
 """
 Additional API endpoints for portfolio, ATS, and analytics
 """
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Request
 from sqlalchemy.orm import Session
 from models import User
 from database import SessionLocal
 from auth_utils import get_current_user
+from http_cache import CachedPayload
 from typing import List, Dict, Any
 
 # Change router to include the 'additional' prefix and use tags for organization
@@ -20,62 +21,68 @@ def get_db():
         db.close()
 
 # Portfolio Templates
+PORTFOLIO_TEMPLATES = [
+    {
+        "id": "modern",
+        "name": "Modern Professional",
+        "description": "Clean, modern design perfect for tech professionals",
+        "preview_url": "/templates/modern-preview.jpg",
+        "features": ["Dark mode", "Responsive", "Animations"]
+    },
+    {
+        "id": "creative",
+        "name": "Creative Portfolio",
+        "description": "Bold, creative design for designers and artists",
+        "preview_url": "/templates/creative-preview.jpg",
+        "features": ["Custom animations", "Portfolio gallery", "Contact form"]
+    },
+    {
+        "id": "corporate",
+        "name": "Corporate",
+        "description": "Professional design for business executives",
+        "preview_url": "/templates/corporate-preview.jpg",
+        "features": ["Timeline", "Skills chart", "Testimonials"]
+    }
+]
+
+# ATS Templates
+ATS_TEMPLATES = [
+    {
+        "id": "ats-classic",
+        "name": "ATS Classic",
+        "description": "Traditional format optimized for ATS systems",
+        "compatibility_score": 95,
+        "features": ["Simple formatting", "Keyword optimization", "Standard sections"]
+    },
+    {
+        "id": "ats-modern",
+        "name": "ATS Modern",
+        "description": "Contemporary design that passes ATS screening",
+        "compatibility_score": 90,
+        "features": ["Clean layout", "Modern typography", "ATS-safe styling"]
+    },
+    {
+        "id": "ats-tech",
+        "name": "ATS Tech",
+        "description": "Specialized for technical roles",
+        "compatibility_score": 92,
+        "features": ["Skills section", "Project highlights", "Technical keywords"]
+    }
+]
+
+# Template catalogs are static, so they are serialized and compressed once
+PORTFOLIO_TEMPLATES_PAYLOAD = CachedPayload({"templates": PORTFOLIO_TEMPLATES})
+ATS_TEMPLATES_PAYLOAD = CachedPayload({"templates": ATS_TEMPLATES})
+
 @router.get("/portfolio/templates/")
-async def get_portfolio_templates():
+async def get_portfolio_templates(request: Request):
     """Get available portfolio templates"""
-    templates = [
-        {
-            "id": "modern",
-            "name": "Modern Professional",
-            "description": "Clean, modern design perfect for tech professionals",
-            "preview_url": "/templates/modern-preview.jpg",
-            "features": ["Dark mode", "Responsive", "Animations"]
-        },
-        {
-            "id": "creative",
-            "name": "Creative Portfolio",
-            "description": "Bold, creative design for designers and artists",
-            "preview_url": "/templates/creative-preview.jpg",
-            "features": ["Custom animations", "Portfolio gallery", "Contact form"]
-        },
-        {
-            "id": "corporate",
-            "name": "Corporate",
-            "description": "Professional design for business executives",
-            "preview_url": "/templates/corporate-preview.jpg",
-            "features": ["Timeline", "Skills chart", "Testimonials"]
-        }
-    ]
-    return {"templates": templates}
+    return PORTFOLIO_TEMPLATES_PAYLOAD.response(request)
 
-# ATS Templates
 @router.get("/ats/templates/")
-async def get_ats_templates():
+async def get_ats_templates(request: Request):
     """Get available ATS-friendly resume templates"""
-    templates = [
-        {
-            "id": "ats-classic",
-            "name": "ATS Classic",
-            "description": "Traditional format optimized for ATS systems",
-            "compatibility_score": 95,
-            "features": ["Simple formatting", "Keyword optimization", "Standard sections"]
-        },
-        {
-            "id": "ats-modern",
-            "name": "ATS Modern",
-            "description": "Contemporary design that passes ATS screening",
-            "compatibility_score": 90,
-            "features": ["Clean layout", "Modern typography", "ATS-safe styling"]
-        },
-        {
-            "id": "ats-tech",
-            "name": "ATS Tech",
-            "description": "Specialized for technical roles",
-            "compatibility_score": 92,
-            "features": ["Skills section", "Project highlights", "Technical keywords"]
-        }
-    ]
-    return {"templates": templates}
+    return ATS_TEMPLATES_PAYLOAD.response(request)
 
 # Analytics Dashboard
 @router.get("/analytics/dashboard/")
@@ -1,11 +1,26 @@
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
 from typing import Dict, List, Any, Optional
-from datetime import datetime, timedelta
-import random
+from datetime import datetime
 from pydantic import BaseModel
+from database import SessionLocal
+from models import User
+from auth_utils import get_current_admin_user
+from analytics_engine import compute_realtime_status, compute_recent_activity, get_slice, window_start
+from analytics_export import naive_utc, parquet_available, stream_events_csv, stream_events_parquet, summary_csv
+from analytics_events import event_recorder
 
 router = APIRouter(prefix="/analytics", tags=["Analytics"])
 
+# Database dependency
+def get_db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
 # Data models for analytics
 class MetricsData(BaseModel):
     cvs_processed: int
@@ -29,6 +44,7 @@ class UserEngagement(BaseModel):
     weekly_active_users: int
     monthly_active_users: int
     avg_session_duration: float
+    distinct_users_error: float = 0.0  # relative standard error of the active user estimates
 
 class ActivityItem(BaseModel):
     id: str
@@ -51,233 +67,194 @@ class AnalyticsResponse(BaseModel):
     geographic_distribution: List[GeographicData]
     last_updated: datetime
 
-# Mock data storage - In production, this would come from a database
-def generate_mock_analytics_data(time_range: str = "24h") -> AnalyticsResponse:
-    """Generate realistic mock analytics data based on time range"""
-    
-    # Base multipliers for different time ranges
-    multipliers = {
-        "24h": 1,
-        "7d": 7,
-        "30d": 30,
-        "90d": 90
-    }
-    
-    multiplier = multipliers.get(time_range, 1)
-    base_factor = multiplier * random.uniform(0.8, 1.2)
-    
-    # Generate metrics
-    metrics = MetricsData(
-        cvs_processed=int(245 * base_factor),
-        portfolios_generated=int(189 * base_factor),
-        ats_resumes_created=int(156 * base_factor),
-        total_downloads=int(423 * base_factor),
-        avg_ats_score=round(random.uniform(82.5, 89.5), 1)
-    )
-    
-    # Popular templates with realistic distribution
-    templates = [
-        ("Modern Glass", random.randint(35, 45)),
-        ("Professional Clean", random.randint(25, 35)),
-        ("Creative Portfolio", random.randint(15, 25)),
-        ("Minimal Elegant", random.randint(10, 20))
-    ]
-    
-    total_templates = sum(count for _, count in templates)
-    popular_templates = [
-        TemplateUsage(
-            name=name,
-            count=int(count * base_factor),
-            percentage=round((count / total_templates) * 100, 1)
-        )
-        for name, count in templates
-    ]
-    
-    # Performance metrics
-    performance = PerformanceMetrics(
-        avg_processing_time=round(random.uniform(2.1, 3.8), 1),
-        success_rate=round(random.uniform(96.5, 99.2), 1),
-        user_satisfaction=round(random.uniform(4.6, 4.9), 1)
-    )
-    
-    # User engagement
-    user_engagement = UserEngagement(
-        daily_active_users=int(156 * (base_factor if time_range == "24h" else 1)),
-        weekly_active_users=int(892 * (base_factor if time_range in ["24h", "7d"] else 1)),
-        monthly_active_users=int(2341 * (base_factor if time_range != "90d" else 1)),
-        avg_session_duration=round(random.uniform(8.2, 12.7), 1)
-    )
-    
-    # Recent activity
-    activity_types = [
-        ("cv_upload", "CV uploaded and parsed"),
-        ("portfolio_generated", "Portfolio website generated"),
-        ("ats_resume", "ATS-optimized resume created"),
-        ("template_customized", "Template customized"),
-        ("download", "File downloaded")
-    ]
-    
-    recent_activity = []
-    for i in range(min(15, int(20 * (base_factor / 10)))):
-        activity_type, description = random.choice(activity_types)
-        recent_activity.append(
-            ActivityItem(
-                id=f"activity_{i+1}",
-                type=activity_type,
-                description=description,
-                timestamp=datetime.now() - timedelta(minutes=random.randint(1, 1440)),
-                user=f"user_{random.randint(100, 999)}"
-            )
-        )
-    
-    # Geographic distribution
-    countries = [
-        ("United States", random.randint(25, 35)),
-        ("United Kingdom", random.randint(15, 25)),
-        ("Canada", random.randint(10, 20)),
-        ("Australia", random.randint(8, 15)),
-        ("Germany", random.randint(6, 12)),
-        ("France", random.randint(5, 10)),
-        ("Other", random.randint(15, 25))
-    ]
-    
-    total_geo = sum(count for _, count in countries)
-    geographic_distribution = [
-        GeographicData(
-            country=country,
-            users=int(count * base_factor),
-            percentage=round((count / total_geo) * 100, 1)
-        )
-        for country, count in countries
-    ]
-    
-    return AnalyticsResponse(
-        metrics=metrics,
-        popular_templates=popular_templates,
-        performance=performance,
-        user_engagement=user_engagement,
-        recent_activity=sorted(recent_activity, key=lambda x: x.timestamp, reverse=True),
-        geographic_distribution=geographic_distribution,
-        last_updated=datetime.now()
-    )
-
+# Aggregations run synchronous queries, so the routes are plain functions and run in the threadpool
 @router.get("/dashboard", response_model=AnalyticsResponse)
-async def get_analytics_dashboard(
-    time_range: str = Query(default="24h", regex="^(24h|7d|30d|90d)$", description="Time range for analytics data")
+def get_analytics_dashboard(
+    time_range: str = Query(default="24h", regex="^(24h|7d|30d|90d)$", description="Time range for analytics data"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
 ):
     """
-    Get comprehensive analytics dashboard data
+    Get comprehensive analytics dashboard data (admin only)
     
     - **time_range**: Time range for data aggregation (24h, 7d, 30d, 90d)
     """
     try:
-        analytics_data = generate_mock_analytics_data(time_range)
-        return analytics_data
+        return build_dashboard(db, time_range)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch analytics data: {str(e)}")
 
+def build_dashboard(db: Session, time_range: str) -> AnalyticsResponse:
+    return AnalyticsResponse(
+        metrics=get_slice(db, "metrics", time_range),
+        popular_templates=get_slice(db, "templates", time_range),
+        performance=get_slice(db, "performance", time_range),
+        user_engagement=get_slice(db, "engagement", time_range),
+        recent_activity=compute_recent_activity(db, time_range),
+        geographic_distribution=get_slice(db, "geographic", time_range),
+        last_updated=datetime.utcnow()
+    )
+
 @router.get("/metrics", response_model=MetricsData)
-async def get_key_metrics(
-    time_range: str = Query(default="24h", regex="^(24h|7d|30d|90d)$")
+def get_key_metrics(
+    time_range: str = Query(default="24h", regex="^(24h|7d|30d|90d)$"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
 ):
-    """Get key platform metrics"""
+    """Get key platform metrics (admin only)"""
     try:
-        analytics_data = generate_mock_analytics_data(time_range)
-        return analytics_data.metrics
+        return get_slice(db, "metrics", time_range)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch metrics: {str(e)}")
 
 @router.get("/templates", response_model=List[TemplateUsage])
-async def get_template_usage(
-    time_range: str = Query(default="24h", regex="^(24h|7d|30d|90d)$")
+def get_template_usage(
+    time_range: str = Query(default="24h", regex="^(24h|7d|30d|90d)$"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
 ):
-    """Get template usage statistics"""
+    """Get template usage statistics (admin only)"""
     try:
-        analytics_data = generate_mock_analytics_data(time_range)
-        return analytics_data.popular_templates
+        return get_slice(db, "templates", time_range)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch template usage: {str(e)}")
 
 @router.get("/performance", response_model=PerformanceMetrics)
-async def get_performance_metrics(
-    time_range: str = Query(default="24h", regex="^(24h|7d|30d|90d)$")
+def get_performance_metrics(
+    time_range: str = Query(default="24h", regex="^(24h|7d|30d|90d)$"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
 ):
-    """Get system performance metrics"""
+    """Get system performance metrics (admin only)"""
     try:
-        analytics_data = generate_mock_analytics_data(time_range)
-        return analytics_data.performance
+        return get_slice(db, "performance", time_range)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch performance metrics: {str(e)}")
 
 @router.get("/engagement", response_model=UserEngagement)
-async def get_user_engagement(
-    time_range: str = Query(default="24h", regex="^(24h|7d|30d|90d)$")
+def get_user_engagement(
+    time_range: str = Query(default="24h", regex="^(24h|7d|30d|90d)$"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
 ):
-    """Get user engagement statistics"""
+    """Get user engagement statistics (admin only)"""
     try:
-        analytics_data = generate_mock_analytics_data(time_range)
-        return analytics_data.user_engagement
+        return get_slice(db, "engagement", time_range)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch user engagement: {str(e)}")
 
 @router.get("/activity", response_model=List[ActivityItem])
-async def get_recent_activity(
+def get_recent_activity(
     time_range: str = Query(default="24h", regex="^(24h|7d|30d|90d)$"),
-    limit: int = Query(default=15, ge=1, le=50, description="Number of recent activities to return")
+    limit: int = Query(default=15, ge=1, le=50, description="Number of recent activities to return"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
 ):
-    """Get recent platform activity"""
+    """Get recent platform activity, including usernames (admin only)"""
     try:
-        analytics_data = generate_mock_analytics_data(time_range)
-        return analytics_data.recent_activity[:limit]
+        return compute_recent_activity(db, time_range, limit)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch recent activity: {str(e)}")
 
 @router.get("/geographic", response_model=List[GeographicData])
-async def get_geographic_distribution(
-    time_range: str = Query(default="24h", regex="^(24h|7d|30d|90d)$")
+def get_geographic_distribution(
+    time_range: str = Query(default="24h", regex="^(24h|7d|30d|90d)$"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
 ):
-    """Get geographic distribution of users"""
+    """Get geographic distribution of users (admin only)"""
     try:
-        analytics_data = generate_mock_analytics_data(time_range)
-        return analytics_data.geographic_distribution
+        return get_slice(db, "geographic", time_range)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch geographic data: {str(e)}")
 
 # Real-time analytics endpoint for WebSocket connections (future implementation)
 @router.get("/realtime/status")
-async def get_realtime_status():
-    """Get real-time system status"""
+def get_realtime_status(db: Session = Depends(get_db), current_user: User = Depends(get_current_admin_user)):
+    """Get real-time system status (admin only)"""
+    try:
+        status = compute_realtime_status(db)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to fetch real-time status: {str(e)}")
     return {
         "status": "operational",
-        "active_connections": random.randint(45, 120),
-        "processing_queue": random.randint(0, 5),
-        "last_updated": datetime.now(),
+        # Users seen in the last five minutes; there are no persistent connections yet
+        "active_connections": status["active_users"],
+        "processing_queue": status["processing_queue"],
+        "last_updated": datetime.utcnow(),
         "websocket_endpoint": "/ws/analytics"  # Future WebSocket endpoint
     }
 
-# Export summary for admins and power users
+@router.get("/ingest/stats")
+def get_ingest_stats(current_user: User = Depends(get_current_admin_user)):
+    """Event recorder queue and spill counters (admin only)"""
+    return event_recorder.stats()
+
+# Export summary for admins
 @router.get("/export/summary")
-async def export_analytics_summary(
+def export_analytics_summary(
     time_range: str = Query(default="30d", regex="^(24h|7d|30d|90d)$"),
-    format: str = Query(default="json", regex="^(json|csv)$")
+    format: str = Query(default="json", regex="^(json|csv)$"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
 ):
-    """Export analytics summary for external analysis"""
+    """Export analytics summary for external analysis (admin only)"""
     try:
-        analytics_data = generate_mock_analytics_data(time_range)
+        analytics_data = build_dashboard(db, time_range)
         
         if format == "csv":
-            # In a real implementation, this would return CSV data
-            return {
-                "message": "CSV export functionality to be implemented",
-                "data_points": len(analytics_data.recent_activity),
-                "time_range": time_range
+            data = analytics_data.model_dump()
+            sections = {
+                key: data[key]
+                for key in ("metrics", "popular_templates", "performance", "user_engagement", "geographic_distribution")
             }
+            return Response(
+                content=summary_csv(sections),
+                media_type="text/csv; charset=utf-8",
+                headers={"Content-Disposition": f'attachment; filename="analytics-summary-{time_range}.csv"'}
+            )
         
         return {
             "export_type": "analytics_summary",
             "time_range": time_range,
-            "generated_at": datetime.now(),
+            "generated_at": datetime.utcnow(),
             "data": analytics_data
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to export analytics: {str(e)}")
+
+@router.get("/export/events")
+def export_analytics_events(
+    time_range: str = Query(default="30d", regex="^(24h|7d|30d|90d)$"),
+    start: Optional[datetime] = Query(default=None, description="Export events from this time (UTC) instead of time_range"),
+    end: Optional[datetime] = Query(default=None, description="Export events before this time (UTC)"),
+    event_type: Optional[List[str]] = Query(default=None, description="Only these event types (repeatable)"),
+    user_id: Optional[int] = None,
+    country: Optional[str] = None,
+    format: str = Query(default="csv", regex="^(csv|parquet)$"),
+    current_user: User = Depends(get_current_admin_user)
+):
+    """
+    Stream raw events as CSV or Parquet (admin only)
+    
+    Rows are read through a server-side cursor and sent in chunks, so
+    exports of any size use bounded memory. Parquet requires pyarrow.
+    """
+    since, end = naive_utc(start) or window_start(time_range), naive_utc(end)
+    if end is not None and end <= since:
+        raise HTTPException(status_code=400, detail="end must be after start")
+    filters = (since, end, event_type or [], user_id, country)
+    stamp = since.strftime("%Y%m%d")
+    if format == "parquet":
+        if not parquet_available():
+            raise HTTPException(status_code=501, detail="Parquet export requires pyarrow to be installed")
+        return StreamingResponse(
+            stream_events_parquet(filters),
+            media_type="application/vnd.apache.parquet",
+            headers={"Content-Disposition": f'attachment; filename="analytics-events-{stamp}.parquet"'}
+        )
+    return StreamingResponse(
+        stream_events_csv(filters),
+        media_type="text/csv; charset=utf-8",
+        headers={"Content-Disposition": f'attachment; filename="analytics-events-{stamp}.csv"'}
+    )
@@ -0,0 +1,177 @@
+# Analytics dashboard slices computed from event rollups, user_analytics and ai_jobs
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from models import AIJob, User, UserAnalytics
+from analytics_events import (
+    EVENT_ATS_RESUME,
+    EVENT_CV_PARSED,
+    EVENT_DESCRIPTIONS,
+    EVENT_DOWNLOAD,
+    EVENT_FEEDBACK,
+    EVENT_PORTFOLIO_GENERATED,
+    EVENT_SESSION_END,
+)
+from analytics_rollups import ALL_COUNTRIES, DISTINCT_USERS_ERROR, RollupTotals, range_totals, user_sketches
+
+TIME_RANGES = {
+    "24h": timedelta(hours=24),
+    "7d": timedelta(days=7),
+    "30d": timedelta(days=30),
+    "90d": timedelta(days=90),
+}
+# Ranges over a day start on a whole hour, so they are answered from hour and day buckets only
+RANGE_PRECISION = {"24h": "minute", "7d": "hour", "30d": "hour", "90d": "hour"}
+
+# Countries beyond this many are folded into "Other"
+GEOGRAPHIC_TOP_COUNTRIES = 6
+# Computed slices are reused for this many seconds, so dashboard polling costs one query set per interval
+ANALYTICS_CACHE_TTL = float(os.getenv("ANALYTICS_CACHE_TTL", "30"))
+
+def window_start(time_range: str, now: Optional[datetime] = None) -> datetime:
+    return (now or datetime.utcnow()) - TIME_RANGES[time_range]
+
+def _percentage(part: int, total: int) -> float:
+    return round(part / total * 100, 1) if total else 0.0
+
+def _round(value, digits: int = 1) -> float:
+    return round(float(value), digits) if value is not None else 0.0
+
+def range_event_totals(db: Session, time_range: str) -> RollupTotals:
+    """Event totals for the window, summed from rollup buckets."""
+    return _cached(("totals", time_range), lambda: range_totals(db, window_start(time_range), RANGE_PRECISION[time_range]))
+
+def compute_metrics(db: Session, time_range: str) -> Dict[str, Any]:
+    """Key platform counters for the window."""
+    totals = range_event_totals(db, time_range)
+    return {
+        "cvs_processed": totals.count(EVENT_CV_PARSED),
+        "portfolios_generated": totals.count(EVENT_PORTFOLIO_GENERATED),
+        "ats_resumes_created": totals.count(EVENT_ATS_RESUME),
+        "total_downloads": totals.count(EVENT_DOWNLOAD),
+        "avg_ats_score": _round(totals.average(EVENT_ATS_RESUME)),
+    }
+
+def compute_template_usage(db: Session, time_range: str) -> List[Dict[str, Any]]:
+    """Portfolios generated in the window per template, most used first."""
+    counts = range_event_totals(db, time_range).by_template(EVENT_PORTFOLIO_GENERATED)
+    total = sum(counts.values())
+    return [
+        {"name": template or "default", "count": count, "percentage": _percentage(count, total)}
+        for template, count in sorted(counts.items(), key=lambda item: item[1], reverse=True)
+    ]
+
+def compute_performance(db: Session, time_range: str) -> Dict[str, Any]:
+    """AI job processing time and success rate, plus average feedback rating."""
+    since = window_start(time_range)
+    completed, failed, avg_time = db.query(
+        func.count(AIJob.id).filter(AIJob.status == "completed"),
+        func.count(AIJob.id).filter(AIJob.status == "failed"),
+        func.avg(AIJob.processing_time).filter(AIJob.status == "completed"),
+    ).filter(AIJob.completed_at >= since).one()
+    return {
+        "avg_processing_time": _round(avg_time),
+        "success_rate": _percentage(completed, completed + failed),
+        "user_satisfaction": _round(range_event_totals(db, time_range).average(EVENT_FEEDBACK)),
+    }
+
+def _active_users(db: Session, since: datetime) -> int:
+    return db.query(func.count(func.distinct(UserAnalytics.user_id))).filter(
+        UserAnalytics.timestamp >= since,
+        UserAnalytics.user_id.isnot(None),
+    ).scalar() or 0
+
+def compute_engagement(db: Session, time_range: str) -> Dict[str, Any]:
+    """Daily, weekly and monthly active users up to now, and average session length in the window.
+
+    Active user counts are HyperLogLog estimates merged from per-bucket
+    sketches, within about DISTINCT_USERS_ERROR (1.6%) relative standard error.
+    """
+    now = datetime.utcnow()
+    avg_duration = range_event_totals(db, time_range).average(EVENT_SESSION_END)
+    return {
+        "daily_active_users": user_sketches(db, now - timedelta(days=1))[ALL_COUNTRIES].count(),
+        "weekly_active_users": user_sketches(db, now - timedelta(days=7))[ALL_COUNTRIES].count(),
+        "monthly_active_users": user_sketches(db, now - timedelta(days=30))[ALL_COUNTRIES].count(),
+        # Reported in minutes
+        "avg_session_duration": _round(avg_duration / 60) if avg_duration is not None else 0.0,
+        "distinct_users_error": round(DISTINCT_USERS_ERROR, 4),
+    }
+
+def compute_recent_activity(db: Session, time_range: str, limit: int = 15) -> List[Dict[str, Any]]:
+    """Latest events in the window, newest first."""
+    rows = (
+        db.query(UserAnalytics.id, UserAnalytics.event_type, UserAnalytics.timestamp, User.username)
+        .outerjoin(User, User.id == UserAnalytics.user_id)
+        .filter(UserAnalytics.timestamp >= window_start(time_range))
+        .order_by(UserAnalytics.timestamp.desc(), UserAnalytics.id.desc())
+        .limit(limit)
+        .all()
+    )
+    return [
+        {
+            "id": f"activity_{row.id}",
+            "type": row.event_type,
+            "description": EVENT_DESCRIPTIONS.get(row.event_type, row.event_type.replace("_", " ").capitalize()),
+            "timestamp": row.timestamp,
+            "user": row.username or "anonymous",
+        }
+        for row in rows
+    ]
+
+def compute_geographic(db: Session, time_range: str) -> List[Dict[str, Any]]:
+    """Estimated distinct active users per country in the window; events without a country count as Unknown."""
+    counts = sorted(
+        ((country, sketch.count()) for country, sketch in user_sketches(db, window_start(time_range), by_country=True).items()),
+        key=lambda item: item[1],
+        reverse=True,
+    )
+    # A user seen in several countries is counted in each of them
+    total = sum(users for _, users in counts)
+    top = counts[:GEOGRAPHIC_TOP_COUNTRIES]
+    other = sum(users for _, users in counts[GEOGRAPHIC_TOP_COUNTRIES:])
+    result = [{"country": country, "users": users, "percentage": _percentage(users, total)} for country, users in top]
+    if other:
+        result.append({"country": "Other", "users": other, "percentage": _percentage(other, total)})
+    return result
+
+def compute_realtime_status(db: Session) -> Dict[str, Any]:
+    """Users active in the last five minutes and AI jobs still waiting or running."""
+    return {
+        "active_users": _active_users(db, datetime.utcnow() - timedelta(minutes=5)),
+        "processing_queue": db.query(func.count(AIJob.id)).filter(AIJob.status.in_(("pending", "processing"))).scalar() or 0,
+    }
+
+SLICES: Dict[str, Callable[[Session, str], Any]] = {
+    "metrics": compute_metrics,
+    "templates": compute_template_usage,
+    "performance": compute_performance,
+    "engagement": compute_engagement,
+    "geographic": compute_geographic,
+}
+
+_cache: Dict[Tuple[str, str], Tuple[float, Any]] = {}
+_cache_lock = threading.Lock()
+
+def _cached(key: Tuple[str, str], compute: Callable[[], Any]) -> Any:
+    now = time.monotonic()
+    with _cache_lock:
+        cached = _cache.get(key)
+    if cached is not None and now - cached[0] < ANALYTICS_CACHE_TTL:
+        return cached[1]
+    value = compute()
+    with _cache_lock:
+        _cache[key] = (now, value)
+    return value
+
+def get_slice(db: Session, name: str, time_range: str) -> Any:
+    """Compute one dashboard slice, reusing a result younger than ANALYTICS_CACHE_TTL."""
+    return _cached((name, time_range), lambda: SLICES[name](db, time_range))
+
+def clear_cache() -> None:
+    with _cache_lock:
+        _cache.clear()
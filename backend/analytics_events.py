@@ -0,0 +1,280 @@
+# Product event types and the fire-and-forget recorder that writes them to user_analytics
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from database import engine
+from models import UserAnalytics
+from batch_writer import BatchWriter
+
+logger = logging.getLogger(__name__)
+
+EVENT_CV_UPLOAD = "cv_upload"
+EVENT_CV_PARSED = "cv_parsed"
+EVENT_PORTFOLIO_GENERATED = "portfolio_generated"
+EVENT_PORTFOLIO_VIEW = "portfolio_view"
+EVENT_ATS_RESUME = "ats_resume"
+EVENT_TEMPLATE_CUSTOMIZED = "template_customized"
+EVENT_DOWNLOAD = "download"
+EVENT_FEEDBACK = "feedback"
+EVENT_SESSION_END = "session_end"
+EVENT_USER_REGISTERED = "user_registered"
+EVENT_LOGIN = "login"
+
+EVENT_DESCRIPTIONS = {
+    EVENT_CV_UPLOAD: "CV uploaded",
+    EVENT_CV_PARSED: "CV parsed",
+    EVENT_PORTFOLIO_GENERATED: "Portfolio website generated",
+    EVENT_PORTFOLIO_VIEW: "Portfolio viewed",
+    EVENT_ATS_RESUME: "ATS-optimized resume created",
+    EVENT_TEMPLATE_CUSTOMIZED: "Template customized",
+    EVENT_DOWNLOAD: "File downloaded",
+    EVENT_FEEDBACK: "Feedback submitted",
+    EVENT_USER_REGISTERED: "New user registered",
+    EVENT_LOGIN: "User signed in",
+}
+
+# event_data field holding the numeric value of an event type, rolled up as a sum and count
+VALUE_FIELDS = {
+    EVENT_ATS_RESUME: "ats_score",
+    EVENT_FEEDBACK: "rating",
+    EVENT_SESSION_END: "duration_seconds",
+}
+
+EVENT_QUEUE_SIZE = int(os.getenv("ANALYTICS_EVENT_QUEUE_SIZE", "50000"))
+EVENT_BATCH_SIZE = int(os.getenv("ANALYTICS_EVENT_BATCH_SIZE", "1000"))
+EVENT_FLUSH_INTERVAL = float(os.getenv("ANALYTICS_EVENT_FLUSH_INTERVAL", "2"))
+# Events that cannot be queued or written are appended here as NDJSON and replayed later
+SPILL_DIR = os.getenv("ANALYTICS_SPILL_DIR", "analytics_spill")
+SPILL_FILE_MAX_BYTES = int(os.getenv("ANALYTICS_SPILL_FILE_MAX_BYTES", str(8 * 1024 * 1024)))
+SPILL_MAX_BYTES = int(os.getenv("ANALYTICS_SPILL_MAX_BYTES", str(512 * 1024 * 1024)))
+# A claimed spill file untouched for this long belongs to a worker that died mid-replay
+SPILL_CLAIM_TIMEOUT = 600
+# A spill file whose insert fails this many times right after a successful batch holds a bad row
+MAX_REPLAY_ATTEMPTS = 3
+MAX_USER_AGENT_LENGTH = 512
+
+# Country codes set by common CDNs and proxies in front of the API
+COUNTRY_HEADERS = ("cf-ipcountry", "cloudfront-viewer-country", "x-country-code")
+
+_user_analytics = UserAnalytics.__table__
+
+def _encode_row(row: Dict[str, Any]) -> str:
+    return json.dumps({**row, "timestamp": row["timestamp"].isoformat()}, separators=(",", ":")) + "\n"
+
+def _decode_row(line: str) -> Dict[str, Any]:
+    row = json.loads(line)
+    row["timestamp"] = datetime.fromisoformat(row["timestamp"])
+    return row
+
+class EventRecorder:
+    """Fire-and-forget recording of product events into user_analytics.
+
+    record() only appends to a bounded in-memory queue (a BatchWriter), so it
+    never waits on the database; a background thread writes the queue with
+    multi-row INSERTs. When the queue is full because the database is slow,
+    or a batch write fails, the events are appended to NDJSON spill files
+    instead of being dropped. Spill files are replayed one whole file per
+    transaction after the next successful batch, so a replay either lands
+    completely or is retried later. A file that cannot be read, or fails
+    MAX_REPLAY_ATTEMPTS replays, is renamed to *.failed and skipped. Spill
+    files are claimed with an atomic rename, so several worker processes can
+    share SPILL_DIR.
+    """
+
+    def __init__(
+        self,
+        spill_dir: str = SPILL_DIR,
+        max_queue: int = EVENT_QUEUE_SIZE,
+        batch_size: int = EVENT_BATCH_SIZE,
+        flush_interval: float = EVENT_FLUSH_INTERVAL,
+    ):
+        self.spill_dir = spill_dir
+        self.writer = BatchWriter(
+            "analytics-events",
+            self._write_batch,
+            max_queue=max_queue,
+            batch_size=batch_size,
+            flush_interval=flush_interval,
+        )
+        self._spill_lock = threading.Lock()
+        self._spill_path = None
+        self._spill_size = None
+        self._spilled = 0
+        self._replayed = 0
+        self._spill_dropped = 0
+        self._failed_replays = {}
+
+    def record(
+        self,
+        event_type: str,
+        user_id: Optional[int] = None,
+        data: Optional[Dict[str, Any]] = None,
+        request=None,
+    ) -> None:
+        """Queue one event; never raises and never touches the database."""
+        try:
+            data = dict(data or {})
+            ip_address = user_agent = None
+            if request is not None:
+                ip_address = request.client.host if request.client else None
+                user_agent = (request.headers.get("user-agent") or "")[:MAX_USER_AGENT_LENGTH] or None
+                if "country" not in data:
+                    for header in COUNTRY_HEADERS:
+                        country = request.headers.get(header)
+                        if country and country.upper() not in ("XX", "T1"):
+                            data["country"] = country.upper()
+                            break
+            row = {
+                "user_id": user_id,
+                "event_type": event_type,
+                "event_data": data or None,
+                "timestamp": datetime.utcnow(),
+                "ip_address": ip_address,
+                "user_agent": user_agent,
+            }
+            if not self.writer.submit(row):
+                self._spill([row])
+        except Exception as e:
+            logger.warning(f"Could not record {event_type} event: {str(e)}")
+
+    def _insert(self, rows: List[Dict[str, Any]]):
+        with engine.begin() as connection:
+            connection.execute(_user_analytics.insert(), rows)
+
+    def _write_batch(self, rows: List[Dict[str, Any]]):
+        try:
+            self._insert(rows)
+        except Exception as e:
+            # Returning normally keeps BatchWriter from requeueing: the batch is safe on disk
+            logger.warning(f"Spilling {len(rows)} analytics events to disk: {str(e)}")
+            self._spill(rows)
+            return
+        try:
+            self.replay_spill()
+        except Exception as e:
+            # The batch itself was written; a replay problem must not make BatchWriter retry it
+            logger.error(f"Analytics spill replay failed: {str(e)}")
+
+    def _spill(self, rows: List[Dict[str, Any]]):
+        with self._spill_lock:
+            try:
+                data = "".join(_encode_row(row) for row in rows)
+                if self._spill_size is None:
+                    self._spill_size = self._spill_bytes()
+                if self._spill_size + len(data) > SPILL_MAX_BYTES:
+                    self._spill_dropped += len(rows)
+                    return
+                if self._spill_path is not None and not os.path.exists(self._spill_path):
+                    # Another worker claimed the current file for replay
+                    self._spill_path = None
+                if self._spill_path is None or os.path.getsize(self._spill_path) >= SPILL_FILE_MAX_BYTES:
+                    os.makedirs(self.spill_dir, exist_ok=True)
+                    stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S%f")
+                    self._spill_path = os.path.join(self.spill_dir, f"events-{stamp}-{os.getpid()}.ndjson")
+                with open(self._spill_path, "a", encoding="utf-8") as f:
+                    f.write(data)
+                self._spill_size += len(data)
+                self._spilled += len(rows)
+            except Exception as e:
+                # Never raise: BatchWriter would requeue the batch and retry it
+                logger.error(f"Could not spill {len(rows)} analytics events: {str(e)}")
+                self._spill_dropped += len(rows)
+
+    def _spill_files(self) -> List[str]:
+        # Files that failed to replay are renamed to *.ndjson.failed and are not matched
+        return sorted(glob.glob(os.path.join(glob.escape(self.spill_dir), "events-*.ndjson")))
+
+    def _release_stale_claims(self):
+        for claimed in glob.glob(os.path.join(glob.escape(self.spill_dir), "events-*.ndjson.replaying-*")):
+            try:
+                if time.time() - os.path.getmtime(claimed) > SPILL_CLAIM_TIMEOUT:
+                    os.rename(claimed, claimed.rsplit(".replaying-", 1)[0])
+            except OSError:
+                pass
+
+    def _spill_bytes(self) -> int:
+        total = 0
+        for path in self._spill_files():
+            try:
+                total += os.path.getsize(path)
+            except OSError:
+                pass
+        return total
+
+    def replay_spill(self) -> int:
+        """Insert spilled events back into the database, oldest file first; returns how many were replayed."""
+        replayed = 0
+        with self._spill_lock:
+            # Start a new file for further spills so the current one can be replayed
+            self._spill_path = None
+            paths = self._spill_files()
+        if not paths:
+            return 0
+        for path in paths:
+            claimed = f"{path}.replaying-{os.getpid()}"
+            try:
+                os.rename(path, claimed)
+                # Mark the claim as fresh; see _release_stale_claims
+                os.utime(claimed)
+            except OSError:
+                # Another worker claimed it first
+                continue
+            try:
+                with open(claimed, encoding="utf-8") as f:
+                    rows = [_decode_row(line) for line in f if line.strip()]
+            except Exception as e:
+                # Unreadable or corrupt: set it aside for inspection and carry on with the rest
+                logger.error(f"Could not read spill file {os.path.basename(path)}, moved to .failed: {str(e)}")
+                os.rename(claimed, f"{path}.failed")
+                continue
+            try:
+                if rows:
+                    self._insert(rows)
+            except Exception as e:
+                # Most likely the database is unavailable again; retry after the next successful batch
+                logger.warning(f"Could not replay {os.path.basename(path)}: {str(e)}")
+                os.rename(claimed, path)
+                self._failed_replays[path] = self._failed_replays.get(path, 0) + 1
+                if self._failed_replays[path] >= MAX_REPLAY_ATTEMPTS:
+                    logger.error(f"Spill file {os.path.basename(path)} failed {MAX_REPLAY_ATTEMPTS} replays, moved to .failed")
+                    os.rename(path, f"{path}.failed")
+                    del self._failed_replays[path]
+                continue
+            self._failed_replays.pop(path, None)
+            os.remove(claimed)
+            replayed += len(rows)
+        self._release_stale_claims()
+        with self._spill_lock:
+            self._replayed += replayed
+            self._spill_size = None
+        return replayed
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self.writer.stats()
+        with self._spill_lock:
+            stats.update({
+                "spilled": self._spilled,
+                "replayed": self._replayed,
+                "spill_dropped": self._spill_dropped,
+                "spill_files": len(self._spill_files()),
+                "spill_bytes": self._spill_bytes(),
+                "failed_spill_files": len(glob.glob(os.path.join(glob.escape(self.spill_dir), "events-*.ndjson.failed"))),
+            })
+        return stats
+
+    def start(self):
+        self.writer.start()
+
+    def stop(self):
+        self.writer.stop()
+
+event_recorder = EventRecorder()
+
+def record_event(event_type: str, user_id: Optional[int] = None, data: Optional[Dict[str, Any]] = None, request=None) -> None:
+    """Record a product event without blocking the request; see EventRecorder."""
+    event_recorder.record(event_type, user_id, data, request)
@@ -0,0 +1,177 @@
+# Streaming CSV and Parquet exports of user_analytics events
+import csv
+import io
+import json
+import os
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+from database import SessionLocal
+from models import UserAnalytics
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    # Fallback if pyarrow is not available: only CSV exports are offered
+    pa = None
+    pq = None
+
+EXPORT_BATCH_SIZE = int(os.getenv("ANALYTICS_EXPORT_BATCH_SIZE", "5000"))
+# Rows buffered per Parquet row group; this bounds the memory used by a columnar export
+PARQUET_ROW_GROUP_SIZE = int(os.getenv("ANALYTICS_PARQUET_ROW_GROUP_SIZE", "50000"))
+
+EXPORT_COLUMNS = ("id", "timestamp", "user_id", "event_type", "country", "template", "event_data", "ip_address", "user_agent")
+
+def parquet_available() -> bool:
+    return pq is not None
+
+def naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """Event timestamps are stored as naive UTC; convert aware bounds to match."""
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+def event_query(db, since: datetime, until: Optional[datetime], event_types: Sequence[str], user_id: Optional[int], country: Optional[str]):
+    """Events matching the export filters, oldest first; every filter is applied in SQL."""
+    query = db.query(
+        UserAnalytics.id, UserAnalytics.timestamp, UserAnalytics.user_id, UserAnalytics.event_type,
+        UserAnalytics.event_data, UserAnalytics.ip_address, UserAnalytics.user_agent,
+    ).filter(UserAnalytics.timestamp >= since)
+    if until is not None:
+        query = query.filter(UserAnalytics.timestamp < until)
+    if event_types:
+        query = query.filter(UserAnalytics.event_type.in_(event_types))
+    if user_id is not None:
+        query = query.filter(UserAnalytics.user_id == user_id)
+    if country:
+        query = query.filter(UserAnalytics.event_data["country"].as_string() == country)
+    return query.order_by(UserAnalytics.timestamp)
+
+def _iter_events(filters, batch_size: int) -> Iterator[Any]:
+    # A session of its own, since the response body is produced after the request handler returns
+    db = SessionLocal()
+    try:
+        query = event_query(db, *filters).execution_options(stream_results=True, yield_per=batch_size)
+        yield from query
+    finally:
+        db.close()
+
+def _event_fields(row) -> List[Any]:
+    data = row.event_data if isinstance(row.event_data, dict) else {}
+    return [
+        row.id,
+        row.timestamp,
+        row.user_id,
+        row.event_type,
+        data.get("country"),
+        data.get("template"),
+        json.dumps(row.event_data, separators=(",", ":")) if row.event_data is not None else None,
+        row.ip_address,
+        row.user_agent,
+    ]
+
+def stream_events_csv(filters) -> Iterator[str]:
+    """Yield matching events as CSV, one chunk per EXPORT_BATCH_SIZE rows."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    rows = 0
+    for row in _iter_events(filters, EXPORT_BATCH_SIZE):
+        fields = _event_fields(row)
+        fields[1] = fields[1].isoformat() if fields[1] else None
+        writer.writerow(fields)
+        rows += 1
+        if rows % EXPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+class _ChunkSink:
+    """Write-only file object that hands what was written back to the caller instead of keeping it."""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+def _parquet_schema():
+    return pa.schema([
+        ("id", pa.int64()),
+        ("timestamp", pa.timestamp("us")),
+        ("user_id", pa.int64()),
+        ("event_type", pa.string()),
+        ("country", pa.string()),
+        ("template", pa.string()),
+        ("event_data", pa.string()),
+        ("ip_address", pa.string()),
+        ("user_agent", pa.string()),
+    ])
+
+def stream_events_parquet(filters) -> Iterator[bytes]:
+    """Yield matching events as a Parquet file, one row group per PARQUET_ROW_GROUP_SIZE rows.
+
+    Each row group is encoded and sent as soon as it is full, so memory use
+    is bounded by one row group regardless of the export size.
+    """
+    if pq is None:
+        raise RuntimeError("Parquet export requires pyarrow")
+    schema = _parquet_schema()
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression="snappy")
+    columns: Dict[str, list] = {name: [] for name in EXPORT_COLUMNS}
+
+    def flush_group():
+        writer.write_table(pa.table(columns, schema=schema))
+        for values in columns.values():
+            values.clear()
+        return sink.drain()
+
+    try:
+        for row in _iter_events(filters, EXPORT_BATCH_SIZE):
+            for name, value in zip(EXPORT_COLUMNS, _event_fields(row)):
+                columns[name].append(value)
+            if len(columns["id"]) >= PARQUET_ROW_GROUP_SIZE:
+                yield flush_group()
+        if columns["id"]:
+            yield flush_group()
+    finally:
+        # Writes the footer; an empty export is still a valid Parquet file
+        writer.close()
+    yield sink.drain()
+
+def summary_csv(sections: Dict[str, Any]) -> str:
+    """Flatten dashboard slices into section,name,value,percentage rows."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(("section", "name", "value", "percentage"))
+    for section, data in sections.items():
+        if isinstance(data, dict):
+            for name, value in data.items():
+                writer.writerow((section, name, value, ""))
+        else:
+            for item in data:
+                name = item.get("name") or item.get("country")
+                value = item.get("count", item.get("users"))
+                writer.writerow((section, name, value, item.get("percentage", "")))
+    return buffer.getvalue()
@@ -0,0 +1,380 @@
+# Incremental per-minute, per-hour and per-day rollups of user_analytics
+import logging
+import os
+import threading
+import zlib
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import and_, func, or_, select
+from sqlalchemy.orm import Session
+from database import engine
+from models import AnalyticsRollup, AnalyticsRollupState, AnalyticsUserSketch, UserAnalytics
+from analytics_events import VALUE_FIELDS
+from hyperloglog import HyperLogLog, standard_error
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_INTERVAL = float(os.getenv("ANALYTICS_ROLLUP_INTERVAL", "30"))
+ROLLUP_CHUNK_SIZE = int(os.getenv("ANALYTICS_ROLLUP_CHUNK_SIZE", "50000"))
+BUCKET_SIZES = ("minute", "hour", "day")
+# Minute and hour buckets are only read for the partial head of a range, so they expire;
+# day buckets are kept
+BUCKET_RETENTION = {"minute": timedelta(hours=48), "hour": timedelta(days=93)}
+STATE_NAME = "user_analytics"
+
+# Distinct users are tracked with HyperLogLog sketches per hour and day bucket, one for all
+# users ("") and one per country. At precision 12 a sketch is 4 KB before compression and an
+# estimate over any merged window has a relative standard error of 1.04 / sqrt(4096) = 1.6%,
+# so about 95% of estimates are within 3.2% of the exact count. Windows start on a whole
+# hour, so they can also include up to 59 minutes before the requested start.
+SKETCH_PRECISION = 12
+SKETCH_BUCKET_SIZES = ("hour", "day")
+DISTINCT_USERS_ERROR = standard_error(SKETCH_PRECISION)
+ALL_COUNTRIES = ""
+UNKNOWN_COUNTRY = "Unknown"
+
+_rollups = AnalyticsRollup.__table__
+_sketches = AnalyticsUserSketch.__table__
+_state = AnalyticsRollupState.__table__
+_events = UserAnalytics.__table__
+
+def truncate(timestamp: datetime, size: str) -> datetime:
+    if size == "minute":
+        return timestamp.replace(second=0, microsecond=0)
+    if size == "hour":
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def _ceil(timestamp: datetime, size: str) -> datetime:
+    start = truncate(timestamp, size)
+    if start == timestamp:
+        return start
+    return start + (timedelta(minutes=1) if size == "minute" else timedelta(hours=1) if size == "hour" else timedelta(days=1))
+
+def event_dimensions(event_type: str, event_data: Any) -> Tuple[str, str, Optional[float]]:
+    """The (template, country, value) an event is rolled up under."""
+    if not isinstance(event_data, dict):
+        return "", "", None
+    value = None
+    field = VALUE_FIELDS.get(event_type)
+    if field is not None:
+        try:
+            value = float(event_data[field])
+        except (KeyError, TypeError, ValueError):
+            value = None
+    return str(event_data.get("template") or ""), str(event_data.get("country") or ""), value
+
+def aggregate_events(rows: Iterable, now: Optional[datetime] = None) -> Dict[tuple, List[float]]:
+    """Sum (id, event_type, event_data, timestamp) rows into [count, value_sum, value_count] per bucket key."""
+    now = now or datetime.utcnow()
+    # Buckets that would already be past their retention are not written at all
+    cutoffs = {size: now - retention for size, retention in BUCKET_RETENTION.items()}
+    totals: Dict[tuple, List[float]] = {}
+    for row in rows:
+        template, country, value = event_dimensions(row.event_type, row.event_data)
+        for size in BUCKET_SIZES:
+            if size in cutoffs and row.timestamp < cutoffs[size]:
+                continue
+            key = (size, truncate(row.timestamp, size), row.event_type, template, country)
+            entry = totals.get(key)
+            if entry is None:
+                entry = totals[key] = [0, 0.0, 0]
+            entry[0] += 1
+            if value is not None:
+                entry[1] += value
+                entry[2] += 1
+    return totals
+
+def _insert_construct(dialect: str):
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise RuntimeError(f"Analytics rollups are not supported on {dialect}")
+    return insert
+
+def _rollup_upsert(insert):
+    statement = insert(_rollups)
+    return statement.on_conflict_do_update(
+        index_elements=["bucket_size", "bucket_start", "event_type", "template", "country"],
+        set_={
+            "event_count": _rollups.c.event_count + statement.excluded.event_count,
+            "value_sum": _rollups.c.value_sum + statement.excluded.value_sum,
+            "value_count": _rollups.c.value_count + statement.excluded.value_count,
+        },
+    )
+
+def _sketch_upsert(insert):
+    # The new value is already merged with the stored sketch, see _merge_sketches
+    statement = insert(_sketches)
+    return statement.on_conflict_do_update(
+        index_elements=["bucket_size", "bucket_start", "country"],
+        set_={"sketch": statement.excluded.sketch},
+    )
+
+def encode_sketch(sketch: HyperLogLog) -> bytes:
+    # Sketches of quiet buckets are mostly zero registers and compress to a few bytes
+    return zlib.compress(sketch.to_bytes())
+
+def decode_sketch(data: bytes) -> HyperLogLog:
+    return HyperLogLog.from_bytes(zlib.decompress(data))
+
+def sketch_events(rows: Iterable, now: Optional[datetime] = None) -> Dict[tuple, HyperLogLog]:
+    """Sketch the user ids of (user_id, event_data, timestamp) rows per (bucket_size, bucket_start, country)."""
+    now = now or datetime.utcnow()
+    cutoffs = {size: now - retention for size, retention in BUCKET_RETENTION.items()}
+    sketches: Dict[tuple, HyperLogLog] = {}
+    for row in rows:
+        if row.user_id is None:
+            continue
+        member = str(row.user_id)
+        country = row.event_data.get("country") if isinstance(row.event_data, dict) else None
+        for size in SKETCH_BUCKET_SIZES:
+            if size in cutoffs and row.timestamp < cutoffs[size]:
+                continue
+            start = truncate(row.timestamp, size)
+            for key in ((size, start, ALL_COUNTRIES), (size, start, str(country or UNKNOWN_COUNTRY))):
+                sketch = sketches.get(key)
+                if sketch is None:
+                    sketch = sketches[key] = HyperLogLog(SKETCH_PRECISION)
+                sketch.add(member)
+    return sketches
+
+def _merge_sketches(connection, upsert, sketches: Dict[tuple, HyperLogLog]):
+    for size in SKETCH_BUCKET_SIZES:
+        starts = {start for bucket_size, start, _ in sketches if bucket_size == size}
+        if not starts:
+            continue
+        stored = connection.execute(
+            select(_sketches.c.bucket_start, _sketches.c.country, _sketches.c.sketch)
+            .where(_sketches.c.bucket_size == size, _sketches.c.bucket_start.in_(starts))
+        )
+        for row in stored:
+            sketch = sketches.get((size, row.bucket_start, row.country))
+            if sketch is not None:
+                sketch.merge(decode_sketch(row.sketch))
+    connection.execute(upsert, [
+        {"bucket_size": size, "bucket_start": start, "country": country, "sketch": encode_sketch(sketch)}
+        for (size, start, country), sketch in sketches.items()
+    ])
+
+def _watermark(connection) -> int:
+    watermark = connection.execute(select(_state.c.last_event_id).where(_state.c.name == STATE_NAME)).scalar()
+    if watermark is None:
+        connection.execute(_state.insert().values(name=STATE_NAME, last_event_id=0, updated_at=datetime.utcnow()))
+        watermark = 0
+    return watermark
+
+class _WatermarkMoved(Exception):
+    pass
+
+def fold_events(horizon: int, chunk_size: int = ROLLUP_CHUNK_SIZE) -> int:
+    """Fold events with watermark < id <= horizon into the rollups and return how many were folded.
+
+    Each chunk is folded in one transaction together with a compare-and-set of
+    the watermark, so if two workers fold the same range only the first one
+    commits and no event is counted twice.
+    """
+    folded = 0
+    insert = _insert_construct(engine.dialect.name)
+    upsert, sketch_upsert = _rollup_upsert(insert), _sketch_upsert(insert)
+    while True:
+        try:
+            with engine.begin() as connection:
+                watermark = _watermark(connection)
+                if watermark >= horizon:
+                    return folded
+                rows = connection.execute(
+                    select(_events.c.id, _events.c.user_id, _events.c.event_type, _events.c.event_data, _events.c.timestamp)
+                    .where(_events.c.id > watermark, _events.c.id <= horizon)
+                    .order_by(_events.c.id)
+                    .limit(chunk_size)
+                ).all()
+                last = rows[-1].id if len(rows) == chunk_size else horizon
+                rows = [row for row in rows if row.timestamp is not None]
+                totals = aggregate_events(rows)
+                if totals:
+                    connection.execute(upsert, [
+                        {
+                            "bucket_size": size, "bucket_start": start, "event_type": event_type,
+                            "template": template, "country": country,
+                            "event_count": count, "value_sum": value_sum, "value_count": value_count,
+                        }
+                        for (size, start, event_type, template, country), (count, value_sum, value_count) in totals.items()
+                    ])
+                sketches = sketch_events(rows)
+                if sketches:
+                    _merge_sketches(connection, sketch_upsert, sketches)
+                moved = connection.execute(
+                    _state.update()
+                    .where(_state.c.name == STATE_NAME, _state.c.last_event_id == watermark)
+                    .values(last_event_id=last, updated_at=datetime.utcnow())
+                ).rowcount
+                if moved != 1:
+                    raise _WatermarkMoved()
+        except _WatermarkMoved:
+            # Another worker folded this range first
+            return folded
+        folded += len(rows)
+
+def prune_buckets(now: Optional[datetime] = None) -> int:
+    """Delete minute and hour buckets and sketches past their retention."""
+    now = now or datetime.utcnow()
+    deleted = 0
+    with engine.begin() as connection:
+        for size, retention in BUCKET_RETENTION.items():
+            for table in (_rollups, _sketches):
+                deleted += connection.execute(
+                    table.delete().where(table.c.bucket_size == size, table.c.bucket_start < now - retention)
+                ).rowcount
+    return deleted
+
+class RollupTotals:
+    """Event counts and values over a time range, keyed by (event_type, template, country)."""
+
+    def __init__(self):
+        self._totals: Dict[Tuple[str, str, str], List[float]] = {}
+
+    def add(self, event_type: str, template: str, country: str, count: int, value_sum: float, value_count: int):
+        entry = self._totals.setdefault((event_type, template or "", country or ""), [0, 0.0, 0])
+        entry[0] += count or 0
+        entry[1] += value_sum or 0
+        entry[2] += value_count or 0
+
+    def count(self, event_type: str) -> int:
+        return int(sum(entry[0] for key, entry in self._totals.items() if key[0] == event_type))
+
+    def average(self, event_type: str) -> Optional[float]:
+        value_sum = value_count = 0
+        for key, entry in self._totals.items():
+            if key[0] == event_type:
+                value_sum += entry[1]
+                value_count += entry[2]
+        return value_sum / value_count if value_count else None
+
+    def by_template(self, event_type: str) -> Dict[str, int]:
+        counts: Dict[str, int] = {}
+        for (kind, template, _), entry in self._totals.items():
+            if kind == event_type:
+                counts[template] = counts.get(template, 0) + int(entry[0])
+        return counts
+
+def bucket_cover(since: datetime, precision: str = "minute", model=AnalyticsRollup):
+    """Filter selecting rollup buckets that together cover [since, now) without overlap.
+
+    `since` is first rounded down to the precision; minute buckets cover the
+    head up to the next full hour, hour buckets up to the next full day, and
+    day buckets everything after that, including today.
+    """
+    start = truncate(since, precision)
+    hour_start = _ceil(start, "hour")
+    day_start = _ceil(start, "day")
+    columns = model
+    return or_(
+        and_(columns.bucket_size == "minute", columns.bucket_start >= start, columns.bucket_start < hour_start),
+        and_(columns.bucket_size == "hour", columns.bucket_start >= hour_start, columns.bucket_start < day_start),
+        and_(columns.bucket_size == "day", columns.bucket_start >= day_start),
+    )
+
+def range_totals(db: Session, since: datetime, precision: str = "minute") -> RollupTotals:
+    """Event totals since `since` from the rollups plus the events not folded into them yet."""
+    totals = RollupTotals()
+    rows = (
+        db.query(
+            AnalyticsRollup.event_type, AnalyticsRollup.template, AnalyticsRollup.country,
+            func.sum(AnalyticsRollup.event_count), func.sum(AnalyticsRollup.value_sum), func.sum(AnalyticsRollup.value_count),
+        )
+        .filter(bucket_cover(since, precision))
+        .group_by(AnalyticsRollup.event_type, AnalyticsRollup.template, AnalyticsRollup.country)
+        .all()
+    )
+    for row in rows:
+        totals.add(*row)
+    tail = _unfolded_events(db, truncate(since, precision), UserAnalytics.event_type, UserAnalytics.event_data)
+    for event_type, event_data in tail:
+        template, country, value = event_dimensions(event_type, event_data)
+        totals.add(event_type, template, country, 1, value or 0, 0 if value is None else 1)
+    return totals
+
+def _unfolded_events(db: Session, since: datetime, *columns):
+    watermark = db.query(AnalyticsRollupState.last_event_id).filter(AnalyticsRollupState.name == STATE_NAME).scalar() or 0
+    return db.query(*columns).filter(UserAnalytics.id > watermark, UserAnalytics.timestamp >= since).yield_per(1000)
+
+def user_sketches(db: Session, since: datetime, by_country: bool = False) -> Dict[str, HyperLogLog]:
+    """Merged sketches of the users active since `since` (rounded down to the hour).
+
+    Returns {ALL_COUNTRIES: sketch}, or one sketch per country when
+    by_country is set. Events above the watermark are added directly.
+    """
+    start = truncate(since, "hour")
+    country_filter = AnalyticsUserSketch.country != ALL_COUNTRIES if by_country else AnalyticsUserSketch.country == ALL_COUNTRIES
+    stored: Dict[str, List[HyperLogLog]] = {}
+    rows = db.query(AnalyticsUserSketch.country, AnalyticsUserSketch.sketch).filter(
+        bucket_cover(start, "hour", AnalyticsUserSketch), country_filter
+    )
+    for country, data in rows:
+        stored.setdefault(country, []).append(decode_sketch(data))
+    sketches = {country: HyperLogLog.union(parts, SKETCH_PRECISION) for country, parts in stored.items()}
+    if not by_country:
+        sketches.setdefault(ALL_COUNTRIES, HyperLogLog(SKETCH_PRECISION))
+    tail = _unfolded_events(db, start, UserAnalytics.user_id, UserAnalytics.event_data)
+    for user_id, event_data in tail:
+        if user_id is None:
+            continue
+        country = ALL_COUNTRIES
+        if by_country:
+            country = str((event_data.get("country") if isinstance(event_data, dict) else None) or UNKNOWN_COUNTRY)
+        sketch = sketches.get(country)
+        if sketch is None:
+            sketch = sketches[country] = HyperLogLog(SKETCH_PRECISION)
+        sketch.add(str(user_id))
+    return sketches
+
+class RollupMaintainer:
+    """Folds new events into the rollups every ROLLUP_INTERVAL seconds and prunes expired buckets.
+
+    Each pass folds events up to the highest id seen on the previous pass,
+    not the current one, so inserts that were still uncommitted when their
+    ids were handed out get one interval to commit before the watermark
+    moves past them. Events above the watermark are read directly by
+    range_totals, so dashboards stay exact in the meantime.
+    """
+
+    def __init__(self, interval: float = ROLLUP_INTERVAL):
+        self.interval = interval
+        self._horizon = None
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def run_once(self) -> int:
+        with engine.connect() as connection:
+            current = connection.execute(select(func.max(_events.c.id))).scalar() or 0
+        folded = fold_events(self._horizon) if self._horizon else 0
+        self._horizon = current
+        prune_buckets()
+        return folded
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                folded = self.run_once()
+                if folded:
+                    logger.info(f"Folded {folded} analytics events into rollups")
+            except Exception as e:
+                logger.error(f"Analytics rollup failed: {str(e)}")
+            self._stopping.wait(self.interval)
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="analytics-rollups", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+rollup_maintainer = RollupMaintainer()
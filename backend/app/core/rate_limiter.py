@@ -0,0 +1,454 @@
+# Sliding-window rate limiting for authentication and other expensive endpoints
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlparse
+
+logger = logging.getLogger(__name__)
+
+# Request bodies larger than this are not inspected for an account name
+MAX_INSPECTED_BODY = 64 * 1024
+
+class RateLimit:
+    """At most `limit` requests per `window` seconds for each key of the given scope ("ip" or "account")."""
+    __slots__ = ("scope", "limit", "window")
+
+    def __init__(self, scope: str, limit: int, window: int):
+        if scope not in ("ip", "account"):
+            raise ValueError("scope must be 'ip' or 'account'")
+        self.scope = scope
+        self.limit = limit
+        self.window = window
+
+class RateLimitPolicy:
+    """Limits applied to requests whose method and path match.
+
+    A path ending in "*" matches every path with that prefix. account_fields
+    name the body fields (JSON or form) that identify the account, checked in
+    order; the first present one is used.
+    """
+    __slots__ = ("name", "methods", "path", "limits", "account_fields")
+
+    def __init__(self, name: str, path: str, limits: List[RateLimit], methods=("POST",), account_fields=()):
+        self.name = name
+        self.path = path
+        self.methods = frozenset(methods)
+        self.limits = limits
+        self.account_fields = tuple(account_fields)
+
+    def matches(self, method: str, path: str) -> bool:
+        if method not in self.methods:
+            return False
+        if self.path.endswith("*"):
+            return path.startswith(self.path[:-1])
+        return path == self.path
+
+def sliding_window_count(current: int, previous: int, elapsed: float, window: int) -> float:
+    """Estimate the requests in the last `window` seconds from two fixed-window counters.
+
+    The previous window is weighted by how much of it still overlaps the
+    sliding window, which keeps memory at two counters per key while avoiding
+    the burst a fixed window allows at its boundary.
+    """
+    return previous * (1 - elapsed / window) + current
+
+def retry_after(current: int, previous: int, elapsed: float, window: int, limit: int) -> int:
+    """Seconds until the sliding-window estimate drops back under the limit."""
+    if current >= limit or previous == 0:
+        return max(1, math.ceil(window - elapsed))
+    # previous * (1 - t / window) + current < limit  <=>  t > window * (1 - (limit - current) / previous)
+    target = window * (1 - (limit - current) / previous)
+    return max(1, math.ceil(target - elapsed))
+
+class MemoryBackend:
+    """Per-process counters; suitable for a single worker or as a fallback."""
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        # key -> (window index, current count, previous count, expiry time)
+        self._counters: Dict[str, Tuple[int, int, int, float]] = {}
+        self._lock = threading.Lock()
+
+    async def hit(self, key: str, window: int, now: float) -> Tuple[int, int]:
+        """Count one request and return (current window count, previous window count)."""
+        index = int(now // window)
+        with self._lock:
+            start, current, previous, _ = self._counters.get(key, (index, 0, 0, 0.0))
+            if start != index:
+                previous = current if start == index - 1 else 0
+                current = 0
+            current += 1
+            # Once the next window has fully passed, this key no longer affects any decision
+            self._counters[key] = (index, current, previous, (index + 2) * window)
+            if len(self._counters) > self.max_keys:
+                self._prune(now)
+            return current, previous
+
+    def _prune(self, now: float):
+        self._counters = {key: entry for key, entry in self._counters.items() if entry[3] > now}
+        if len(self._counters) > self.max_keys:
+            # Still full of live keys: drop the oldest quarter rather than grow without bound
+            self._counters = dict(list(self._counters.items())[self.max_keys // 4:])
+
+class RespError(Exception):
+    pass
+
+class RespClient:
+    """Minimal asyncio client for the Redis serialization protocol (RESP2).
+
+    Only what the limiter needs: AUTH/SELECT on connect and pipelined
+    commands with integer, bulk string, simple string and array replies.
+    """
+
+    def __init__(self, url: str, timeout: float = 0.5):
+        parsed = urlparse(url)
+        if parsed.scheme not in ("redis", ""):
+            raise ValueError(f"Unsupported rate limit storage URL: {url}")
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = unquote(parsed.password) if parsed.password else None
+        self.username = unquote(parsed.username) if parsed.username else None
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.timeout = timeout
+        self._reader = None
+        self._writer = None
+        self._ready = False
+        self._loop = None
+        self._lock = None
+
+    @staticmethod
+    def encode(*args) -> bytes:
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode("utf-8")
+            parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        return b"".join(parts)
+
+    async def _read_reply(self):
+        line = await self._reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise ConnectionError("Connection closed by server")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b"+":
+            return payload.decode("utf-8")
+        if kind == b"-":
+            raise RespError(payload.decode("utf-8"))
+        if kind == b":":
+            return int(payload)
+        if kind == b"$":
+            length = int(payload)
+            if length == -1:
+                return None
+            data = await self._reader.readexactly(length + 2)
+            return data[:-2]
+        if kind == b"*":
+            length = int(payload)
+            if length == -1:
+                return None
+            return [await self._read_reply() for _ in range(length)]
+        raise ConnectionError(f"Unexpected reply type {kind!r}")
+
+    async def _connect(self):
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        setup = []
+        if self.password:
+            setup.append(("AUTH", self.username, self.password) if self.username else ("AUTH", self.password))
+        if self.db:
+            setup.append(("SELECT", self.db))
+        if setup:
+            await self._send(setup)
+        self._ready = True
+
+    async def _send(self, commands) -> list:
+        self._writer.write(b"".join(self.encode(*command) for command in commands))
+        await self._writer.drain()
+        replies = []
+        error = None
+        # Read every reply even after an error so the connection stays in sync
+        for _ in commands:
+            try:
+                replies.append(await self._read_reply())
+            except RespError as e:
+                error = error or e
+                replies.append(None)
+        if error:
+            raise error
+        return replies
+
+    def close(self):
+        if self._writer is not None:
+            try:
+                self._writer.close()
+            except RuntimeError:
+                # The event loop that owned the connection is already closed
+                pass
+        self._reader = self._writer = None
+        self._ready = False
+
+    async def pipeline(self, *commands) -> list:
+        """Send several commands in one round trip and return their replies."""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Connections and locks belong to the event loop that created them
+            self.close()
+            self._loop = loop
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            try:
+                if self._writer is None:
+                    await asyncio.wait_for(self._connect(), self.timeout)
+                return await asyncio.wait_for(self._send(commands), self.timeout)
+            except RespError:
+                # A rejected AUTH/SELECT leaves an unusable connection; command errors do not
+                if self._writer is not None and not self._ready:
+                    self.close()
+                raise
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                self.close()
+                raise
+
+class RedisBackend:
+    """Counters shared by all workers, stored in Redis (or anything speaking RESP).
+
+    Each hit is one pipelined round trip: INCR and EXPIRE on the current
+    window's key, GET on the previous one. If the server is unreachable the
+    limiter falls back to per-process counters rather than failing requests.
+    """
+
+    def __init__(self, url: str, prefix: str = "portman:rl:", fallback: Optional[MemoryBackend] = None):
+        self.client = RespClient(url)
+        self.prefix = prefix
+        self.fallback = fallback or MemoryBackend()
+        self._retry_at = 0.0
+
+    async def hit(self, key: str, window: int, now: float) -> Tuple[int, int]:
+        if now < self._retry_at:
+            return await self.fallback.hit(key, window, now)
+        index = int(now // window)
+        current_key = f"{self.prefix}{key}:{index}"
+        try:
+            current, _, previous = await self.client.pipeline(
+                ("INCR", current_key),
+                ("EXPIRE", current_key, window * 2),
+                ("GET", f"{self.prefix}{key}:{index - 1}"),
+            )
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError, RespError) as e:
+            logger.warning(f"Rate limit storage unavailable, using local counters: {str(e)}")
+            self._retry_at = now + 5
+            return await self.fallback.hit(key, window, now)
+        return current, int(previous or 0)
+
+class RateLimiter:
+    """Checks requests against the first matching policy."""
+
+    def __init__(self, backend, policies: List[RateLimitPolicy], trust_forwarded_for: bool = False, trusted_hops: int = 1):
+        self.backend = backend
+        self.policies = policies
+        self.trust_forwarded_for = trust_forwarded_for
+        # Number of trusted proxies in front of the app, each appending to X-Forwarded-For
+        self.trusted_hops = max(1, trusted_hops)
+        self._warned_untrusted_proxy = False
+
+    def policy_for(self, method: str, path: str) -> Optional[RateLimitPolicy]:
+        for policy in self.policies:
+            if policy.matches(method, path):
+                return policy
+        return None
+
+    def client_ip(self, scope) -> str:
+        """The address the outermost trusted proxy saw the request come from.
+
+        X-Forwarded-For entries left of those appended by our own proxies are
+        supplied by the client and can be forged, so the address is taken
+        trusted_hops entries from the right.
+        """
+        forwarded = [
+            address.strip()
+            for name, value in scope.get("headers", [])
+            if name == b"x-forwarded-for"
+            for address in value.decode("latin-1").split(",")
+            if address.strip()
+        ]
+        if forwarded:
+            if self.trust_forwarded_for:
+                return forwarded[-min(self.trusted_hops, len(forwarded))]
+            if not self._warned_untrusted_proxy:
+                self._warned_untrusted_proxy = True
+                logger.warning(
+                    "Requests carry X-Forwarded-For but RATE_LIMIT_TRUST_PROXY is off; "
+                    "every client behind the proxy shares one rate limit"
+                )
+        client = scope.get("client")
+        return client[0] if client else "unknown"
+
+    async def check(self, policy: RateLimitPolicy, ip: str, account: Optional[str], now: float = None) -> Optional[Tuple[RateLimit, int]]:
+        """Count the request against every limit of the policy.
+
+        Returns the first exceeded limit and its Retry-After seconds, or None
+        if the request is allowed.
+        """
+        now = time.time() if now is None else now
+        for rate_limit in policy.limits:
+            identifier = ip if rate_limit.scope == "ip" else account
+            if identifier is None:
+                continue
+            # Hash identifiers so arbitrary user input never ends up verbatim in storage keys
+            digest = hashlib.sha1(identifier.encode("utf-8")).hexdigest()[:20]
+            key = f"{policy.name}:{rate_limit.scope}:{rate_limit.window}:{digest}"
+            current, previous = await self.backend.hit(key, rate_limit.window, now)
+            elapsed = now % rate_limit.window
+            if sliding_window_count(current, previous, elapsed, rate_limit.window) > rate_limit.limit:
+                return rate_limit, retry_after(current, previous, elapsed, rate_limit.window, rate_limit.limit)
+        return None
+
+def extract_account(body: bytes, content_type: str, fields) -> Optional[str]:
+    """Read the account identifier from a JSON or form-encoded request body."""
+    if not body or len(body) > MAX_INSPECTED_BODY:
+        return None
+    values = {}
+    try:
+        if content_type.startswith("application/json"):
+            data = json.loads(body)
+            if isinstance(data, dict):
+                values = data
+        elif content_type.startswith("application/x-www-form-urlencoded"):
+            values = {key: items[0] for key, items in parse_qs(body.decode("utf-8")).items()}
+    except (ValueError, UnicodeDecodeError):
+        return None
+    for field in fields:
+        value = values.get(field)
+        if isinstance(value, str) and value.strip():
+            return value.strip().lower()
+    return None
+
+class RateLimitMiddleware:
+    """ASGI middleware rejecting over-limit requests with 429 before routing.
+
+    Rejection happens before the endpoint runs, so throttled logins never
+    reach password hashing and throttled AI requests never reach the model.
+    For policies keyed by account the body is buffered, inspected and then
+    replayed to the application unchanged.
+    """
+
+    def __init__(self, app, limiter: RateLimiter):
+        self.app = app
+        self.limiter = limiter
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        policy = self.limiter.policy_for(scope["method"], scope["path"])
+        if policy is None:
+            await self.app(scope, receive, send)
+            return
+
+        account = None
+        if policy.account_fields:
+            body, more_body, messages = b"", True, []
+            while more_body and len(body) <= MAX_INSPECTED_BODY:
+                message = await receive()
+                messages.append(message)
+                if message["type"] != "http.request":
+                    break
+                body += message.get("body", b"")
+                more_body = message.get("more_body", False)
+            content_type = ""
+            for name, value in scope.get("headers", []):
+                if name == b"content-type":
+                    content_type = value.decode("latin-1").lower()
+            account = extract_account(body, content_type, policy.account_fields)
+            receive = self._replay(messages, receive)
+
+        exceeded = await self.limiter.check(policy, self.limiter.client_ip(scope), account)
+        if exceeded is None:
+            await self.app(scope, receive, send)
+            return
+        rate_limit, wait = exceeded
+        logger.warning(f"Rate limit {policy.name}/{rate_limit.scope} exceeded on {scope['path']}")
+        payload = json.dumps({"detail": "Too many requests. Please try again later."}).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(payload)).encode("latin-1")),
+                (b"retry-after", str(wait).encode("latin-1")),
+            ],
+        })
+        await send({"type": "http.response.body", "body": payload})
+
+    @staticmethod
+    def _replay(messages, receive):
+        pending = list(messages)
+
+        async def replay_receive():
+            if pending:
+                return pending.pop(0)
+            return await receive()
+
+        return replay_receive
+
+def default_policies(api_prefix: str = "/api/v1") -> List[RateLimitPolicy]:
+    """Per-route limits for credential, account and AI endpoints, plus an opt-in general per-IP limit.
+
+    The general limit covers every API route and is only added when
+    RATE_LIMIT_GENERAL is set: behind a reverse proxy without
+    RATE_LIMIT_TRUST_PROXY, all clients share the proxy's IP and would
+    exhaust it together.
+    """
+    general_limit = int(os.getenv("RATE_LIMIT_REQUESTS", "100"))
+    general_window = int(os.getenv("RATE_LIMIT_WINDOW", "60"))
+    users = f"{api_prefix}/users"
+    policies = [
+        RateLimitPolicy(
+            "login", f"{users}/login/",
+            [RateLimit("ip", 20, 60), RateLimit("account", 5, 60), RateLimit("account", 30, 3600)],
+            account_fields=("email",),
+        ),
+        RateLimitPolicy(
+            # Shares the login key space, so an email gets one budget on both endpoints. /token also
+            # accepts a username, which is keyed separately from the same account's email; the IP
+            # limits still cap both together
+            "login", f"{users}/token",
+            [RateLimit("ip", 20, 60), RateLimit("account", 5, 60), RateLimit("account", 30, 3600)],
+            account_fields=("username",),
+        ),
+        RateLimitPolicy("register", f"{users}/register/", [RateLimit("ip", 10, 3600)]),
+        RateLimitPolicy(
+            "forgot-password", f"{users}/forgot-password/",
+            [RateLimit("ip", 5, 900), RateLimit("account", 3, 3600)],
+            account_fields=("email",),
+        ),
+        RateLimitPolicy("reset-password", f"{users}/reset-password/", [RateLimit("ip", 10, 900)]),
+        RateLimitPolicy("cv-parse", f"{api_prefix}/cv/parse/", [RateLimit("ip", 10, 60)]),
+        RateLimitPolicy("rag", f"{api_prefix}/cv/rag/*", [RateLimit("ip", 10, 60)]),
+        RateLimitPolicy("ats", f"{api_prefix}/ats/*", [RateLimit("ip", 20, 60)]),
+    ]
+    if os.getenv("RATE_LIMIT_GENERAL", "false").lower() in ("1", "true", "yes"):
+        policies.append(RateLimitPolicy(
+            "general", f"{api_prefix}/*", [RateLimit("ip", general_limit, general_window)],
+            methods=("GET", "POST", "PUT", "PATCH", "DELETE"),
+        ))
+    return policies
+
+def build_rate_limiter_from_env() -> Optional[RateLimiter]:
+    """Create the limiter configured by ENABLE_RATE_LIMITING and RATE_LIMIT_BACKEND, or None if disabled."""
+    if os.getenv("ENABLE_RATE_LIMITING", "true").lower() not in ("1", "true", "yes"):
+        return None
+    backend_name = os.getenv("RATE_LIMIT_BACKEND", "memory").lower()
+    if backend_name == "redis":
+        backend = RedisBackend(os.getenv("RATE_LIMIT_REDIS_URL") or os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+    elif backend_name == "memory":
+        backend = MemoryBackend()
+    else:
+        raise ValueError(f"Unknown RATE_LIMIT_BACKEND: {backend_name}")
+    trust_proxy = os.getenv("RATE_LIMIT_TRUST_PROXY", "false").lower() in ("1", "true", "yes")
+    trusted_hops = int(os.getenv("RATE_LIMIT_TRUSTED_HOPS", "1"))
+    return RateLimiter(backend, default_policies(), trust_forwarded_for=trust_proxy, trusted_hops=trusted_hops)
@@ -1,5 +1,5 @@
 # ATS-Friendly Resume Maker
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Request
 from pydantic import BaseModel
 from typing import Dict, Any, List, Optional, Union
 import logging
@@ -17,10 +17,15 @@ except ImportError:
     WD_ALIGN_PARAGRAPH = None
 from io import BytesIO
 import tempfile
+from storage_utils import new_artifact_id, artifact_path, find_artifact
+from http_cache import CachedPayload
+from analytics_events import EVENT_ATS_RESUME, EVENT_DOWNLOAD, record_event
 
 router = APIRouter(prefix="/ats", tags=["ats-resume"])
 logger = logging.getLogger(__name__)
 
+RESUME_DIR = "generated_resumes"
+
 # ATS Resume Models
 class ATSResumeRequest(BaseModel):
     cv_data: Dict[str, Any]
@@ -92,16 +97,19 @@ INDUSTRY_KEYWORDS = {
     "default": ["leadership", "communication", "problem solving", "teamwork", "project management", "analytical"]
 }
 
+# The template catalog never changes at runtime, so it is serialized and compressed once
+TEMPLATES_PAYLOAD = CachedPayload({
+    "status": "success",
+    "templates": ATS_TEMPLATES
+})
+
 @router.get("/templates/")
-async def get_ats_templates():
+async def get_ats_templates(request: Request):
     """Get available ATS resume templates."""
-    return {
-        "status": "success",
-        "templates": ATS_TEMPLATES
-    }
+    return TEMPLATES_PAYLOAD.response(request)
 
 @router.post("/generate/", response_model=ATSResumeResponse)
-async def generate_ats_resume(request: ATSResumeRequest):
+async def generate_ats_resume(request: ATSResumeRequest, http_request: Request):
     """Generate ATS-friendly resume from CV data."""
     try:
         # Validate template
@@ -111,7 +119,7 @@ async def generate_ats_resume(request: ATSResumeRequest):
         template = ATS_TEMPLATES[request.template_type]
         
         # Generate unique resume ID
-        resume_id = f"ats_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        resume_id = new_artifact_id("ats")
         
         # Create DOCX resume
         doc = Document()
@@ -134,9 +142,7 @@ async def generate_ats_resume(request: ATSResumeRequest):
                 add_section_to_doc(doc, section_name, resume_content[section_name], template)
         
         # Save document
-        resume_dir = "generated_resumes"
-        os.makedirs(resume_dir, exist_ok=True)
-        docx_path = f"{resume_dir}/{resume_id}.docx"
+        docx_path = artifact_path(RESUME_DIR, resume_id, "docx", create_dirs=True)
         doc.save(docx_path)
         
         # Generate preview text
@@ -144,6 +150,11 @@ async def generate_ats_resume(request: ATSResumeRequest):
         
         # Calculate ATS score and optimization suggestions
         ats_analysis = analyze_ats_compatibility(resume_content, request)
+        record_event(
+            EVENT_ATS_RESUME,
+            data={"ats_score": ats_analysis["score"], "template": request.template_type, "resume_id": resume_id},
+            request=http_request
+        )
         
         return ATSResumeResponse(
             status="success",
@@ -161,14 +172,15 @@ async def generate_ats_resume(request: ATSResumeRequest):
         raise HTTPException(status_code=500, detail=f"Resume generation failed: {str(e)}")
 
 @router.get("/download/{resume_id}")
-async def download_ats_resume(resume_id: str):
+async def download_ats_resume(resume_id: str, request: Request):
     """Download generated ATS resume."""
     try:
-        docx_path = f"generated_resumes/{resume_id}.docx"
+        docx_path = find_artifact(RESUME_DIR, resume_id, "docx")
         
-        if not os.path.exists(docx_path):
+        if not docx_path:
             raise HTTPException(status_code=404, detail="Resume not found")
         
+        record_event(EVENT_DOWNLOAD, data={"artifact": "ats_resume", "resume_id": resume_id}, request=request)
         from fastapi.responses import FileResponse
         return FileResponse(
             path=docx_path,
@@ -3,21 +3,203 @@ from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
 from passlib.context import CryptContext
+import asyncio
 import os
-from typing import Optional
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+from models import User
+from database import SessionLocal
 
 SECRET_KEY = os.getenv("SECRET_KEY", "supersecret")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Raising the cost factor makes existing hashes "deprecated"; they are upgraded on next login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/users/token")
 
+# Verified users are cached per token for at most this many seconds. The cache is
+# per process: invalidate_cached_user only clears the worker that handled the change,
+# so other workers may keep serving a deactivated user's old principal for up to this
+# long. Admin rights are re-checked against the database on every admin request.
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", "60"))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+
+class PrincipalCache:
+    """Bounded LRU of users already looked up for a verified token.
+
+    Entries expire after the TTL or when the token does, whichever comes
+    first, and can be dropped for a user explicitly when their account
+    changes. Cached User objects are detached from any session and shared
+    between requests, so callers must not modify them.
+    """
+
+    def __init__(self, ttl: int = USER_CACHE_TTL, max_entries: int = USER_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # token -> (user, expires_at)
+        self._tokens_by_username = {}
+        self._lock = threading.Lock()
+
+    def get(self, token: str):
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            user, expires_at = entry
+            if expires_at <= time.monotonic():
+                self._discard(token)
+                return None
+            self._entries.move_to_end(token)
+            return user
+
+    def put(self, token: str, user, token_expires_at: Optional[float] = None):
+        ttl = self.ttl
+        if token_expires_at is not None:
+            ttl = min(ttl, token_expires_at - time.time())
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._discard(token)
+            self._entries[token] = (user, time.monotonic() + ttl)
+            self._tokens_by_username.setdefault(user.username, set()).add(token)
+            while len(self._entries) > self.max_entries:
+                self._discard(next(iter(self._entries)))
+
+    def invalidate_user(self, username: str):
+        with self._lock:
+            for token in list(self._tokens_by_username.get(username, ())):
+                self._discard(token)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tokens_by_username.clear()
+
+    def _discard(self, token: str):
+        entry = self._entries.pop(token, None)
+        if entry is not None:
+            tokens = self._tokens_by_username.get(entry[0].username)
+            if tokens is not None:
+                tokens.discard(token)
+                if not tokens:
+                    del self._tokens_by_username[entry[0].username]
+
+principal_cache = PrincipalCache()
+
+def invalidate_cached_user(username: str):
+    """Drop this process's cached principals for a user, e.g. after deactivation, promotion or a password reset."""
+    principal_cache.invalidate_user(username)
+
+# bcrypt takes ~200 ms of CPU per call, so it runs in a small dedicated pool off the event loop
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+PASSWORD_HASH_QUEUE_LIMIT = int(os.getenv("PASSWORD_HASH_QUEUE_LIMIT", "256"))
+
+class PasswordHashPool:
+    """Size-limited worker pool for password hashing with queue metrics.
+
+    Once PASSWORD_HASH_QUEUE_LIMIT jobs are waiting or running, new jobs
+    are rejected with 503 instead of queueing without bound.
+    """
+
+    def __init__(self, workers: int = PASSWORD_HASH_WORKERS, queue_limit: int = PASSWORD_HASH_QUEUE_LIMIT):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._running = 0
+        self._max_pending = 0
+        self._submitted = 0
+        self._completed = 0
+        self._rejected = 0
+        self._total_wait = 0.0
+        self._total_run = 0.0
+
+    def _track(self, fn, args, submitted_at):
+        started_at = time.perf_counter()
+        with self._lock:
+            self._running += 1
+            self._total_wait += started_at - submitted_at
+        try:
+            return fn(*args)
+        finally:
+            with self._lock:
+                self._running -= 1
+                self._total_run += time.perf_counter() - started_at
+
+    def submit(self, fn, *args):
+        """Schedule fn(*args) on the pool and return a concurrent Future."""
+        with self._lock:
+            if self._pending >= self.queue_limit:
+                self._rejected += 1
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Authentication service is busy, please retry shortly",
+                    headers={"Retry-After": "1"},
+                )
+            self._pending += 1
+            self._submitted += 1
+            self._max_pending = max(self._max_pending, self._pending)
+        future = self._executor.submit(self._track, fn, args, time.perf_counter())
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future):
+        with self._lock:
+            self._pending -= 1
+            self._completed += 1
+
+    async def run(self, fn, *args):
+        """Run fn(*args) on the pool without blocking the event loop."""
+        return await asyncio.wrap_future(self.submit(fn, *args))
+
+    def map(self, fn, items):
+        """Run fn over items on the pool from synchronous code, returning results in order."""
+        futures = [self.submit(fn, item) for item in items]
+        return [future.result() for future in futures]
+
+    def stats(self) -> dict:
+        with self._lock:
+            finished = max(self._completed, 1)
+            return {
+                "workers": self.workers,
+                "queue_limit": self.queue_limit,
+                "running": self._running,
+                "queued": self._pending - self._running,
+                "max_pending": self._max_pending,
+                "submitted": self._submitted,
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "avg_wait_ms": round(self._total_wait / finished * 1000, 2),
+                "avg_run_ms": round(self._total_run / finished * 1000, 2),
+            }
+
+password_pool = PasswordHashPool()
+
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
 def get_password_hash(password):
     return pwd_context.hash(password)
 
+async def verify_password_async(plain_password, hashed_password) -> bool:
+    return await password_pool.run(verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password) -> str:
+    return await password_pool.run(get_password_hash, password)
+
+async def verify_and_update_password(plain_password, hashed_password) -> Tuple[bool, Optional[str]]:
+    """Verify a password off the event loop.
+
+    Returns (valid, new_hash). new_hash is set when the stored hash uses an
+    outdated cost factor and should be replaced with it.
+    """
+    return await password_pool.run(pwd_context.verify_and_update, plain_password, hashed_password)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     expire = datetime.utcnow() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
@@ -25,7 +207,9 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 def get_current_user(token: str = Depends(oauth2_scheme)):
-    from main import User, SessionLocal  # local import to avoid circular import
+    cached_user = principal_cache.get(token)
+    if cached_user is not None:
+        return cached_user
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -36,6 +220,7 @@ def get_current_user(token: str = Depends(oauth2_scheme)):
         username = payload.get("sub")
         if not username:
             raise credentials_exception
+        token_expires_at = payload.get("exp")
     except JWTError:
         raise credentials_exception
     
@@ -45,6 +230,7 @@ def get_current_user(token: str = Depends(oauth2_scheme)):
         user = db.query(User).filter(User.username == username).first()
         if user is None:
             raise credentials_exception
+        principal_cache.put(token, user, token_expires_at)
         return user
     finally:
         db.close()
@@ -55,6 +241,13 @@ def get_current_active_user(current_user = Depends(get_current_user)):
     return current_user
 
 def get_current_admin_user(current_user = Depends(get_current_user)):
-    if not current_user.is_admin:
+    # The cached principal may predate a demotion handled by another worker, so check the database
+    db = SessionLocal()
+    try:
+        flags = db.query(User.is_admin, User.is_active).filter(User.id == current_user.id).first()
+    finally:
+        db.close()
+    if flags is None or not flags.is_admin or not flags.is_active:
+        invalidate_cached_user(current_user.username)
         raise HTTPException(status_code=403, detail="Not enough permissions")
     return current_user
@@ -0,0 +1,153 @@
+# Bounded in-process queue drained in batches by a background thread
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Iterable, List
+
+logger = logging.getLogger(__name__)
+
+class BatchWriter:
+    """Buffers items in memory and hands them to write_batch in batches.
+
+    A batch is written when batch_size items are waiting or flush_interval
+    seconds have passed, whichever comes first. The queue holds at most
+    max_queue items: submit returns False once it is full so callers can
+    push back (e.g. with 503) instead of letting memory grow. A failed write
+    is retried on the next flush as long as there is room; otherwise its
+    items are dropped and counted. After max_retries consecutive failures
+    the batch is halved on each further failure, so an item the writer
+    always rejects ends up alone and is dropped instead of blocking the
+    items queued behind it.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        write_batch: Callable[[List[Any]], None],
+        max_queue: int = 10000,
+        batch_size: int = 500,
+        flush_interval: float = 1.0,
+        max_retries: int = 3,
+    ):
+        self.name = name
+        self.write_batch = write_batch
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self._queue = deque()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._accepted = 0
+        self._written = 0
+        self._dropped = 0
+        self._rejected = 0
+        self._write_errors = 0
+        self._batches = 0
+        self._last_flush_ms = 0.0
+        self._failures = 0
+        # Set while narrowing down a batch that keeps failing
+        self._retry_size = None
+
+    def submit(self, item: Any) -> bool:
+        """Queue one item; returns False (and counts a rejection) if the queue is full."""
+        return self.submit_many([item]) == 1
+
+    def submit_many(self, items: Iterable[Any]) -> int:
+        """Queue all items or none of them; returns how many were queued."""
+        items = list(items)
+        with self._lock:
+            if len(self._queue) + len(items) > self.max_queue:
+                self._rejected += len(items)
+                return 0
+            self._queue.extend(items)
+            self._accepted += len(items)
+            if len(self._queue) >= self.batch_size:
+                self._wakeup.set()
+        return len(items)
+
+    def flush(self) -> int:
+        """Write everything queued so far and return the number of items written."""
+        written = 0
+        with self._flush_lock:
+            while True:
+                with self._lock:
+                    count = min(self._retry_size or self.batch_size, len(self._queue))
+                    batch = [self._queue.popleft() for _ in range(count)]
+                    if not batch:
+                        # Whatever kept failing is gone
+                        self._failures = 0
+                        self._retry_size = None
+                if not batch:
+                    return written
+                started = time.perf_counter()
+                try:
+                    self.write_batch(batch)
+                except Exception as e:
+                    logger.error(f"{self.name}: batch write failed: {str(e)}")
+                    with self._lock:
+                        self._write_errors += 1
+                        self._failures += 1
+                        if self._failures > self.max_retries:
+                            if len(batch) == 1:
+                                logger.error(f"{self.name}: dropping an item that failed {self._failures} writes")
+                                self._dropped += 1
+                                self._failures = 0
+                                self._retry_size = None
+                                batch = []
+                            else:
+                                self._retry_size = len(batch) // 2
+                        room = self.max_queue - len(self._queue)
+                        # Keep as much of the failed batch as fits, oldest first
+                        self._queue.extendleft(reversed(batch[:room]))
+                        self._dropped += max(0, len(batch) - room)
+                    return written
+                with self._lock:
+                    if self._retry_size is None:
+                        self._failures = 0
+                    self._written += len(batch)
+                    self._batches += 1
+                    self._last_flush_ms = (time.perf_counter() - started) * 1000
+                written += len(batch)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "queued": len(self._queue),
+                "max_queue": self.max_queue,
+                "batch_size": self.batch_size,
+                "flush_interval": self.flush_interval,
+                "accepted": self._accepted,
+                "written": self._written,
+                "rejected": self._rejected,
+                "dropped": self._dropped,
+                "write_errors": self._write_errors,
+                "batches": self._batches,
+                "last_flush_ms": round(self._last_flush_ms, 2),
+                "running": self._thread is not None and self._thread.is_alive(),
+            }
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name=f"{self.name}-writer", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop the background flusher and write whatever is still queued."""
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_interval + 5)
+            self._thread = None
+        self.flush()
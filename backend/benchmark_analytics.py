@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Benchmark the analytics aggregations against a synthetic event table
+
+Loads --events synthetic user_analytics rows (10 million by default), plus
+matching AI jobs, into the database given by BENCHMARK_DATABASE_URL (never
+DATABASE_URL), folds them into the rollups, then times every dashboard
+slice for every time range. Use a scratch database: the tables are created
+if missing and the generated rows are not removed.
+
+    BENCHMARK_DATABASE_URL=postgresql://localhost/portman_bench python benchmark_analytics.py
+    python benchmark_analytics.py --events 1000000 --skip-load
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+
+# Add current directory to path
+sys.path.append(os.path.dirname(__file__))
+
+# Load environment variables
+load_dotenv(os.path.join(os.path.dirname(__file__), '.env'))
+
+# The analytics modules bind to DATABASE_URL on import, so point it at the scratch database first
+os.environ["DATABASE_URL"] = os.getenv("BENCHMARK_DATABASE_URL", "sqlite:///./analytics_benchmark.db")
+
+from sqlalchemy import func
+from database import engine, SessionLocal
+from models import Base, AIJob, User, UserAnalytics
+from analytics_events import (
+    EVENT_ATS_RESUME,
+    EVENT_CV_PARSED,
+    EVENT_CV_UPLOAD,
+    EVENT_DOWNLOAD,
+    EVENT_FEEDBACK,
+    EVENT_PORTFOLIO_GENERATED,
+    EVENT_PORTFOLIO_VIEW,
+    EVENT_SESSION_END,
+    EVENT_TEMPLATE_CUSTOMIZED,
+)
+from analytics_engine import SLICES, TIME_RANGES, clear_cache, compute_recent_activity
+from analytics_rollups import fold_events
+
+# Relative frequency of each event type in the synthetic load
+EVENT_WEIGHTS = {
+    EVENT_PORTFOLIO_VIEW: 60,
+    EVENT_SESSION_END: 15,
+    EVENT_DOWNLOAD: 8,
+    EVENT_CV_UPLOAD: 5,
+    EVENT_CV_PARSED: 4,
+    EVENT_TEMPLATE_CUSTOMIZED: 5,
+    EVENT_PORTFOLIO_GENERATED: 3,
+    EVENT_ATS_RESUME: 3,
+    EVENT_FEEDBACK: 1,
+}
+COUNTRIES = ["United States", "United Kingdom", "Canada", "Australia", "Germany", "France", "India", "Brazil", "Japan"]
+TEMPLATES = ["modern", "professional", "creative", "minimal"]
+HISTORY_DAYS = 120
+BATCH_SIZE = 20000
+
+def event_data(event_type: str, rng: random.Random) -> dict:
+    data = {"country": rng.choice(COUNTRIES)}
+    if event_type == EVENT_ATS_RESUME:
+        data["ats_score"] = rng.randint(60, 99)
+    elif event_type == EVENT_FEEDBACK:
+        data["rating"] = rng.randint(1, 5)
+    elif event_type == EVENT_SESSION_END:
+        data["duration_seconds"] = rng.randint(30, 3600)
+    elif event_type in (EVENT_PORTFOLIO_GENERATED, EVENT_TEMPLATE_CUSTOMIZED):
+        data["template"] = rng.choice(TEMPLATES)
+    return data
+
+def ensure_users(session, count: int) -> list:
+    existing = session.query(func.count(User.id)).scalar()
+    if existing < count:
+        # A precomputed bcrypt hash; benchmark users never log in
+        hashed = "$2b$12$" + "x" * 53
+        session.execute(User.__table__.insert(), [
+            {"username": f"bench_{i}", "email": f"bench_{i}@example.com", "hashed_password": hashed,
+             "is_active": True, "created_at": datetime.utcnow()}
+            for i in range(existing, count)
+        ])
+        session.commit()
+    return [row[0] for row in session.query(User.id).limit(count)]
+
+def insert_in_batches(connection, table, rows, total: int, label: str):
+    batch = []
+    started = time.perf_counter()
+    inserted = 0
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH_SIZE:
+            connection.execute(table.insert(), batch)
+            inserted += len(batch)
+            batch = []
+            if inserted % (BATCH_SIZE * 25) == 0:
+                rate = inserted / (time.perf_counter() - started)
+                print(f"   {label}: {inserted:,}/{total:,} ({rate:,.0f} rows/s)")
+    if batch:
+        connection.execute(table.insert(), batch)
+        inserted += len(batch)
+    print(f"✅ Inserted {inserted:,} {label} in {time.perf_counter() - started:.1f}s")
+
+def load(session, events: int, users: int, seed: int):
+    rng = random.Random(seed)
+    user_ids = ensure_users(session, users)
+    now = datetime.utcnow()
+    span = HISTORY_DAYS * 86400
+    types = list(EVENT_WEIGHTS)
+    weights = list(EVENT_WEIGHTS.values())
+
+    def events_rows():
+        for _ in range(events):
+            event_type = rng.choices(types, weights)[0]
+            yield {
+                "user_id": rng.choice(user_ids),
+                "event_type": event_type,
+                "event_data": event_data(event_type, rng),
+                "timestamp": now - timedelta(seconds=rng.randrange(span)),
+            }
+
+    # AI jobs are scaled to roughly one per CV upload or generated portfolio
+    facts = max(1, events // 12)
+
+    def job_rows():
+        for _ in range(facts):
+            completed_at = now - timedelta(seconds=rng.randrange(span))
+            yield {
+                "user_id": rng.choice(user_ids),
+                "job_type": rng.choice(["cv_analysis", "portfolio_generation"]),
+                "status": "completed" if rng.random() < 0.97 else "failed",
+                "created_at": completed_at,
+                "completed_at": completed_at,
+                "processing_time": rng.uniform(0.5, 6.0),
+            }
+
+    with engine.begin() as connection:
+        insert_in_batches(connection, UserAnalytics.__table__, events_rows(), events, "events")
+        insert_in_batches(connection, AIJob.__table__, job_rows(), facts, "AI jobs")
+
+def fold(session):
+    horizon = session.query(func.max(UserAnalytics.id)).scalar() or 0
+    started = time.perf_counter()
+    folded = fold_events(horizon)
+    print(f"✅ Folded {folded:,} events into rollups in {time.perf_counter() - started:.1f}s")
+
+def timed(function, *args, repeat: int):
+    best = None
+    for _ in range(repeat):
+        clear_cache()
+        started = time.perf_counter()
+        function(*args)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def run(session, repeat: int):
+    total = session.query(func.count(UserAnalytics.id)).scalar()
+    print(f"\nTiming slices over {total:,} events (best of {repeat})\n")
+    names = list(SLICES) + ["activity"]
+    print(f"{'slice':<14}" + "".join(f"{time_range:>12}" for time_range in TIME_RANGES))
+    for name in names:
+        function = SLICES.get(name, compute_recent_activity)
+        cells = []
+        for time_range in TIME_RANGES:
+            elapsed = timed(function, session, time_range, repeat=repeat)
+            cells.append(f"{elapsed * 1000:>10.1f}ms")
+        print(f"{name:<14}" + "".join(cells))
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark analytics aggregations")
+    parser.add_argument("--events", type=int, default=10_000_000)
+    parser.add_argument("--users", type=int, default=50_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=46)
+    parser.add_argument("--skip-load", action="store_true", help="Only time the queries against existing rows")
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    try:
+        if not args.skip_load:
+            load(session, args.events, args.users, args.seed)
+        fold(session)
+        run(session, args.repeat)
+    finally:
+        session.close()
+
+if __name__ == "__main__":
+    main()
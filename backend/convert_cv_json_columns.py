@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Convert the users CV columns to JSONB and decode rows that were stored as JSON-encoded strings
+"""
+import os
+import sys
+from dotenv import load_dotenv
+
+# Add current directory to path
+sys.path.append(os.path.dirname(__file__))
+
+# Load environment variables
+load_dotenv(os.path.join(os.path.dirname(__file__), '.env'))
+
+# Now import database modules
+from database import engine
+
+CV_JSON_COLUMNS = [
+    "experience_json",
+    "education_json",
+    "skills_json",
+    "languages_json",
+    "certifications_json",
+    "links_json",
+]
+
+# Older rows hold a JSON string whose content is the real document ("\"[...]\""),
+# so string values are unwrapped with #>> '{}' and parsed again
+CONVERT_STATEMENT = """
+ALTER TABLE users ALTER COLUMN {column} TYPE JSONB USING (
+    CASE
+        WHEN {column} IS NULL THEN NULL
+        WHEN json_typeof({column}::json) = 'string' THEN ({column}::json #>> '{{}}')::jsonb
+        ELSE {column}::jsonb
+    END
+);
+"""
+
+def convert_cv_json_columns():
+    """Store CV fields as native JSONB documents"""
+    try:
+        from sqlalchemy import text
+
+        if engine.dialect.name != "postgresql":
+            print("❌ This migration only applies to PostgreSQL databases")
+            return False
+
+        with engine.connect() as connection:
+            print("Converting CV columns to JSONB...")
+
+            for column in CV_JSON_COLUMNS:
+                try:
+                    connection.execute(text(CONVERT_STATEMENT.format(column=column)))
+                    print(f"✅ Converted {column}")
+                except Exception as e:
+                    print(f"❌ Error converting {column}: {e}")
+                    return False
+
+            connection.commit()
+            print("\n✅ CV columns converted successfully!")
+
+        return True
+
+    except Exception as e:
+        print(f"❌ Error converting columns: {e}")
+        return False
+
+if __name__ == "__main__":
+    convert_cv_json_columns()
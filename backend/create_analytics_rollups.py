@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Create the analytics rollup and user sketch tables and fold all existing events into them
+
+With --rebuild, existing rollups and sketches are dropped and every event
+is folded again (needed once to build sketches for events folded before
+sketches existed). With --backfill-events, portfolios and processed CV
+uploads that have no event yet are first recorded as portfolio_generated
+and cv_parsed events, so the dashboard counts include them. The backfill
+checks each portfolio and file, so it can run after the app has started
+recording events and can safely be run again.
+"""
+import os
+import sys
+from dotenv import load_dotenv
+
+# Add current directory to path
+sys.path.append(os.path.dirname(__file__))
+
+# Load environment variables
+load_dotenv(os.path.join(os.path.dirname(__file__), '.env'))
+
+# Now import database modules
+from database import engine
+from models import AnalyticsRollup, AnalyticsRollupState, AnalyticsUserSketch
+
+# Each source row is backfilled unless an event for it already exists, so events the
+# app recorded itself (which carry the same portfolio_id) are not counted twice
+BACKFILL_STATEMENTS = [
+    (
+        "portfolio_generated events",
+        "INSERT INTO user_analytics (user_id, event_type, event_data, timestamp) "
+        "SELECT p.user_id, 'portfolio_generated', {object}('template', p.template_name, 'portfolio_id', p.public_id), p.created_at "
+        "FROM portfolios p WHERE p.created_at IS NOT NULL AND NOT EXISTS "
+        "(SELECT 1 FROM user_analytics e WHERE e.event_type = 'portfolio_generated' "
+        "AND {field}(e.event_data, '{path}portfolio_id') = p.public_id);",
+    ),
+    (
+        "cv_parsed events",
+        "INSERT INTO user_analytics (user_id, event_type, event_data, timestamp) "
+        "SELECT f.user_id, 'cv_parsed', {object}('file_id', f.id), f.processed_at "
+        "FROM uploaded_files f WHERE f.processed AND f.processed_at IS NOT NULL AND NOT EXISTS "
+        "(SELECT 1 FROM user_analytics e WHERE e.event_type = 'cv_parsed' "
+        "AND {field}(e.event_data, '{path}file_id') = {file_id});",
+    ),
+]
+
+def create_analytics_rollups(backfill_events: bool = False, rebuild: bool = False):
+    """Create the rollup tables, optionally backfill events, then fold every event into the rollups"""
+    try:
+        from sqlalchemy import text
+        from analytics_rollups import fold_events, prune_buckets
+
+        AnalyticsRollup.__table__.create(bind=engine, checkfirst=True)
+        AnalyticsUserSketch.__table__.create(bind=engine, checkfirst=True)
+        AnalyticsRollupState.__table__.create(bind=engine, checkfirst=True)
+        print("✅ Rollup tables ready")
+
+        if rebuild:
+            # One transaction, so dashboards never see rollups without their watermark reset
+            with engine.begin() as connection:
+                connection.execute(AnalyticsRollup.__table__.delete())
+                connection.execute(AnalyticsUserSketch.__table__.delete())
+                connection.execute(AnalyticsRollupState.__table__.delete())
+            print("✅ Cleared existing rollups and sketches")
+
+        if backfill_events:
+            if engine.dialect.name == "postgresql":
+                dialect = {"object": "json_build_object", "field": "json_extract_path_text", "path": "", "file_id": "f.id::text"}
+            else:
+                dialect = {"object": "json_object", "field": "json_extract", "path": "$.", "file_id": "f.id"}
+            with engine.begin() as connection:
+                for description, statement in BACKFILL_STATEMENTS:
+                    result = connection.execute(text(statement.format(**dialect)))
+                    print(f"✅ Backfilled {result.rowcount} {description}")
+
+        with engine.connect() as connection:
+            horizon = connection.execute(text("SELECT MAX(id) FROM user_analytics")).scalar() or 0
+        print(f"Folding events up to id {horizon}...")
+        folded = fold_events(horizon)
+        print(f"✅ Folded {folded} events")
+        print(f"✅ Pruned {prune_buckets()} expired buckets")
+
+        print("\n✅ Analytics rollups created successfully!")
+        return True
+
+    except Exception as e:
+        print(f"❌ Error creating analytics rollups: {e}")
+        return False
+
+if __name__ == "__main__":
+    create_analytics_rollups(backfill_events="--backfill-events" in sys.argv, rebuild="--rebuild" in sys.argv)
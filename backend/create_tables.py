@@ -14,7 +14,7 @@ load_dotenv(os.path.join(os.path.dirname(__file__), '.env'))
 
 # Now import database modules
 from database import engine, SessionLocal
-from models import Base, User, Portfolio, UploadedFile, UserAnalytics, SystemLog, AIJob, Subscription
+from models import Base, User, Portfolio, UploadedFile, CVProfile, UserAnalytics, AnalyticsRollup, AnalyticsUserSketch, AnalyticsRollupState, SystemLog, AIJob, Subscription
 
 def create_tables():
     """Create all tables in the database"""
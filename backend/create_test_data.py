@@ -5,8 +5,7 @@ load_dotenv(os.path.join(os.path.dirname(__file__), '.env'))
 
 from database import SessionLocal
 from main import User
-from datetime import datetime
-import json
+from models import CVProfile
 
 # Create a test user with sample CV data
 def create_test_data():
@@ -25,31 +24,36 @@ def create_test_data():
             hashed_password="$2b$12$sample_hashed_password",
             full_name="John Doe",
             phone="+1-234-567-8900",
-            address="123 Main St, City, State 12345",
+            address="123 Main St, City, State 12345"
+        )
+        
+        db.add(test_user)
+        db.flush()
+        db.add(CVProfile(
+            user_id=test_user.id,
+            version=1,
+            is_current=True,
             summary="Experienced software developer with 5+ years in web development",
-            experience_json=json.dumps([
+            experience=[
                 {
                     "company": "Tech Corp",
                     "position": "Senior Developer",
                     "duration": "2020-2024",
                     "description": "Led development of web applications"
                 }
-            ]),
-            education_json=json.dumps([
+            ],
+            education=[
                 {
                     "institution": "University of Technology",
                     "degree": "Computer Science",
                     "year": "2019"
                 }
-            ]),
-            skills_json=json.dumps(["Python", "JavaScript", "React", "FastAPI"]),
-            languages_json=json.dumps(["English (Native)", "Spanish (Fluent)"]),
-            certifications_json=json.dumps(["AWS Certified Developer"]),
-            links_json=json.dumps(["https://github.com/johndoe", "https://linkedin.com/in/johndoe"]),
-            cv_updated_at=datetime.utcnow()
-        )
-        
-        db.add(test_user)
+            ],
+            skills=["Python", "JavaScript", "React", "FastAPI"],
+            languages=["English (Native)", "Spanish (Fluent)"],
+            certifications=["AWS Certified Developer"],
+            links=["https://github.com/johndoe", "https://linkedin.com/in/johndoe"]
+        ))
         db.commit()
         print("Test user created successfully!")
         
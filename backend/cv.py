@@ -1,5 +1,5 @@
 # Handles CV upload, validation, and parsing endpoints
-from fastapi import APIRouter, UploadFile, File, HTTPException
+from fastapi import APIRouter, UploadFile, File, HTTPException, Request
 from pydantic import BaseModel
 import os
 import shutil
@@ -7,6 +7,7 @@ import sys
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 from ai_services.cv_ai import parse_cv_with_ai
 from cv_utils import extract_text_from_file
+from analytics_events import EVENT_CV_PARSED, EVENT_CV_UPLOAD, record_event
 
 ALLOWED_EXTENSIONS = {"pdf", "docx", "txt"}
 UPLOAD_DIR = "uploaded_cvs"
@@ -19,7 +20,7 @@ def save_upload_file(upload_file, destination):
         shutil.copyfileobj(upload_file.file, buffer)
 
 @router.post("/upload/", summary="Upload a CV file", response_model=dict)
-async def upload_cv(file: UploadFile = File(...)):
+async def upload_cv(request: Request, file: UploadFile = File(...)):
     if not file or not file.filename:
         raise HTTPException(status_code=400, detail="No file uploaded.")
     ext = file.filename.split(".")[-1].lower()
@@ -27,13 +28,14 @@ async def upload_cv(file: UploadFile = File(...)):
         raise HTTPException(status_code=400, detail="Unsupported file type.")
     file_path = os.path.join(UPLOAD_DIR, file.filename)
     save_upload_file(file, file_path)
+    record_event(EVENT_CV_UPLOAD, data={"file_type": ext}, request=request)
     return {"filename": file.filename, "status": "uploaded"}
 
 class ParseCVRequest(BaseModel):
     filename: str
 
 @router.post("/parse/", summary="Parse a CV file with AI", response_model=dict)
-async def parse_cv(request: ParseCVRequest):
+async def parse_cv(request: ParseCVRequest, http_request: Request):
     file_path = os.path.join(UPLOAD_DIR, request.filename)
     if not os.path.exists(file_path):
         raise HTTPException(status_code=404, detail="File not found.")
@@ -43,4 +45,5 @@ async def parse_cv(request: ParseCVRequest):
     result = parse_cv_with_ai(text_content)
     if "error" in result:
         raise HTTPException(status_code=500, detail=result["error"])
+    record_event(EVENT_CV_PARSED, data={"file_type": request.filename.split(".")[-1].lower()}, request=http_request)
     return result
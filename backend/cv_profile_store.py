@@ -0,0 +1,130 @@
+# Database persistence for versioned CV profiles
+import json
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from typing import Dict, Any, List, Optional
+from models import CVProfile, User
+
+# Fields stored on each CV profile version
+CV_DOCUMENT_FIELDS = ("summary", "experience", "education", "skills", "languages", "certifications", "links")
+
+# Columns returned by version listings, leaving the JSON documents unread
+CV_VERSION_COLUMNS = (
+    CVProfile.version, CVProfile.is_current, CVProfile.file_id, CVProfile.created_at
+)
+
+MAX_SAVE_ATTEMPTS = 5
+
+def get_current_cv_profile(db: Session, user_id: int) -> Optional[CVProfile]:
+    """Load the latest CV profile version of a user."""
+    return (
+        db.query(CVProfile)
+        .filter(CVProfile.user_id == user_id, CVProfile.is_current == True)
+        .first()
+    )
+
+def get_cv_profile_version(db: Session, user_id: int, version: int) -> Optional[CVProfile]:
+    """Load one stored CV profile version of a user."""
+    return (
+        db.query(CVProfile)
+        .filter(CVProfile.user_id == user_id, CVProfile.version == version)
+        .first()
+    )
+
+def list_cv_profile_versions(db: Session, user_id: int) -> List[Dict[str, Any]]:
+    """List a user's CV profile versions, newest first, without loading their content."""
+    rows = (
+        db.query(*CV_VERSION_COLUMNS)
+        .filter(CVProfile.user_id == user_id)
+        .order_by(CVProfile.version.desc())
+        .all()
+    )
+    return [
+        {
+            "version": row.version,
+            "is_current": row.is_current,
+            "file_id": row.file_id,
+            "created_at": row.created_at.isoformat() if row.created_at else None,
+        }
+        for row in rows
+    ]
+
+def save_cv_profile(
+    db: Session,
+    user_id: int,
+    fields: Dict[str, Any],
+    file_id: Optional[int] = None,
+    user_values: Optional[Dict[str, Any]] = None,
+) -> CVProfile:
+    """Store a new CV profile version with the given fields changed, keeping the previous one.
+
+    Fields not given are carried over from the current version. Two concurrent
+    saves for the same user would pick the same version number; the unique
+    (user_id, version) constraint rejects the second, which then retries on
+    top of the version that won. user_values, if given, are written to the
+    users row in the same transaction, so both changes land or neither does.
+    """
+    for _ in range(MAX_SAVE_ATTEMPTS):
+        current = get_current_cv_profile(db, user_id)
+        document = {field: getattr(current, field) for field in CV_DOCUMENT_FIELDS} if current else {}
+        document.update({field: value for field, value in fields.items() if field in CV_DOCUMENT_FIELDS})
+        profile = CVProfile(
+            user_id=user_id,
+            file_id=file_id,
+            version=current.version + 1 if current else 1,
+            is_current=True,
+            **document,
+        )
+        try:
+            if user_values:
+                db.execute(update(User).where(User.id == user_id).values(**user_values))
+            if current:
+                db.execute(
+                    update(CVProfile)
+                    .where(CVProfile.id == current.id)
+                    .values(is_current=False)
+                )
+            db.add(profile)
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+            continue
+        db.refresh(profile)
+        return profile
+    raise RuntimeError("CV profile was updated concurrently too many times")
+
+def cv_profile_to_dict(profile: Optional[CVProfile]) -> Dict[str, Any]:
+    """Build the API representation of a CV profile version."""
+    data = {field: getattr(profile, field, None) for field in CV_DOCUMENT_FIELDS}
+    for field in CV_DOCUMENT_FIELDS:
+        if field != "summary" and data[field] is None:
+            data[field] = []
+    data.update({
+        "version": profile.version if profile else None,
+        "file_id": profile.file_id if profile else None,
+        "cv_updated_at": profile.created_at if profile else None,
+    })
+    return data
+
+def _item_key(item: Any) -> str:
+    # Entries are compared by value; dicts are made hashable through a canonical dump
+    return json.dumps(item, sort_keys=True, default=str)
+
+def diff_cv_profiles(old: CVProfile, new: CVProfile) -> Dict[str, Any]:
+    """Describe what changed between two CV profile versions, field by field."""
+    changes = {}
+    for field in CV_DOCUMENT_FIELDS:
+        before, after = getattr(old, field), getattr(new, field)
+        if before == after:
+            continue
+        if field == "summary" or not isinstance(before or [], list) or not isinstance(after or [], list):
+            changes[field] = {"from": before, "to": after}
+            continue
+        before_keys = {_item_key(item) for item in before or []}
+        after_keys = {_item_key(item) for item in after or []}
+        changes[field] = {
+            "added": [item for item in after or [] if _item_key(item) not in before_keys],
+            "removed": [item for item in before or [] if _item_key(item) not in after_keys],
+        }
+    return changes
@@ -0,0 +1,100 @@
+# Helpers for strong ETags, conditional GETs and precompressed response bodies
+import gzip
+import hashlib
+import json
+from typing import Any, Dict, Iterable, Optional
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+
+try:
+    import brotli
+except ImportError:
+    # Fallback if brotli is not available: only gzip variants are produced
+    brotli = None
+
+# Preferred order when the client accepts several encodings
+ENCODING_PREFERENCE = ["br", "gzip"]
+
+# Clients may reuse a stored copy but must revalidate it with If-None-Match first
+REVALIDATE = "public, max-age=0, must-revalidate"
+
+def make_etag(body: bytes) -> str:
+    """Return a strong ETag derived from the content hash of body."""
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Check an If-None-Match header value against an ETag."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    # Weak comparison is allowed for If-None-Match, so ignore any W/ prefix
+    return any(candidate.removeprefix("W/") == etag for candidate in candidates)
+
+def compress_variants(body: bytes) -> Dict[str, bytes]:
+    """Precompute the compressed variants of body, keyed by content coding."""
+    variants = {"gzip": gzip.compress(body, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants["br"] = brotli.compress(body)
+    return variants
+
+def choose_encoding(accept_encoding: Optional[str], available: Iterable[str]) -> Optional[str]:
+    """Pick the best precomputed encoding the client accepts, or None for identity."""
+    if not accept_encoding:
+        return None
+    accepted = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[coding.strip().lower()] = quality
+    available = set(available)
+    for coding in ENCODING_PREFERENCE:
+        if coding in available and accepted.get(coding, accepted.get("*", 0.0)) > 0:
+            return coding
+    return None
+
+def not_modified(request: Request, etag: str, cache_control: str = REVALIDATE) -> Optional[Response]:
+    """Return a 304 response if the request's If-None-Match matches etag, else None."""
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": cache_control, "Vary": "Accept-Encoding"})
+    return None
+
+def cached_response(
+    request: Request,
+    etag: str,
+    bodies: Dict[str, bytes],
+    media_type: str,
+    cache_control: str = REVALIDATE
+) -> Response:
+    """Serve a body with precomputed encodings, honoring If-None-Match and Accept-Encoding.
+
+    bodies maps content codings to bytes and must contain "identity". The
+    response sets Content-Encoding itself, so GZipMiddleware leaves it alone.
+    """
+    response = not_modified(request, etag, cache_control)
+    if response is not None:
+        return response
+    headers = {"ETag": etag, "Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+    encoding = choose_encoding(request.headers.get("accept-encoding"), bodies)
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(content=bodies[encoding or "identity"], media_type=media_type, headers=headers)
+
+class CachedPayload:
+    """A JSON payload serialized and compressed once, for responses that rarely change."""
+    __slots__ = ("etag", "bodies")
+
+    def __init__(self, content: Any):
+        body = json.dumps(jsonable_encoder(content), separators=(",", ":")).encode("utf-8")
+        self.etag = make_etag(body)
+        self.bodies = {"identity": body, **compress_variants(body)}
+
+    def response(self, request: Request) -> Response:
+        return cached_response(request, self.etag, self.bodies, "application/json")
@@ -0,0 +1,188 @@
+# Reading and rotating the legacy NDJSON log file without loading it into memory
+import glob
+import gzip
+import json
+import os
+import shutil
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+READ_BLOCK_SIZE = 64 * 1024
+# Upper bound on bytes scanned by one page request, so a selective filter on a
+# huge file returns a partial page with a cursor instead of scanning everything
+MAX_SCAN_BYTES = int(os.getenv("LOG_FILE_MAX_SCAN_BYTES", str(32 * 1024 * 1024)))
+ARCHIVE_SUFFIX = ".log.gz"
+
+class CursorError(ValueError):
+    pass
+
+def iter_lines_reversed(path: str, end: Optional[int] = None) -> Iterator[Tuple[int, bytes]]:
+    """Yield (start offset, line) pairs from the end of the file (or from `end`) towards the start.
+
+    The file is read backwards in fixed-size blocks, so memory use depends on
+    the longest line, not on the file size.
+    """
+    with open(path, "rb") as f:
+        position = f.seek(0, os.SEEK_END) if end is None else min(end, os.fstat(f.fileno()).st_size)
+        remainder = b""
+        while position > 0:
+            read_size = min(READ_BLOCK_SIZE, position)
+            position -= read_size
+            f.seek(position)
+            block = f.read(read_size) + remainder
+            lines = block.split(b"\n")
+            # The first piece may be the tail of a line that continues in the previous block
+            remainder = lines.pop(0)
+            offset = position + len(remainder) + 1
+            starts = []
+            for line in lines:
+                starts.append((offset, line))
+                offset += len(line) + 1
+            for start, line in reversed(starts):
+                if line.strip():
+                    yield start, line
+        if remainder.strip():
+            yield 0, remainder
+
+def iter_lines_forward(path: str) -> Iterator[bytes]:
+    """Yield the lines of a log file or gzip archive from the start, one at a time."""
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rb") as f:
+        for line in f:
+            if line.strip():
+                yield line
+
+def line_matches(line: bytes, level: Optional[str], module: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Decode a log line if it passes the filters, else return None.
+
+    A substring check on the raw bytes rejects most non-matching lines
+    before paying for json.loads.
+    """
+    if level and level.encode("utf-8") not in line.upper():
+        return None
+    if module and module.encode("utf-8") not in line:
+        return None
+    try:
+        entry = json.loads(line)
+    except ValueError:
+        # Skip malformed lines
+        return None
+    if not isinstance(entry, dict):
+        return None
+    if level and str(entry.get("level", "")).upper() != level:
+        return None
+    if module and entry.get("module") != module:
+        return None
+    return entry
+
+def file_identity(path: str) -> str:
+    """Identify the current log file so cursors become invalid once it is rotated."""
+    stat = os.stat(path)
+    return f"{stat.st_ino:x}"
+
+def make_cursor(identity: str, offset: int) -> str:
+    return f"{identity}.{offset}"
+
+def parse_cursor(cursor: str, identity: str) -> int:
+    file_id, _, offset = cursor.partition(".")
+    if not offset.isdigit():
+        raise CursorError("Invalid cursor")
+    if file_id != identity:
+        raise CursorError("The log file has been rotated since this cursor was issued")
+    return int(offset)
+
+def read_page(
+    path: str,
+    limit: int,
+    cursor: Optional[str] = None,
+    level: Optional[str] = None,
+    module: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Return up to `limit` matching entries, newest first, and a cursor for older entries."""
+    if not os.path.exists(path):
+        return {"logs": [], "next_cursor": None}
+    identity = file_identity(path)
+    end = parse_cursor(cursor, identity) if cursor else None
+    logs: List[Dict[str, Any]] = []
+    next_offset = None
+    scanned = 0
+    for start, line in iter_lines_reversed(path, end):
+        scanned += len(line) + 1
+        entry = line_matches(line, level, module)
+        if entry is not None:
+            logs.append(entry)
+            if len(logs) >= limit:
+                next_offset = start
+                break
+        if scanned >= MAX_SCAN_BYTES:
+            next_offset = start
+            break
+    return {
+        "logs": logs,
+        "next_cursor": make_cursor(identity, next_offset) if next_offset else None,
+    }
+
+def stream_entries(
+    path: str,
+    limit: int,
+    cursor: Optional[str] = None,
+    level: Optional[str] = None,
+    module: Optional[str] = None,
+) -> Iterator[str]:
+    """Yield matching entries, newest first, as NDJSON lines."""
+    if not os.path.exists(path):
+        return
+    end = parse_cursor(cursor, file_identity(path)) if cursor else None
+    sent = 0
+    for _, line in iter_lines_reversed(path, end):
+        if line_matches(line, level, module) is not None:
+            yield line.decode("utf-8", errors="replace").rstrip("\r") + "\n"
+            sent += 1
+            if sent >= limit:
+                return
+
+def stream_archive(path: str, level: Optional[str] = None, module: Optional[str] = None) -> Iterator[str]:
+    """Yield the matching entries of a compressed archive, oldest first, as NDJSON lines."""
+    for line in iter_lines_forward(path):
+        if line_matches(line, level, module) is not None:
+            yield line.decode("utf-8", errors="replace").rstrip("\r\n") + "\n"
+
+def archive_paths(path: str) -> List[str]:
+    """Compressed archives of a log file, newest first."""
+    base, _ = os.path.splitext(path)
+    return sorted(glob.glob(f"{glob.escape(base)}-*{ARCHIVE_SUFFIX}"), reverse=True)
+
+def list_archives(path: str) -> List[Dict[str, Any]]:
+    return [
+        {
+            "name": os.path.basename(archive),
+            "size": os.path.getsize(archive),
+            "created_at": datetime.utcfromtimestamp(os.path.getmtime(archive)).isoformat(),
+        }
+        for archive in archive_paths(path)
+    ]
+
+def rotate_if_needed(path: str, max_bytes: int, keep: int) -> Optional[str]:
+    """Move the log file to a gzip archive once it reaches max_bytes, keeping the newest `keep` archives.
+
+    Writers open the file in append mode per batch, so after the rename the
+    next write simply creates a fresh file. Returns the archive path if the
+    file was rotated.
+    """
+    try:
+        if os.path.getsize(path) < max_bytes:
+            return None
+    except OSError:
+        return None
+    base, _ = os.path.splitext(path)
+    stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S%f")
+    rotated = f"{base}-{stamp}.log"
+    archive = rotated[:-len(".log")] + ARCHIVE_SUFFIX
+    os.replace(path, rotated)
+    with open(rotated, "rb") as source, gzip.open(archive + ".tmp", "wb") as target:
+        shutil.copyfileobj(source, target, READ_BLOCK_SIZE)
+    os.replace(archive + ".tmp", archive)
+    os.remove(rotated)
+    for old_archive in archive_paths(path)[keep:]:
+        os.remove(old_archive)
+    return archive
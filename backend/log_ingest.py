@@ -0,0 +1,172 @@
+# Incremental parsing of batched log uploads (NDJSON or JSON arrays, optionally gzip-compressed)
+import json
+import zlib
+from typing import Any, AsyncIterator, Iterator, Optional
+
+LOG_LEVELS = {"DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"}
+MAX_MESSAGE_LENGTH = 8192
+MAX_MODULE_LENGTH = 200
+MAX_ENTRY_BYTES = 64 * 1024
+
+class PayloadError(ValueError):
+    """The request body as a whole cannot be processed."""
+    status_code = 400
+
+class PayloadTooLarge(PayloadError):
+    status_code = 413
+
+_decoder = json.JSONDecoder()
+
+async def decoded_chunks(stream: AsyncIterator[bytes], content_encoding: Optional[str], max_bytes: int) -> AsyncIterator[bytes]:
+    """Yield the request body decompressed chunk by chunk, enforcing max_bytes on the decompressed size."""
+    encoding = (content_encoding or "identity").strip().lower()
+    if encoding not in ("identity", "gzip"):
+        raise PayloadError(f"Unsupported Content-Encoding: {encoding}")
+    # wbits 16 + MAX_WBITS accepts the gzip header and trailer
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS) if encoding == "gzip" else None
+    total = 0
+    async for chunk in stream:
+        if decompressor is not None:
+            try:
+                # Never inflate more than the remaining budget (plus one byte to detect overflow)
+                chunk = decompressor.decompress(chunk, max_bytes - total + 1)
+            except zlib.error as e:
+                raise PayloadError(f"Invalid gzip body: {str(e)}")
+            if decompressor.unconsumed_tail:
+                raise PayloadTooLarge(f"Decompressed body exceeds {max_bytes} bytes")
+        total += len(chunk)
+        if total > max_bytes:
+            raise PayloadTooLarge(f"Body exceeds {max_bytes} bytes")
+        if chunk:
+            yield chunk
+    if decompressor is not None:
+        if not decompressor.eof:
+            raise PayloadError("Truncated gzip body")
+        tail = decompressor.flush()
+        if total + len(tail) > max_bytes:
+            raise PayloadTooLarge(f"Decompressed body exceeds {max_bytes} bytes")
+        if tail:
+            yield tail
+
+class NDJSONParser:
+    """Splits NDJSON input into decoded values as chunks arrive."""
+
+    def __init__(self):
+        self._buffer = b""
+
+    def feed(self, chunk: bytes) -> Iterator[Any]:
+        self._buffer += chunk
+        *lines, self._buffer = self._buffer.split(b"\n")
+        for line in lines:
+            yield from self._decode(line)
+
+    def close(self) -> Iterator[Any]:
+        line, self._buffer = self._buffer, b""
+        yield from self._decode(line)
+
+    @staticmethod
+    def _decode(line: bytes) -> Iterator[Any]:
+        if not line.strip():
+            return
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            yield PayloadError(f"Invalid JSON: {str(e)}")
+
+class JSONArrayParser:
+    """Decodes the elements of a top-level JSON array one at a time as chunks arrive.
+
+    Only the element currently being received is buffered, so validation
+    can start before the whole body has been read.
+    """
+
+    def __init__(self):
+        self._text = ""
+        self._pending = b""
+        self._started = False
+        self._finished = False
+        self._need_separator = False
+        self._after_comma = False
+
+    def feed(self, chunk: bytes) -> Iterator[Any]:
+        data = self._pending + chunk
+        try:
+            self._text += data.decode("utf-8")
+            self._pending = b""
+        except UnicodeDecodeError as e:
+            # A multi-byte character may be split across chunks; keep its first bytes for the next one
+            if e.start < len(data) - 3:
+                raise PayloadError("Body is not valid UTF-8")
+            self._text += data[:e.start].decode("utf-8")
+            self._pending = data[e.start:]
+        return self._parse()
+
+    def close(self) -> Iterator[Any]:
+        if self._pending or not self._finished:
+            raise PayloadError("Truncated JSON array")
+        if self._text.strip():
+            raise PayloadError("Unexpected data after JSON array")
+        return iter(())
+
+    def _parse(self) -> Iterator[Any]:
+        while True:
+            text = self._text = self._text.lstrip()
+            if not text:
+                return
+            if self._finished:
+                raise PayloadError("Unexpected data after JSON array")
+            if not self._started:
+                if text[0] != "[":
+                    raise PayloadError("Body must be a JSON array or NDJSON")
+                self._started = True
+                self._text = text[1:]
+                continue
+            if text[0] == "]":
+                if self._after_comma:
+                    raise PayloadError("Invalid JSON array")
+                self._finished = True
+                self._text = text[1:]
+                continue
+            if self._need_separator:
+                if text[0] != ",":
+                    raise PayloadError("Invalid JSON array")
+                self._need_separator = False
+                self._after_comma = True
+                self._text = text[1:]
+                continue
+            try:
+                value, end = _decoder.raw_decode(text)
+            except ValueError:
+                # Most likely an element that has not fully arrived yet; wait for more data
+                if len(text) > MAX_ENTRY_BYTES:
+                    raise PayloadError(f"Array element exceeds {MAX_ENTRY_BYTES} bytes or is not valid JSON")
+                return
+            if isinstance(value, (int, float)) and not text[end:].strip("0123456789.eE+-"):
+                # A number at the end of the buffer may continue in the next chunk
+                return
+            self._text = text[end:]
+            self._need_separator = True
+            self._after_comma = False
+            yield value
+
+def validate_log_entry(value: Any) -> dict:
+    """Check one client log entry and return it normalized, raising ValueError if it is unusable."""
+    if isinstance(value, Exception):
+        raise value
+    if not isinstance(value, dict):
+        raise ValueError("Entry must be a JSON object")
+    message = value.get("message", "")
+    if not isinstance(message, str):
+        raise ValueError("message must be a string")
+    if len(message) > MAX_MESSAGE_LENGTH:
+        raise ValueError(f"message exceeds {MAX_MESSAGE_LENGTH} characters")
+    level = str(value.get("level", "INFO")).upper()
+    if level not in LOG_LEVELS:
+        raise ValueError(f"Unknown level: {value.get('level')}")
+    module = value.get("module", "unknown")
+    if not isinstance(module, str) or len(module) > MAX_MODULE_LENGTH:
+        raise ValueError("module must be a short string")
+    extra_data = value.get("extra_data", {})
+    if not isinstance(extra_data, dict):
+        raise ValueError("extra_data must be an object")
+    return {**value, "level": level, "message": message, "module": module, "extra_data": extra_data}
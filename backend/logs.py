@@ -1,8 +1,29 @@
-from fastapi import APIRouter, Request, Depends, HTTPException
+from fastapi import APIRouter, Request, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy import tuple_
 from sqlalchemy.orm import Session
 from models import SystemLog, User
-from database import SessionLocal
-from auth_utils import get_current_user
+from database import SessionLocal, engine
+from batch_writer import BatchWriter
+from log_file import (
+    CursorError,
+    archive_paths,
+    list_archives,
+    read_page,
+    rotate_if_needed,
+    stream_archive,
+    stream_entries,
+)
+from log_ingest import (
+    JSONArrayParser,
+    NDJSONParser,
+    PayloadError,
+    PayloadTooLarge,
+    decoded_chunks,
+    validate_log_entry,
+)
+from auth_utils import get_current_admin_user, get_current_user
+import itertools
 import os
 import json
 from datetime import datetime
@@ -21,61 +42,176 @@ def get_db():
 # Legacy log file for backwards compatibility
 LOG_FILE = os.path.join(os.path.dirname(__file__), '../all-logs.log')
 
-@router.post("/")
+# The legacy file is rotated into gzip archives once it reaches this size
+LOG_FILE_MAX_BYTES = int(os.getenv("LOG_FILE_MAX_BYTES", str(50 * 1024 * 1024)))
+LOG_FILE_ARCHIVES = int(os.getenv("LOG_FILE_ARCHIVES", "10"))
+LOG_FILE_MAX_PAGE = 1000
+
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "20000"))
+LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", "500"))
+LOG_FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", "1"))
+LOG_BATCH_MAX_ENTRIES = int(os.getenv("LOG_BATCH_MAX_ENTRIES", "1000"))
+LOG_BATCH_MAX_BYTES = int(os.getenv("LOG_BATCH_MAX_BYTES", str(1024 * 1024)))
+
+_system_logs = SystemLog.__table__
+
+def write_log_batch(entries):
+    """Insert a batch of log rows with one multi-row INSERT, then append them to the legacy file."""
+    with engine.begin() as connection:
+        connection.execute(_system_logs.insert(), [row for row, _ in entries])
+    try:
+        with open(LOG_FILE, "a", encoding="utf-8") as f:
+            f.write("".join(line for _, line in entries))
+        rotate_if_needed(LOG_FILE, LOG_FILE_MAX_BYTES, LOG_FILE_ARCHIVES)
+    except Exception as file_error:
+        print(f"Warning: Could not write to log file: {file_error}")
+
+log_writer = BatchWriter(
+    "system-logs",
+    write_log_batch,
+    max_queue=LOG_QUEUE_SIZE,
+    batch_size=LOG_BATCH_SIZE,
+    flush_interval=LOG_FLUSH_INTERVAL,
+)
+
+def build_log_entry(data: dict, user_id: Optional[int]):
+    """Turn a client log payload into a system_logs row and its legacy file line."""
+    timestamp = datetime.utcnow()
+    row = {
+        # Upper-cased so every entry lands in its level's partition
+        "level": str(data.get('level', 'INFO')).upper(),
+        "message": data.get('message', ''),
+        "module": data.get('module', 'unknown'),
+        "user_id": user_id,
+        "timestamp": timestamp,
+        "extra_data": data.get('extra_data', {})
+    }
+    line = f"{json.dumps({'timestamp': timestamp.isoformat(), **data})}\n"
+    return row, line
+
+def queue_full_error():
+    return HTTPException(
+        status_code=503,
+        detail="Log ingestion is overloaded, please retry shortly",
+        headers={"Retry-After": "1"}
+    )
+
+@router.post("/", status_code=202)
 async def create_log_entry(
     request: Request,
-    db: Session = Depends(get_db),
     current_user: Optional[User] = Depends(get_current_user)
 ):
-    """Create a new log entry"""
+    """Queue a log entry; entries are written to the database in batches"""
     try:
-        data = await request.json()
-        
-        # Create database log entry
-        log_entry = SystemLog(
-            level=data.get('level', 'INFO'),
-            message=data.get('message', ''),
-            module=data.get('module', 'unknown'),
-            user_id=current_user.id if current_user else None,
-            timestamp=datetime.utcnow(),
-            extra_data=data.get('extra_data', {})
-        )
-        
-        db.add(log_entry)
-        db.commit()
-        
-        # Also write to file for backwards compatibility
-        timestamp = datetime.utcnow().isoformat()
-        entry = {"timestamp": timestamp, **data}
-        try:
-            with open(LOG_FILE, "a", encoding="utf-8") as f:
-                f.write(f"{json.dumps(entry)}\n")
-        except Exception as file_error:
-            print(f"Warning: Could not write to log file: {file_error}")
-        
-        return {"status": "logged", "id": log_entry.id}
-        
-    except Exception as e:
-        return {"status": "error", "error": str(e)}
+        data = validate_log_entry(await request.json())
+    except ValueError as e:
+        # Also covers a body that is not valid JSON
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if not log_writer.submit(build_log_entry(data, current_user.id if current_user else None)):
+        raise queue_full_error()
+    return {"status": "queued"}
+
+@router.post("/batch", status_code=202)
+async def create_log_batch(
+    request: Request,
+    current_user: Optional[User] = Depends(get_current_user)
+):
+    """Queue many log entries sent as NDJSON or a JSON array, optionally gzip-compressed
+
+    Entries are validated as the body streams in; invalid entries are reported
+    by their position in the batch and the rest are queued.
+    """
+    user_id = current_user.id if current_user else None
+    parser = None
+    rows, errors = [], []
+
+    def take(values):
+        for value in values:
+            index = len(rows) + len(errors)
+            if index >= LOG_BATCH_MAX_ENTRIES:
+                raise PayloadTooLarge(f"Batches are limited to {LOG_BATCH_MAX_ENTRIES} entries")
+            try:
+                rows.append(build_log_entry(validate_log_entry(value), user_id))
+            except ValueError as e:
+                errors.append({"index": index, "error": str(e)})
+
+    try:
+        chunks = decoded_chunks(request.stream(), request.headers.get("content-encoding"), LOG_BATCH_MAX_BYTES)
+        async for chunk in chunks:
+            if parser is None:
+                stripped = chunk.lstrip()
+                if not stripped:
+                    continue
+                # A JSON array starts with "["; anything else is read as NDJSON
+                parser = JSONArrayParser() if stripped[:1] == b"[" else NDJSONParser()
+            take(parser.feed(chunk))
+        if parser is not None:
+            take(parser.close())
+    except PayloadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    
+    if rows and not log_writer.submit_many(rows):
+        raise queue_full_error()
+    return {
+        "status": "queued",
+        "accepted": len(rows),
+        "rejected": len(errors),
+        "errors": errors[:100]
+    }
+
+@router.get("/stats")
+async def get_log_writer_stats(current_user: User = Depends(get_current_admin_user)):
+    """Get log ingestion queue statistics (admin only)"""
+    return log_writer.stats()
+
+LOG_PAGE_MAX = 1000
+
+def encode_log_cursor(log: SystemLog) -> str:
+    return f"{log.timestamp.isoformat()}|{log.id}"
+
+def decode_log_cursor(cursor: str):
+    timestamp, _, log_id = cursor.partition("|")
+    try:
+        return datetime.fromisoformat(timestamp), int(log_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
 
 @router.get("/")
 async def get_logs(
-    limit: int = 100,
+    limit: int = Query(default=100, ge=1, le=LOG_PAGE_MAX),
+    cursor: Optional[str] = Query(default=None, description="next_cursor from the previous page"),
     level: Optional[str] = None,
     module: Optional[str] = None,
+    user_id: Optional[int] = None,
+    since: Optional[datetime] = Query(default=None, description="Only entries at or after this time; lets partitioned tables skip older partitions"),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Get log entries from database"""
+    """Get log entries from database, newest first, page by page"""
+    after = decode_log_cursor(cursor) if cursor else None
     try:
         query = db.query(SystemLog)
         
         if level:
-            query = query.filter(SystemLog.level == level)
+            query = query.filter(SystemLog.level == level.upper())
         if module:
             query = query.filter(SystemLog.module == module)
+        if user_id is not None:
+            query = query.filter(SystemLog.user_id == user_id)
+        if since is not None:
+            query = query.filter(SystemLog.timestamp >= since)
+        if after:
+            # Row-value comparison lets the (filter, timestamp, id) indexes seek straight to the page
+            query = query.filter(tuple_(SystemLog.timestamp, SystemLog.id) < tuple_(*after))
             
-        logs = query.order_by(SystemLog.timestamp.desc()).limit(limit).all()
+        logs = (
+            query.order_by(SystemLog.timestamp.desc(), SystemLog.id.desc())
+            .limit(limit + 1)
+            .all()
+        )
+        has_more = len(logs) > limit
+        logs = logs[:limit]
         
         return {
             "logs": [
@@ -89,31 +225,54 @@ async def get_logs(
                     "extra_data": log.extra_data
                 }
                 for log in logs
-            ]
+            ],
+            "next_cursor": encode_log_cursor(logs[-1]) if has_more else None
         }
         
     except Exception as e:
-        return {"logs": [], "error": str(e)}
+        return {"logs": [], "next_cursor": None, "error": str(e)}
 
 @router.get("/file")
-async def get_logs_from_file(current_user: User = Depends(get_current_user)):
-    """Get logs from legacy file (admin only)"""
-    if not getattr(current_user, 'is_admin', False):
-        raise HTTPException(status_code=403, detail="Admin access required")
-        
+async def get_logs_from_file(
+    limit: int = Query(default=100, ge=1, le=LOG_FILE_MAX_PAGE),
+    cursor: Optional[str] = Query(default=None, description="next_cursor from the previous page"),
+    level: Optional[str] = None,
+    module: Optional[str] = None,
+    format: str = Query(default="json", pattern="^(json|ndjson)$"),
+    current_user: User = Depends(get_current_admin_user)
+):
+    """Get the newest entries of the legacy log file, page by page (admin only)"""
+    level = level.upper() if level else None
     try:
-        if not os.path.exists(LOG_FILE):
-            return {"logs": []}
-        with open(LOG_FILE, "r", encoding="utf-8") as f:
-            lines = f.readlines()
-        logs = []
-        for line in lines:
-            if line.strip():
-                try:
-                    logs.append(json.loads(line))
-                except json.JSONDecodeError:
-                    # Skip malformed lines
-                    continue
-        return {"logs": logs}
-    except Exception as e:
-        return {"logs": [], "error": str(e)}
+        if format == "ndjson":
+            entries = stream_entries(LOG_FILE, limit, cursor, level, module)
+            # Pull the first line now so a bad cursor fails with 400 instead of mid-stream
+            first = next(entries, "")
+            return StreamingResponse(
+                itertools.chain([first], entries),
+                media_type="application/x-ndjson"
+            )
+        return read_page(LOG_FILE, limit, cursor, level, module)
+    except CursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/file/archives")
+async def get_log_archives(current_user: User = Depends(get_current_admin_user)):
+    """List compressed archives of the legacy log file (admin only)"""
+    return {"archives": list_archives(LOG_FILE)}
+
+@router.get("/file/archives/{name}")
+async def get_log_archive(
+    name: str,
+    level: Optional[str] = None,
+    module: Optional[str] = None,
+    current_user: User = Depends(get_current_admin_user)
+):
+    """Stream the entries of one log archive as NDJSON, oldest first (admin only)"""
+    archives = {os.path.basename(path): path for path in archive_paths(LOG_FILE)}
+    if name not in archives:
+        raise HTTPException(status_code=404, detail="Archive not found")
+    return StreamingResponse(
+        stream_archive(archives[name], level.upper() if level else None, module),
+        media_type="application/x-ndjson"
+    )
@@ -27,6 +27,12 @@ app = FastAPI(
     openapi_url="/openapi.json"
 )
 
+# Rate limiting runs inside CORS so throttled responses still carry CORS headers
+from app.core.rate_limiter import RateLimitMiddleware, build_rate_limiter_from_env
+rate_limiter = build_rate_limiter_from_env()
+if rate_limiter is not None:
+    app.add_middleware(RateLimitMiddleware, limiter=rate_limiter)
+
 # CORS for modern web apps
 app.add_middleware(
     CORSMiddleware,
@@ -93,6 +99,11 @@ from ats_resume import router as ats_router
 from analytics import router as analytics_router
 from system_health import router as system_health_router
 from additional_endpoints import router as additional_router
+from view_counter import view_counter
+from logs import log_writer
+from partitioning import partition_maintainer
+from analytics_rollups import rollup_maintainer
+from analytics_events import event_recorder
 
 # Add routers to api_v1_router instead of app
 api_v1_router.include_router(cv_router)
@@ -104,6 +115,23 @@ api_v1_router.include_router(ats_router)
 api_v1_router.include_router(analytics_router)
 api_v1_router.include_router(additional_router)
 
+# Background flushers for buffered writes
+@app.on_event("startup")
+def start_background_writers():
+    view_counter.start()
+    log_writer.start()
+    partition_maintainer.start()
+    rollup_maintainer.start()
+    event_recorder.start()
+
+@app.on_event("shutdown")
+def stop_background_writers():
+    view_counter.stop()
+    log_writer.stop()
+    partition_maintainer.stop()
+    rollup_maintainer.stop()
+    event_recorder.stop()
+
 # Add system health router directly to app (not under /api/v1)
 app.include_router(system_health_router)
 app.include_router(api_v1_router)
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+Allow anonymous events in user_analytics
+
+Uploads, ATS resumes and public portfolio views are recorded without a
+signed-in user, so user_analytics.user_id becomes nullable.
+"""
+import os
+import sys
+from dotenv import load_dotenv
+
+# Add current directory to path
+sys.path.append(os.path.dirname(__file__))
+
+# Load environment variables
+load_dotenv(os.path.join(os.path.dirname(__file__), '.env'))
+
+# Now import database modules
+from database import engine
+
+def migrate_analytics_events():
+    """Drop the NOT NULL constraint on user_analytics.user_id"""
+    try:
+        from sqlalchemy import text
+
+        if engine.dialect.name != "postgresql":
+            print("❌ This migration only applies to PostgreSQL databases (SQLite tables are created from models.py)")
+            return False
+
+        with engine.begin() as connection:
+            # On a partitioned table this also applies to every partition
+            connection.execute(text("ALTER TABLE user_analytics ALTER COLUMN user_id DROP NOT NULL;"))
+        print("✅ user_analytics.user_id is now nullable")
+
+        print("\n✅ Analytics events migration completed successfully!")
+        return True
+
+    except Exception as e:
+        print(f"❌ Error migrating analytics events: {e}")
+        return False
+
+if __name__ == "__main__":
+    migrate_analytics_events()
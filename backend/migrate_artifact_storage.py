@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Move generated resumes and portfolios from the flat layout into sharded directories
+"""
+import os
+import sys
+import argparse
+
+# Add current directory to path
+sys.path.append(os.path.dirname(__file__))
+
+from storage_utils import shard_directory
+
+ARTIFACT_ROOTS = ["generated_resumes", "generated_portfolios"]
+
+def migrate_root(root: str, dry_run: bool = False) -> int:
+    """Move every file directly under root into its shard directory"""
+    if not os.path.isdir(root):
+        print(f"ℹ️  {root} does not exist, skipping")
+        return 0
+
+    moved = 0
+    # scandir streams directory entries instead of building the full listing in memory
+    with os.scandir(root) as entries:
+        for entry in entries:
+            if not entry.is_file():
+                continue
+            artifact_id, _ = os.path.splitext(entry.name)
+            target_dir = shard_directory(root, artifact_id)
+            target = os.path.join(target_dir, entry.name)
+            if dry_run:
+                print(f"  would move {entry.path} -> {target}")
+            else:
+                os.makedirs(target_dir, exist_ok=True)
+                os.replace(entry.path, target)
+            moved += 1
+    return moved
+
+def migrate_artifact_storage(roots=None, dry_run: bool = False):
+    """Migrate all artifact roots to the sharded layout"""
+    total = 0
+    for root in roots or ARTIFACT_ROOTS:
+        try:
+            count = migrate_root(root, dry_run=dry_run)
+            print(f"✅ {root}: {count} files {'to move' if dry_run else 'moved'}")
+            total += count
+        except Exception as e:
+            print(f"❌ Error migrating {root}: {e}")
+    return total
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("roots", nargs="*", help="Artifact directories to migrate (default: all)")
+    parser.add_argument("--dry-run", action="store_true", help="Only print what would be moved")
+    args = parser.parse_args()
+    migrate_artifact_storage(args.roots, dry_run=args.dry_run)
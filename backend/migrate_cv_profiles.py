@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Move CV data from the users table into the versioned cv_profiles table
+"""
+import os
+import sys
+from dotenv import load_dotenv
+
+# Add current directory to path
+sys.path.append(os.path.dirname(__file__))
+
+# Load environment variables
+load_dotenv(os.path.join(os.path.dirname(__file__), '.env'))
+
+# Now import database modules
+from database import engine
+from models import CVProfile
+
+# Old users column -> cv_profiles column
+CV_COLUMNS = {
+    "summary": "summary",
+    "experience_json": "experience",
+    "education_json": "education",
+    "skills_json": "skills",
+    "languages_json": "languages",
+    "certifications_json": "certifications",
+    "links_json": "links",
+}
+
+def _jsonb(column):
+    # Handles columns still holding JSON-encoded strings if convert_cv_json_columns.py was not run
+    return (
+        f"CASE WHEN {column} IS NULL THEN NULL "
+        f"WHEN jsonb_typeof({column}::jsonb) = 'string' THEN ({column}::jsonb #>> '{{}}')::jsonb "
+        f"ELSE {column}::jsonb END"
+    )
+
+def _copy_statement():
+    targets = ", ".join(CV_COLUMNS.values())
+    sources = ", ".join("summary" if old == "summary" else _jsonb(old) for old in CV_COLUMNS)
+    has_data = " OR ".join(f"{old} IS NOT NULL" for old in CV_COLUMNS)
+    return (
+        f"INSERT INTO cv_profiles (user_id, version, is_current, {targets}, created_at) "
+        f"SELECT id, 1, TRUE, {sources}, COALESCE(cv_updated_at, created_at, NOW()) FROM users "
+        f"WHERE ({has_data}) AND NOT EXISTS (SELECT 1 FROM cv_profiles WHERE cv_profiles.user_id = users.id);"
+    )
+
+def migrate_cv_profiles(drop_old_columns: bool = True):
+    """Create cv_profiles, copy each user's CV data into version 1 and narrow the users table"""
+    try:
+        from sqlalchemy import text
+
+        if engine.dialect.name != "postgresql":
+            print("❌ This migration only applies to PostgreSQL databases")
+            return False
+
+        print("Creating cv_profiles table...")
+        CVProfile.__table__.create(bind=engine, checkfirst=True)
+        print("✅ cv_profiles table ready")
+
+        with engine.connect() as connection:
+            existing = {
+                row[0] for row in connection.execute(text(
+                    "SELECT column_name FROM information_schema.columns WHERE table_name = 'users'"
+                ))
+            }
+            if not set(CV_COLUMNS) <= existing:
+                print("✅ users table has no CV columns left, nothing to copy")
+                return True
+
+            result = connection.execute(text(_copy_statement()))
+            print(f"✅ Copied CV data for {result.rowcount} users")
+
+            if drop_old_columns:
+                for column in [*CV_COLUMNS, "cv_updated_at"]:
+                    connection.execute(text(f"ALTER TABLE users DROP COLUMN IF EXISTS {column};"))
+                    print(f"✅ Dropped users.{column}")
+
+            connection.commit()
+            print("\n✅ CV profiles migrated successfully!")
+
+        return True
+
+    except Exception as e:
+        print(f"❌ Error migrating CV profiles: {e}")
+        return False
+
+if __name__ == "__main__":
+    migrate_cv_profiles(drop_old_columns="--keep-columns" not in sys.argv)
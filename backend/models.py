@@ -1,10 +1,14 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, ForeignKey, Float, JSON
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, ForeignKey, Float, JSON, Index, LargeBinary, UniqueConstraint, text
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import datetime
 
 Base = declarative_base()
 
+# Binary JSON on PostgreSQL (indexable, no reparsing on read), plain JSON elsewhere
+NativeJSON = JSON().with_variant(JSONB(), "postgresql")
+
 class User(Base):
     __tablename__ = "users"
     
@@ -28,34 +32,30 @@ class User(Base):
     avatar_url = Column(String, nullable=True)
     bio = Column(Text, nullable=True)
     
-    # CV Data fields
-    summary = Column(Text, nullable=True)
-    experience_json = Column(JSON, nullable=True)
-    education_json = Column(JSON, nullable=True)
-    skills_json = Column(JSON, nullable=True)
-    languages_json = Column(JSON, nullable=True)
-    certifications_json = Column(JSON, nullable=True)
-    links_json = Column(JSON, nullable=True)
-    cv_updated_at = Column(DateTime, nullable=True)
-    
     # Relationships
     portfolios = relationship("Portfolio", back_populates="owner")
     uploaded_files = relationship("UploadedFile", back_populates="user")
     analytics = relationship("UserAnalytics", back_populates="user")
+    cv_profiles = relationship("CVProfile", back_populates="user", order_by="CVProfile.version")
 
 class Portfolio(Base):
     __tablename__ = "portfolios"
     
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    public_id = Column(String, unique=True, index=True, nullable=True)  # ID exposed in portfolio URLs
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
     title = Column(String, nullable=False)
     description = Column(Text, nullable=True)
     template_name = Column(String, default="modern")
     is_public = Column(Boolean, default=False)
-    custom_domain = Column(String, nullable=True)
+    custom_domain = Column(String, unique=True, index=True, nullable=True)
     theme_config = Column(JSON, nullable=True)
     seo_config = Column(JSON, nullable=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    cv_data = Column(JSON, nullable=True)
+    customizations = Column(JSON, nullable=True)
+    sections = Column(JSON, nullable=True)  # generated hero/about/skills/... content
+    version = Column(Integer, nullable=False, default=1)  # bumped on every update, used for optimistic locking
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     published_at = Column(DateTime, nullable=True)
     views_count = Column(Integer, default=0)
@@ -75,18 +75,52 @@ class UploadedFile(Base):
     file_path = Column(String, nullable=False)
     upload_date = Column(DateTime, default=datetime.utcnow)
     processed = Column(Boolean, default=False)
-    processed_at = Column(DateTime, nullable=True)
+    processed_at = Column(DateTime, nullable=True, index=True)
     extracted_text = Column(Text, nullable=True)
     ai_analysis = Column(JSON, nullable=True)
     
     # Relationships
     user = relationship("User", back_populates="uploaded_files")
+    cv_profiles = relationship("CVProfile", back_populates="source_file")
+
+class CVProfile(Base):
+    __tablename__ = "cv_profiles"
+    __table_args__ = (
+        UniqueConstraint("user_id", "version", name="uq_cv_profiles_user_version"),
+        # At most one current profile per user
+        Index("ix_cv_profiles_current", "user_id", unique=True,
+              postgresql_where=text("is_current"), sqlite_where=text("is_current")),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    file_id = Column(Integer, ForeignKey("uploaded_files.id"), nullable=True)  # CV upload this version was parsed from
+    version = Column(Integer, nullable=False)  # 1, 2, ... per user; older versions are kept for diffing
+    is_current = Column(Boolean, nullable=False, default=True)
+    summary = Column(Text, nullable=True)
+    experience = Column(NativeJSON, nullable=True)
+    education = Column(NativeJSON, nullable=True)
+    skills = Column(NativeJSON, nullable=True)
+    languages = Column(NativeJSON, nullable=True)
+    certifications = Column(NativeJSON, nullable=True)
+    links = Column(NativeJSON, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    # Relationships
+    user = relationship("User", back_populates="cv_profiles")
+    source_file = relationship("UploadedFile", back_populates="cv_profiles")
 
 class UserAnalytics(Base):
     __tablename__ = "user_analytics"
+    __table_args__ = (
+        # Time-window aggregations for the analytics dashboard
+        Index("ix_user_analytics_timestamp", "timestamp"),
+        Index("ix_user_analytics_user_timestamp", "user_id", "timestamp"),
+        Index("ix_user_analytics_event_timestamp", "event_type", "timestamp"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True)  # NULL for anonymous events, e.g. public portfolio views
     event_type = Column(String, nullable=False)  # cv_upload, portfolio_view, etc.
     event_data = Column(JSON, nullable=True)
     timestamp = Column(DateTime, default=datetime.utcnow)
@@ -96,15 +130,62 @@ class UserAnalytics(Base):
     # Relationships
     user = relationship("User", back_populates="analytics")
 
+# Event counts per time bucket, maintained incrementally from user_analytics
+class AnalyticsRollup(Base):
+    __tablename__ = "analytics_rollups"
+    __table_args__ = (
+        UniqueConstraint("bucket_size", "bucket_start", "event_type", "template", "country", name="uq_analytics_rollups_bucket"),
+        Index("ix_analytics_rollups_size_start", "bucket_size", "bucket_start"),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    bucket_size = Column(String, nullable=False)  # minute, hour, day
+    bucket_start = Column(DateTime, nullable=False)
+    event_type = Column(String, nullable=False)
+    template = Column(String, nullable=False, default="")  # "" when the event has no template
+    country = Column(String, nullable=False, default="")  # "" when the event has no country
+    event_count = Column(Integer, nullable=False, default=0)
+    value_sum = Column(Float, nullable=False, default=0)  # sum of the event type's numeric value, e.g. ats_score
+    value_count = Column(Integer, nullable=False, default=0)
+
+# HyperLogLog sketch of the distinct users active in a time bucket, stored next to the rollups
+class AnalyticsUserSketch(Base):
+    __tablename__ = "analytics_user_sketches"
+    __table_args__ = (
+        UniqueConstraint("bucket_size", "bucket_start", "country", name="uq_analytics_user_sketches_bucket"),
+        Index("ix_analytics_user_sketches_size_start", "bucket_size", "bucket_start"),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    bucket_size = Column(String, nullable=False)  # hour, day
+    bucket_start = Column(DateTime, nullable=False)
+    country = Column(String, nullable=False, default="")  # "" for all countries
+    sketch = Column(LargeBinary, nullable=False)  # zlib-compressed HyperLogLog.to_bytes()
+
+# How far user_analytics has been folded into the rollups
+class AnalyticsRollupState(Base):
+    __tablename__ = "analytics_rollup_state"
+    
+    name = Column(String, primary_key=True)
+    last_event_id = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
 class SystemLog(Base):
     __tablename__ = "system_logs"
+    __table_args__ = (
+        # Serve filtered "newest first" listings and their (timestamp, id) keyset cursors
+        Index("ix_system_logs_timestamp_id", "timestamp", "id"),
+        Index("ix_system_logs_level_timestamp", "level", "timestamp", "id"),
+        Index("ix_system_logs_module_timestamp", "module", "timestamp", "id"),
+        Index("ix_system_logs_user_timestamp", "user_id", "timestamp", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     level = Column(String, nullable=False)  # INFO, WARNING, ERROR
     message = Column(Text, nullable=False)
     module = Column(String, nullable=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
-    timestamp = Column(DateTime, default=datetime.utcnow)
+    timestamp = Column(DateTime, nullable=False, default=datetime.utcnow)  # partition key on PostgreSQL
     extra_data = Column(JSON, nullable=True)
 
 class AIJob(Base):
@@ -119,7 +200,7 @@ class AIJob(Base):
     error_message = Column(Text, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     started_at = Column(DateTime, nullable=True)
-    completed_at = Column(DateTime, nullable=True)
+    completed_at = Column(DateTime, nullable=True, index=True)
     processing_time = Column(Float, nullable=True)  # seconds
 
 class Subscription(Base):
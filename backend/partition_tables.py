@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Convert system_logs and user_analytics into time-partitioned tables (PostgreSQL)
+
+system_logs is partitioned by LIST (level), each level by RANGE (timestamp) per
+day, so every level can have its own retention. user_analytics is partitioned
+by RANGE (timestamp) per month. Existing rows still within retention are copied
+into the new tables; older rows are dropped with the old table rather than
+copied only to be expired. Running the script again on partitioned tables only
+runs partition maintenance.
+"""
+import os
+import sys
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+from sqlalchemy import text
+
+# Add current directory to path
+sys.path.append(os.path.dirname(__file__))
+
+# Load environment variables
+load_dotenv(os.path.join(os.path.dirname(__file__), '.env'))
+
+# Now import database modules
+from database import engine
+from partitioning import (
+    LOG_LEVELS,
+    PARTITION_PREMAKE_DAYS,
+    analytics_cutoff,
+    ensure_analytics_partitions,
+    ensure_log_partitions,
+    is_partitioned,
+    level_partition,
+    log_cutoff,
+    run_partition_maintenance,
+)
+
+SYSTEM_LOGS_DDL = """
+CREATE TABLE system_logs (
+    id INTEGER NOT NULL DEFAULT nextval('system_logs_id_seq'),
+    level VARCHAR NOT NULL,
+    message TEXT NOT NULL,
+    module VARCHAR,
+    user_id INTEGER REFERENCES users (id),
+    timestamp TIMESTAMP NOT NULL DEFAULT (now() AT TIME ZONE 'utc'),
+    extra_data JSON,
+    PRIMARY KEY (id, level, timestamp)
+) PARTITION BY LIST (level);
+"""
+
+USER_ANALYTICS_DDL = """
+CREATE TABLE user_analytics (
+    id INTEGER NOT NULL DEFAULT nextval('user_analytics_id_seq'),
+    user_id INTEGER REFERENCES users (id),
+    event_type VARCHAR NOT NULL,
+    event_data JSON,
+    timestamp TIMESTAMP NOT NULL DEFAULT (now() AT TIME ZONE 'utc'),
+    ip_address VARCHAR,
+    user_agent VARCHAR,
+    PRIMARY KEY (id, timestamp)
+) PARTITION BY RANGE (timestamp);
+"""
+
+# Created on the parents after the data is copied, so they are built once per partition
+SYSTEM_LOGS_INDEXES = [
+    "CREATE INDEX ix_system_logs_timestamp_id ON system_logs (timestamp, id);",
+    "CREATE INDEX ix_system_logs_level_timestamp ON system_logs (level, timestamp, id);",
+    "CREATE INDEX ix_system_logs_module_timestamp ON system_logs (module, timestamp, id);",
+    "CREATE INDEX ix_system_logs_user_timestamp ON system_logs (user_id, timestamp, id);",
+]
+USER_ANALYTICS_INDEXES = [
+    "CREATE INDEX ix_user_analytics_timestamp ON user_analytics (timestamp);",
+    "CREATE INDEX ix_user_analytics_user_timestamp ON user_analytics (user_id, timestamp);",
+    "CREATE INDEX ix_user_analytics_event_timestamp ON user_analytics (event_type, timestamp);",
+]
+
+def _oldest_day(connection, table, cutoff):
+    """Day of the oldest row still within retention, so no partitions are made for expired days."""
+    oldest = connection.execute(text(f"SELECT MIN(timestamp) FROM {table}_legacy")).scalar()
+    return max((oldest or datetime.utcnow()).date(), cutoff)
+
+def _log_retained_since(today):
+    # Per-level cutoff for the copy; levels outside LOG_LEVELS use the OTHER retention
+    cases = " ".join(f"WHEN '{level}' THEN DATE '{log_cutoff(level, today).isoformat()}'" for level in LOG_LEVELS)
+    return f"CASE UPPER(level) {cases} ELSE DATE '{log_cutoff(None, today).isoformat()}' END"
+
+def partition_system_logs(connection):
+    connection.execute(text("ALTER TABLE system_logs RENAME TO system_logs_legacy;"))
+    # Index names are schema-wide, so the old primary key has to make way for the new one
+    connection.execute(text("ALTER INDEX IF EXISTS system_logs_pkey RENAME TO system_logs_legacy_pkey;"))
+    connection.execute(text(SYSTEM_LOGS_DDL))
+    connection.execute(text("ALTER SEQUENCE system_logs_id_seq OWNED BY system_logs.id;"))
+    for level in LOG_LEVELS:
+        parent = level_partition(level)
+        connection.execute(text(
+            f"CREATE TABLE {parent} PARTITION OF system_logs FOR VALUES IN ('{level}') PARTITION BY RANGE (timestamp);"
+        ))
+        connection.execute(text(f"CREATE TABLE {parent}_default PARTITION OF {parent} DEFAULT;"))
+    other = level_partition(None)
+    connection.execute(text(f"CREATE TABLE {other} PARTITION OF system_logs DEFAULT PARTITION BY RANGE (timestamp);"))
+    connection.execute(text(f"CREATE TABLE {other}_default PARTITION OF {other} DEFAULT;"))
+
+    today = datetime.utcnow().date()
+    earliest = min(log_cutoff(level, today) for level in (*LOG_LEVELS, None))
+    created = ensure_log_partitions(connection, _oldest_day(connection, "system_logs", earliest), today + timedelta(days=PARTITION_PREMAKE_DAYS))
+    print(f"✅ Created {len(created)} system_logs partitions")
+
+    total = connection.execute(text("SELECT COUNT(*) FROM system_logs_legacy")).scalar()
+    result = connection.execute(text(
+        "INSERT INTO system_logs (id, level, message, module, user_id, timestamp, extra_data) "
+        "SELECT id, UPPER(level), message, module, user_id, COALESCE(timestamp, now() AT TIME ZONE 'utc'), extra_data "
+        f"FROM system_logs_legacy WHERE COALESCE(timestamp, now() AT TIME ZONE 'utc') >= {_log_retained_since(today)};"
+    ))
+    print(f"✅ Copied {result.rowcount} log rows, skipped {total - result.rowcount} past retention")
+    connection.execute(text("DROP TABLE system_logs_legacy;"))
+    for statement in SYSTEM_LOGS_INDEXES:
+        connection.execute(text(statement))
+    print("✅ Created system_logs indexes")
+
+def partition_user_analytics(connection):
+    connection.execute(text("ALTER TABLE user_analytics RENAME TO user_analytics_legacy;"))
+    # Index names are schema-wide, so the old primary key has to make way for the new one
+    connection.execute(text("ALTER INDEX IF EXISTS user_analytics_pkey RENAME TO user_analytics_legacy_pkey;"))
+    connection.execute(text(USER_ANALYTICS_DDL))
+    connection.execute(text("ALTER SEQUENCE user_analytics_id_seq OWNED BY user_analytics.id;"))
+    connection.execute(text("CREATE TABLE user_analytics_default PARTITION OF user_analytics DEFAULT;"))
+
+    today = datetime.utcnow().date()
+    cutoff = analytics_cutoff(today)
+    created = ensure_analytics_partitions(connection, _oldest_day(connection, "user_analytics", cutoff), today + timedelta(days=PARTITION_PREMAKE_DAYS))
+    print(f"✅ Created {len(created)} user_analytics partitions")
+
+    total = connection.execute(text("SELECT COUNT(*) FROM user_analytics_legacy")).scalar()
+    result = connection.execute(text(
+        "INSERT INTO user_analytics (id, user_id, event_type, event_data, timestamp, ip_address, user_agent) "
+        "SELECT id, user_id, event_type, event_data, COALESCE(timestamp, now() AT TIME ZONE 'utc'), ip_address, user_agent "
+        "FROM user_analytics_legacy WHERE COALESCE(timestamp, now() AT TIME ZONE 'utc') >= :cutoff;"
+    ), {"cutoff": cutoff})
+    print(f"✅ Copied {result.rowcount} analytics rows, skipped {total - result.rowcount} past retention")
+    connection.execute(text("DROP TABLE user_analytics_legacy;"))
+    for statement in USER_ANALYTICS_INDEXES:
+        connection.execute(text(statement))
+    print("✅ Created user_analytics indexes")
+
+def partition_tables():
+    """Partition the log and analytics tables, then premake partitions and apply retention"""
+    try:
+        if engine.dialect.name != "postgresql":
+            print("❌ Table partitioning requires PostgreSQL")
+            return False
+
+        # Each table is converted in its own transaction; a failure leaves it untouched
+        for table, convert in (("system_logs", partition_system_logs), ("user_analytics", partition_user_analytics)):
+            with engine.begin() as connection:
+                if is_partitioned(connection, table):
+                    print(f"✅ {table} is already partitioned")
+                    continue
+                print(f"Partitioning {table}...")
+                convert(connection)
+
+        result = run_partition_maintenance()
+        print(f"✅ Maintenance created {len(result['created'])} and dropped {len(result['dropped'])} partitions")
+        print(f"✅ Expired {result['expired_rows']} rows from the default partitions")
+        print("\n✅ Tables partitioned successfully!")
+        return True
+
+    except Exception as e:
+        print(f"❌ Error partitioning tables: {e}")
+        return False
+
+if __name__ == "__main__":
+    partition_tables()
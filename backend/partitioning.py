@@ -0,0 +1,235 @@
+# Time-based partition management and retention for system_logs and user_analytics (PostgreSQL)
+import logging
+import os
+import re
+import threading
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional
+from sqlalchemy import text
+from database import engine
+
+logger = logging.getLogger(__name__)
+
+LOG_LEVELS = ("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL")
+# Days of system_logs kept per level; OTHER covers levels outside LOG_LEVELS
+DEFAULT_LOG_RETENTION = {"DEBUG": 7, "INFO": 30, "WARNING": 90, "ERROR": 365, "CRITICAL": 365, "OTHER": 30}
+ANALYTICS_RETENTION_MONTHS = int(os.getenv("ANALYTICS_RETENTION_MONTHS", "24"))
+# Partitions are created this far ahead so inserts never wait on DDL
+PARTITION_PREMAKE_DAYS = int(os.getenv("PARTITION_PREMAKE_DAYS", "7"))
+PARTITION_MAINTENANCE_INTERVAL = float(os.getenv("PARTITION_MAINTENANCE_INTERVAL", "3600"))
+# pg_try_advisory_lock key, so only one worker runs maintenance at a time
+MAINTENANCE_LOCK_KEY = 4502
+
+_DAILY = re.compile(r"_(\d{8})$")
+_MONTHLY = re.compile(r"_(\d{6})$")
+
+def log_retention_days() -> Dict[str, int]:
+    """Per-level retention from LOG_RETENTION_DAYS, e.g. "DEBUG=3,INFO=14,ERROR=180"."""
+    retention = dict(DEFAULT_LOG_RETENTION)
+    for item in os.getenv("LOG_RETENTION_DAYS", "").split(","):
+        level, _, days = item.partition("=")
+        if level.strip() and days.strip().isdigit():
+            retention[level.strip().upper()] = int(days)
+    return retention
+
+def log_cutoff(level: Optional[str], today: date) -> date:
+    """Earliest day of system_logs kept for a level; older rows are past retention."""
+    retention = log_retention_days()
+    return today - timedelta(days=retention.get(level or "OTHER", DEFAULT_LOG_RETENTION["OTHER"]))
+
+def analytics_cutoff(today: date) -> date:
+    """First day of the oldest month of user_analytics kept."""
+    cutoff_month = _month_start(today)
+    for _ in range(ANALYTICS_RETENTION_MONTHS):
+        cutoff_month = _month_start(cutoff_month - timedelta(days=1))
+    return cutoff_month
+
+def level_partition(level: Optional[str]) -> str:
+    """Name of the per-level parent partition of system_logs."""
+    return f"system_logs_{level.lower()}" if level else "system_logs_other"
+
+def _month_start(day: date) -> date:
+    return day.replace(day=1)
+
+def _next_month(day: date) -> date:
+    return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+def is_partitioned(connection, table: str) -> bool:
+    return connection.execute(
+        text("SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid WHERE c.relname = :table"),
+        {"table": table},
+    ).first() is not None
+
+def child_partitions(connection, parent: str) -> List[str]:
+    rows = connection.execute(
+        text(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = :parent"
+        ),
+        {"parent": parent},
+    )
+    return [row[0] for row in rows]
+
+def _create_partition(connection, statement: str, name: str) -> bool:
+    # A savepoint keeps one failed CREATE (e.g. rows for that range already sitting
+    # in the default partition) from aborting the remaining partitions
+    try:
+        with connection.begin_nested():
+            connection.execute(text(statement))
+        return True
+    except Exception as e:
+        logger.warning(f"Could not create partition {name}: {str(e)}")
+        return False
+
+def ensure_log_partitions(connection, start: date, end: date) -> List[str]:
+    """Create the daily system_logs partitions of every level for start..end (inclusive).
+
+    Days already past a level's retention are skipped, since maintenance would drop them again.
+    """
+    created = []
+    existing = set()
+    for level in (*LOG_LEVELS, None):
+        existing.update(child_partitions(connection, level_partition(level)))
+    today = datetime.utcnow().date()
+    cutoffs = {level: log_cutoff(level, today) for level in (*LOG_LEVELS, None)}
+    day = start
+    while day <= end:
+        for level in (*LOG_LEVELS, None):
+            parent = level_partition(level)
+            name = f"{parent}_{day:%Y%m%d}"
+            if name in existing or day < cutoffs[level]:
+                continue
+            statement = (
+                f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {parent} "
+                f"FOR VALUES FROM ('{day.isoformat()}') TO ('{(day + timedelta(days=1)).isoformat()}')"
+            )
+            if _create_partition(connection, statement, name):
+                created.append(name)
+        day += timedelta(days=1)
+    return created
+
+def ensure_analytics_partitions(connection, start: date, end: date) -> List[str]:
+    """Create the monthly user_analytics partitions for the months from start to end, skipping expired months."""
+    created = []
+    existing = set(child_partitions(connection, "user_analytics"))
+    month = max(_month_start(start), analytics_cutoff(datetime.utcnow().date()))
+    while month <= end:
+        name = f"user_analytics_{month:%Y%m}"
+        if name not in existing:
+            statement = (
+                f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF user_analytics "
+                f"FOR VALUES FROM ('{month.isoformat()}') TO ('{_next_month(month).isoformat()}')"
+            )
+            if _create_partition(connection, statement, name):
+                created.append(name)
+        month = _next_month(month)
+    return created
+
+def _drop_partition(connection, parent: str, name: str):
+    # Detaching first keeps the exclusive lock on the parent short; the drop then
+    # only touches the detached table
+    connection.execute(text(f"ALTER TABLE {parent} DETACH PARTITION {name}"))
+    connection.execute(text(f"DROP TABLE {name}"))
+
+def drop_expired_partitions(connection, today: date) -> List[str]:
+    """Drop whole partitions whose rows are all older than their retention period."""
+    dropped = []
+    for level in (*LOG_LEVELS, None):
+        parent = level_partition(level)
+        cutoff = log_cutoff(level, today)
+        for name in child_partitions(connection, parent):
+            match = _DAILY.search(name)
+            if not match:
+                continue
+            day = datetime.strptime(match.group(1), "%Y%m%d").date()
+            # The partition covers [day, day + 1); it can go once its end is before the cutoff
+            if day + timedelta(days=1) <= cutoff:
+                _drop_partition(connection, parent, name)
+                dropped.append(name)
+    cutoff_month = analytics_cutoff(today)
+    for name in child_partitions(connection, "user_analytics"):
+        match = _MONTHLY.search(name)
+        if not match:
+            continue
+        month = datetime.strptime(match.group(1), "%Y%m").date()
+        if _next_month(month) <= cutoff_month:
+            _drop_partition(connection, "user_analytics", name)
+            dropped.append(name)
+    return dropped
+
+def expire_default_partitions(connection, today: date) -> int:
+    """Delete rows past retention from the default partitions, which are never dropped; returns the row count."""
+    defaults = [(level_partition(level), log_cutoff(level, today)) for level in (*LOG_LEVELS, None)]
+    defaults.append(("user_analytics", analytics_cutoff(today)))
+    deleted = 0
+    for parent, cutoff in defaults:
+        name = f"{parent}_default"
+        if name not in child_partitions(connection, parent):
+            continue
+        result = connection.execute(text(f"DELETE FROM {name} WHERE timestamp < :cutoff"), {"cutoff": cutoff})
+        deleted += result.rowcount
+    return deleted
+
+def run_partition_maintenance(today: Optional[date] = None) -> Dict[str, List[str]]:
+    """Premake upcoming partitions, drop expired ones and expire default-partition rows; a no-op on non-PostgreSQL databases."""
+    result = {"created": [], "dropped": [], "expired_rows": 0}
+    if engine.dialect.name != "postgresql":
+        return result
+    today = today or datetime.utcnow().date()
+    with engine.connect() as connection:
+        if not connection.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": MAINTENANCE_LOCK_KEY}).scalar():
+            return result
+        try:
+            if is_partitioned(connection, "system_logs"):
+                result["created"] += ensure_log_partitions(connection, today, today + timedelta(days=PARTITION_PREMAKE_DAYS))
+            if is_partitioned(connection, "user_analytics"):
+                result["created"] += ensure_analytics_partitions(connection, today, today + timedelta(days=PARTITION_PREMAKE_DAYS))
+            connection.commit()
+            result["dropped"] = drop_expired_partitions(connection, today)
+            connection.commit()
+            result["expired_rows"] = expire_default_partitions(connection, today)
+            connection.commit()
+        finally:
+            connection.rollback()
+            connection.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": MAINTENANCE_LOCK_KEY})
+            connection.commit()
+    if result["created"] or result["dropped"] or result["expired_rows"]:
+        logger.info(
+            f"Partition maintenance: created {len(result['created'])}, dropped {len(result['dropped'])}, "
+            f"expired {result['expired_rows']} default-partition rows"
+        )
+    return result
+
+class PartitionMaintainer:
+    """Runs partition maintenance at startup and then every PARTITION_MAINTENANCE_INTERVAL seconds."""
+
+    def __init__(self, interval: float = PARTITION_MAINTENANCE_INTERVAL):
+        self.interval = interval
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                run_partition_maintenance()
+            except Exception as e:
+                logger.error(f"Partition maintenance failed: {str(e)}")
+            self._stopping.wait(self.interval)
+
+    def start(self):
+        if engine.dialect.name != "postgresql":
+            return
+        if self._thread is None or not self._thread.is_alive():
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="partition-maintenance", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+partition_maintainer = PartitionMaintainer()
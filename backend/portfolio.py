@@ -1,15 +1,45 @@
 # Portfolio generation endpoints
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Depends, Request, Response
+from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
 from typing import Dict, Any, List, Optional
 import logging
-import json
-import os
+import time
 from datetime import datetime
+from models import User, Portfolio
+from database import SessionLocal
+from auth_utils import get_current_user
+from storage_utils import new_artifact_id
+from template_utils import CompiledTemplate, compile_templates, invalid_overlay_keys
+from portfolio_renderer import render_portfolio_html
+from site_cache import site_cache, RenderedSite
+from http_cache import CachedPayload, cached_response, not_modified, REVALIDATE
+from view_counter import view_counter
+from analytics_events import EVENT_DOWNLOAD, EVENT_PORTFOLIO_GENERATED, EVENT_PORTFOLIO_VIEW, EVENT_TEMPLATE_CUSTOMIZED, record_event
+from site_export import stream_site_zip
+from portfolio_store import create_portfolio, get_portfolio, update_portfolio, portfolio_to_dict
 
 router = APIRouter(prefix="/portfolio", tags=["portfolio"])
 logger = logging.getLogger(__name__)
 
+# Attempts before giving up on a customization that keeps racing other writers
+MAX_UPDATE_ATTEMPTS = 5
+
+# How long a custom domain -> portfolio mapping is trusted before checking the database again
+DOMAIN_CACHE_TTL = 60
+_domain_cache: Dict[str, tuple] = {}
+
+# Database dependency
+def get_db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
 # Portfolio templates configuration
 PORTFOLIO_TEMPLATES = {
     "modern-tech": {
@@ -86,6 +116,20 @@ PORTFOLIO_TEMPLATES = {
     }
 }
 
+# Templates are compiled once into read-only objects shared by all requests
+COMPILED_TEMPLATES = compile_templates(PORTFOLIO_TEMPLATES)
+
+# The template catalog never changes at runtime, so it is serialized and compressed once
+TEMPLATES_PAYLOAD = CachedPayload({
+    "status": "success",
+    "templates": {template_id: template.config for template_id, template in COMPILED_TEMPLATES.items()}
+})
+
+def _check_customizations(customizations: Optional[Dict[str, Any]]):
+    invalid = invalid_overlay_keys(customizations)
+    if invalid:
+        raise HTTPException(status_code=400, detail=f"Customizations must be objects: {', '.join(invalid)}")
+
 class PortfolioGenerationRequest(BaseModel):
     cv_data: Dict[str, Any]
     template_id: str
@@ -104,135 +148,380 @@ class PortfolioCustomizationRequest(BaseModel):
     portfolio_id: str
     customizations: Dict[str, Any]
 
+class PortfolioPublishRequest(BaseModel):
+    custom_domain: Optional[str] = None
+
 @router.get("/templates/")
-async def get_portfolio_templates():
+async def get_portfolio_templates(request: Request):
     """Get all available portfolio templates with their configurations."""
-    return {
-        "status": "success",
-        "templates": PORTFOLIO_TEMPLATES
-    }
+    return TEMPLATES_PAYLOAD.response(request)
 
 @router.post("/generate/", response_model=PortfolioGenerationResponse)
-async def generate_portfolio(request: PortfolioGenerationRequest):
+async def generate_portfolio(
+    request: PortfolioGenerationRequest,
+    http_request: Request,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
     """Generate a portfolio based on CV data and selected template."""
     try:
-        if request.template_id not in PORTFOLIO_TEMPLATES:
+        if request.template_id not in COMPILED_TEMPLATES:
             raise HTTPException(status_code=400, detail="Invalid template ID")
+        _check_customizations(request.customizations)
         
-        template = PORTFOLIO_TEMPLATES[request.template_id]
+        template = COMPILED_TEMPLATES[request.template_id]
         
         # Extract key information from CV data
         cv_data = request.cv_data
         
         # Generate unique portfolio ID
-        portfolio_id = f"portfolio_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        portfolio_id = new_artifact_id("portfolio")
         
         # Generate portfolio content based on CV data
         generated_sections = generate_portfolio_content(cv_data, template, request.customizations)
         
-        # Store portfolio data (in production, this would go to a database)
-        portfolio_data = {
-            "id": portfolio_id,
-            "template_id": request.template_id,
-            "template_info": template,
-            "cv_data": cv_data,
-            "customizations": request.customizations,
-            "sections": generated_sections,
-            "created_at": datetime.now().isoformat(),
-            "status": "generated"
-        }
-        
-        # Save to file (in production, use database)
-        portfolio_dir = "generated_portfolios"
-        os.makedirs(portfolio_dir, exist_ok=True)
-        
-        with open(f"{portfolio_dir}/{portfolio_id}.json", "w") as f:
-            json.dump(portfolio_data, f, indent=2)
+        # Persist the portfolio for the current user
+        name = cv_data.get("personal_info", {}).get("name") or current_user.username
+        create_portfolio(
+            db,
+            public_id=portfolio_id,
+            user_id=current_user.id,
+            title=f"{name} Portfolio",
+            template_id=request.template_id,
+            cv_data=cv_data,
+            customizations=request.customizations or {},
+            sections=generated_sections
+        )
+        record_event(
+            EVENT_PORTFOLIO_GENERATED,
+            current_user.id,
+            {"template": request.template_id, "portfolio_id": portfolio_id},
+            http_request
+        )
         
         return PortfolioGenerationResponse(
             status="success",
             portfolio_id=portfolio_id,
-            template_info=template,
+            template_info=generated_sections["template_config"],
             generated_sections=generated_sections,
             preview_url=f"/portfolio/preview/{portfolio_id}",
             download_url=f"/portfolio/download/{portfolio_id}"
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
+        db.rollback()
         logger.error(f"Portfolio generation failed: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Portfolio generation failed: {str(e)}")
 
+@router.get("/mine/")
+async def list_my_portfolios(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """List the current user's portfolios without loading their content."""
+    rows = (
+        db.query(Portfolio.public_id, Portfolio.title, Portfolio.template_name,
+                 Portfolio.is_public, Portfolio.created_at, Portfolio.updated_at)
+        .filter(Portfolio.user_id == current_user.id)
+        .order_by(Portfolio.created_at.desc())
+        .all()
+    )
+    return {
+        "status": "success",
+        "portfolios": [
+            {
+                "id": row.public_id,
+                "title": row.title,
+                "template_id": row.template_name,
+                "is_public": row.is_public,
+                "created_at": row.created_at,
+                "updated_at": row.updated_at
+            }
+            for row in rows
+        ]
+    }
+
+# Part of the catalog hash, so preview ETags change when a deploy changes the templates
+_CATALOG_TAG = TEMPLATES_PAYLOAD.etag.strip('"')[:8]
+
+def _preview_etag(public_id: str, version: int) -> str:
+    # Every write bumps the version, so the version identifies the stored content
+    return f'"{public_id}-v{version}-{_CATALOG_TAG}"'
+
 @router.get("/preview/{portfolio_id}")
-async def get_portfolio_preview(portfolio_id: str):
+async def get_portfolio_preview(portfolio_id: str, request: Request, db: Session = Depends(get_db)):
     """Get portfolio preview data."""
     try:
-        portfolio_file = f"generated_portfolios/{portfolio_id}.json"
+        # Revalidation only needs the version column, not the JSON content
+        if request.headers.get("if-none-match"):
+            row = db.query(Portfolio.version).filter(Portfolio.public_id == portfolio_id).first()
+            if row:
+                response = not_modified(request, _preview_etag(portfolio_id, row.version))
+                if response is not None:
+                    return response
         
-        if not os.path.exists(portfolio_file):
-            raise HTTPException(status_code=404, detail="Portfolio not found")
+        portfolio = get_portfolio(db, portfolio_id)
         
-        with open(portfolio_file, "r") as f:
-            portfolio_data = json.load(f)
+        if not portfolio:
+            raise HTTPException(status_code=404, detail="Portfolio not found")
         
-        return {
+        template = COMPILED_TEMPLATES.get(portfolio.template_name)
+        template_info = template.with_customizations(portfolio.customizations) if template else {}
+        response = JSONResponse({
             "status": "success",
-            "portfolio": portfolio_data
-        }
+            "portfolio": jsonable_encoder(portfolio_to_dict(portfolio, template_info))
+        })
+        response.headers["ETag"] = _preview_etag(portfolio.public_id, portfolio.version)
+        response.headers["Cache-Control"] = REVALIDATE
+        return response
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Failed to get portfolio preview: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to load portfolio preview")
 
 @router.put("/customize/{portfolio_id}")
-async def customize_portfolio(portfolio_id: str, request: PortfolioCustomizationRequest):
-    """Update portfolio customizations."""
+async def customize_portfolio(
+    portfolio_id: str,
+    request: PortfolioCustomizationRequest,
+    http_request: Request,
+    include_sections: bool = False,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Update portfolio customizations, regenerating only the sections they affect."""
+    _check_customizations(request.customizations)
     try:
-        portfolio_file = f"generated_portfolios/{portfolio_id}.json"
-        
-        if not os.path.exists(portfolio_file):
-            raise HTTPException(status_code=404, detail="Portfolio not found")
-        
-        with open(portfolio_file, "r") as f:
-            portfolio_data = json.load(f)
-        
-        # Update customizations
-        portfolio_data["customizations"].update(request.customizations)
-        portfolio_data["updated_at"] = datetime.now().isoformat()
-        
-        # Regenerate sections with new customizations
-        template = PORTFOLIO_TEMPLATES[portfolio_data["template_id"]]
-        portfolio_data["sections"] = generate_portfolio_content(
-            portfolio_data["cv_data"], 
-            template, 
-            portfolio_data["customizations"]
-        )
+        for _ in range(MAX_UPDATE_ATTEMPTS):
+            portfolio = get_portfolio(db, portfolio_id)
+            
+            if not portfolio:
+                raise HTTPException(status_code=404, detail="Portfolio not found")
+            if portfolio.user_id != current_user.id:
+                raise HTTPException(status_code=403, detail="Not allowed to modify this portfolio")
+            
+            # Merge the new customizations into the latest stored ones
+            old_customizations = portfolio.customizations or {}
+            customizations = {**old_customizations, **request.customizations}
+            changed_keys = {
+                key for key in request.customizations
+                if old_customizations.get(key) != customizations[key]
+            }
+            
+            # Recompute only the sections that depend on the changed keys
+            template = COMPILED_TEMPLATES.get(portfolio.template_name)
+            if template is None:
+                raise HTTPException(status_code=400, detail=f"Portfolio uses an unknown template: {portfolio.template_name}")
+            sections, changed_sections = regenerate_sections(
+                portfolio.sections or {}, portfolio.cv_data or {}, template, customizations, changed_keys
+            )
+            
+            # Only the changed columns are written, and only if nobody updated the row meanwhile
+            values = {}
+            if changed_keys:
+                values["customizations"] = customizations
+            if changed_sections:
+                values["sections"] = sections
+            version = portfolio.version
+            if values:
+                if not update_portfolio(db, portfolio, **values):
+                    continue
+                version += 1
+                # Published portfolios are re-rendered once per change
+                if changed_sections and portfolio.is_public:
+                    render_site(portfolio.public_id, portfolio.title, version, sections)
+                record_event(
+                    EVENT_TEMPLATE_CUSTOMIZED,
+                    current_user.id,
+                    {"template": portfolio.template_name, "portfolio_id": portfolio.public_id},
+                    http_request
+                )
+            
+            response = {
+                "status": "success",
+                "message": "Portfolio updated successfully" if values else "No changes",
+                "version": version,
+                "changed_sections": changed_sections,
+                "unchanged_sections": [name for name in SECTION_BUILDERS if name not in changed_sections]
+            }
+            if include_sections:
+                response["sections"] = sections
+            return response
         
-        # Save updated portfolio
-        with open(portfolio_file, "w") as f:
-            json.dump(portfolio_data, f, indent=2)
+        raise HTTPException(status_code=409, detail="Portfolio was modified concurrently, please retry")
         
+    except HTTPException:
+        raise
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Portfolio customization failed: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to update portfolio")
+
+def render_site(public_id: str, title: str, version: int, sections: Dict[str, Any]) -> RenderedSite:
+    """Render a published portfolio to static HTML and store it in the site cache."""
+    return site_cache.store(public_id, version, render_portfolio_html(title, sections))
+
+def _site_response(request: Request, site: RenderedSite) -> Response:
+    """Serve a rendered site, honoring If-None-Match and the client's Accept-Encoding."""
+    return cached_response(request, site.etag, site.bodies, "text/html; charset=utf-8")
+
+def _record_view(request: Request, public_id: str):
+    """Count a site visit; the visitor key is only kept as a hash inside the unique-visitor sketch."""
+    client_host = request.client.host if request.client else ""
+    view_counter.record(public_id, f"{client_host}|{request.headers.get('user-agent', '')}")
+    record_event(EVENT_PORTFOLIO_VIEW, data={"portfolio_id": public_id}, request=request)
+
+def _load_site(db: Session, public_id: str) -> Optional[RenderedSite]:
+    """Return the cached site, rendering it from the database only on a cache miss."""
+    site = site_cache.get(public_id)
+    if site is not None:
+        return site
+    portfolio = get_portfolio(db, public_id)
+    if not portfolio or not portfolio.is_public:
+        return None
+    return render_site(portfolio.public_id, portfolio.title, portfolio.version, portfolio.sections or {})
+
+def _set_visibility(db: Session, portfolio_id: str, user: User, **values) -> Portfolio:
+    """Update publishing columns on an owned portfolio, retrying on concurrent updates."""
+    for _ in range(MAX_UPDATE_ATTEMPTS):
+        portfolio = get_portfolio(db, portfolio_id)
+        if not portfolio:
+            raise HTTPException(status_code=404, detail="Portfolio not found")
+        if portfolio.user_id != user.id:
+            raise HTTPException(status_code=403, detail="Not allowed to modify this portfolio")
+        if update_portfolio(db, portfolio, **values):
+            return get_portfolio(db, portfolio_id)
+    raise HTTPException(status_code=409, detail="Portfolio was modified concurrently, please retry")
+
+@router.post("/publish/{portfolio_id}")
+async def publish_portfolio(
+    portfolio_id: str,
+    request: PortfolioPublishRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Publish (or republish) a portfolio as a static site."""
+    try:
+        values = {"is_public": True, "published_at": datetime.utcnow()}
+        if request.custom_domain is not None:
+            values["custom_domain"] = request.custom_domain.strip().lower() or None
+        portfolio = _set_visibility(db, portfolio_id, current_user, **values)
+        site = render_site(portfolio.public_id, portfolio.title, portfolio.version, portfolio.sections or {})
+        _domain_cache.clear()
         return {
             "status": "success",
-            "message": "Portfolio updated successfully",
-            "sections": portfolio_data["sections"]
+            "portfolio_id": portfolio.public_id,
+            "site_url": f"/portfolio/site/{portfolio.public_id}",
+            "custom_domain": portfolio.custom_domain,
+            "etag": site.etag
         }
-        
+    except HTTPException:
+        raise
+    except IntegrityError:
+        # The unique index on custom_domain
+        db.rollback()
+        raise HTTPException(status_code=409, detail="Custom domain already in use")
     except Exception as e:
-        logger.error(f"Portfolio customization failed: {str(e)}")
-        raise HTTPException(status_code=500, detail="Failed to update portfolio")
+        db.rollback()
+        logger.error(f"Portfolio publishing failed: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to publish portfolio")
 
-def generate_portfolio_content(cv_data: Dict[str, Any], template: Dict[str, Any], customizations: Dict[str, Any]) -> Dict[str, Any]:
-    """Generate portfolio content based on CV data and template."""
-    
-    # Extract personal information
-    personal_info = cv_data.get("personal_info", {})
-    experience = cv_data.get("experience", [])
-    education = cv_data.get("education", [])
-    skills = cv_data.get("skills", [])
-    projects = cv_data.get("projects", [])
-    
-    # Generate hero section
-    hero_section = {
+@router.post("/unpublish/{portfolio_id}")
+async def unpublish_portfolio(
+    portfolio_id: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Take a published portfolio offline and drop its rendered site."""
+    portfolio = _set_visibility(db, portfolio_id, current_user, is_public=False)
+    site_cache.invalidate(portfolio.public_id)
+    _domain_cache.clear()
+    return {"status": "success", "portfolio_id": portfolio.public_id}
+
+@router.get("/site/{portfolio_id}")
+async def get_portfolio_site(portfolio_id: str, request: Request, db: Session = Depends(get_db)):
+    """Serve the static HTML of a published portfolio."""
+    site = _load_site(db, portfolio_id)
+    if site is None:
+        raise HTTPException(status_code=404, detail="Portfolio not found")
+    _record_view(request, site.public_id)
+    return _site_response(request, site)
+
+@router.get("/domain/{domain}")
+async def get_portfolio_site_by_domain(domain: str, request: Request, db: Session = Depends(get_db)):
+    """Serve the static HTML of the published portfolio bound to a custom domain."""
+    domain = domain.lower()
+    cached = _domain_cache.get(domain)
+    if cached and cached[1] > time.monotonic():
+        public_id = cached[0]
+    else:
+        row = (
+            db.query(Portfolio.public_id)
+            .filter(Portfolio.custom_domain == domain, Portfolio.is_public == True)
+            .first()
+        )
+        public_id = row.public_id if row else None
+        _domain_cache[domain] = (public_id, time.monotonic() + DOMAIN_CACHE_TTL)
+    site = _load_site(db, public_id) if public_id else None
+    if site is None:
+        raise HTTPException(status_code=404, detail="Portfolio not found")
+    _record_view(request, site.public_id)
+    return _site_response(request, site)
+
+@router.get("/download/{portfolio_id}")
+async def download_portfolio(
+    portfolio_id: str,
+    request: Request,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Download the portfolio as a zip of its static site, streamed as it is built."""
+    portfolio = get_portfolio(db, portfolio_id)
+    if not portfolio:
+        raise HTTPException(status_code=404, detail="Portfolio not found")
+    if portfolio.user_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Not allowed to download this portfolio")
+    record_event(EVENT_DOWNLOAD, current_user.id, {"artifact": "portfolio", "portfolio_id": portfolio.public_id}, request)
+    return StreamingResponse(
+        stream_site_zip(portfolio.title, portfolio.sections or {}),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{portfolio.public_id}.zip"'}
+    )
+
+@router.get("/stats/{portfolio_id}")
+async def get_portfolio_stats(
+    portfolio_id: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Get view statistics for an owned portfolio."""
+    row = (
+        db.query(Portfolio.user_id, Portfolio.views_count)
+        .filter(Portfolio.public_id == portfolio_id)
+        .first()
+    )
+    if not row:
+        raise HTTPException(status_code=404, detail="Portfolio not found")
+    if row.user_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Not allowed to view these statistics")
+    return {
+        "status": "success",
+        "portfolio_id": portfolio_id,
+        # Stored count plus views buffered in this worker that are not flushed yet
+        "views": (row.views_count or 0) + view_counter.pending_views(portfolio_id),
+        "unique_visitors": view_counter.unique_visitors(portfolio_id)
+    }
+
+def _personal_info(cv_data: Dict[str, Any], customizations: Dict[str, Any]) -> Dict[str, Any]:
+    """Personal info from the CV, with any values overridden through customizations."""
+    return {**cv_data.get("personal_info", {}), **(customizations.get("personal_info") or {})}
+
+def build_hero_section(cv_data: Dict[str, Any], template: CompiledTemplate, customizations: Dict[str, Any]) -> Dict[str, Any]:
+    personal_info = _personal_info(cv_data, customizations)
+    return {
         "name": personal_info.get("name", "Professional Name"),
         "title": personal_info.get("title", "Professional Title"),
         "summary": personal_info.get("summary", "Professional summary and career objectives."),
@@ -244,9 +533,13 @@ def generate_portfolio_content(cv_data: Dict[str, Any], template: Dict[str, Any]
             "website": personal_info.get("website", "")
         }
     }
-    
-    # Generate about section
-    about_section = {
+
+def build_about_section(cv_data: Dict[str, Any], template: CompiledTemplate, customizations: Dict[str, Any]) -> Dict[str, Any]:
+    personal_info = _personal_info(cv_data, customizations)
+    experience = cv_data.get("experience", [])
+    education = cv_data.get("education", [])
+    skills = cv_data.get("skills", [])
+    return {
         "description": personal_info.get("summary", "Passionate professional with extensive experience in the field."),
         "highlights": [
             f"Over {len(experience)} years of professional experience",
@@ -254,16 +547,17 @@ def generate_portfolio_content(cv_data: Dict[str, Any], template: Dict[str, Any]
             f"Graduated from {education[0].get('institution', 'Top University') if education else 'Leading Institution'}"
         ]
     }
-    
-    # Generate skills section
-    skills_section = {
+
+def build_skills_section(cv_data: Dict[str, Any], template: CompiledTemplate, customizations: Dict[str, Any]) -> Dict[str, Any]:
+    skills = cv_data.get("skills", [])
+    return {
         "technical_skills": skills[:8] if skills else ["Technical Skills"],
         "soft_skills": ["Leadership", "Communication", "Problem Solving", "Team Collaboration"],
         "certifications": cv_data.get("certifications", [])
     }
-    
-    # Generate experience section
-    experience_section = [
+
+def build_experience_section(cv_data: Dict[str, Any], template: CompiledTemplate, customizations: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [
         {
             "company": exp.get("company", "Company Name"),
             "position": exp.get("position", "Position Title"),
@@ -271,11 +565,11 @@ def generate_portfolio_content(cv_data: Dict[str, Any], template: Dict[str, Any]
             "description": exp.get("description", "Key responsibilities and achievements."),
             "achievements": exp.get("achievements", ["Notable achievement 1", "Notable achievement 2"])
         }
-        for exp in experience[:4]  # Limit to 4 most recent
+        for exp in cv_data.get("experience", [])[:4]  # Limit to 4 most recent
     ]
-    
-    # Generate projects section
-    projects_section = [
+
+def build_projects_section(cv_data: Dict[str, Any], template: CompiledTemplate, customizations: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [
         {
             "name": proj.get("name", "Project Name"),
             "description": proj.get("description", "Project description and impact."),
@@ -283,11 +577,11 @@ def generate_portfolio_content(cv_data: Dict[str, Any], template: Dict[str, Any]
             "link": proj.get("link", ""),
             "achievements": proj.get("achievements", ["Key achievement"])
         }
-        for proj in projects[:6]  # Limit to 6 projects
+        for proj in cv_data.get("projects", [])[:6]  # Limit to 6 projects
     ]
-    
-    # Generate education section
-    education_section = [
+
+def build_education_section(cv_data: Dict[str, Any], template: CompiledTemplate, customizations: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [
         {
             "institution": edu.get("institution", "Institution Name"),
             "degree": edu.get("degree", "Degree"),
@@ -296,23 +590,73 @@ def generate_portfolio_content(cv_data: Dict[str, Any], template: Dict[str, Any]
             "gpa": edu.get("gpa", ""),
             "achievements": edu.get("achievements", [])
         }
-        for edu in education
+        for edu in cv_data.get("education", [])
     ]
-    
-    # Apply customizations
-    if customizations.get("colors"):
-        template["color_scheme"].update(customizations["colors"])
-    
-    if customizations.get("layout"):
-        template["layout"].update(customizations["layout"])
-    
+
+def build_template_config(cv_data: Dict[str, Any], template: CompiledTemplate, customizations: Dict[str, Any]):
+    # Customizations are applied as an overlay; the shared template is never modified
+    return template.with_customizations(customizations)
+
+def build_customizations(cv_data: Dict[str, Any], template: CompiledTemplate, customizations: Dict[str, Any]) -> Dict[str, Any]:
+    return customizations
+
+SECTION_BUILDERS = {
+    "hero": build_hero_section,
+    "about": build_about_section,
+    "skills": build_skills_section,
+    "experience": build_experience_section,
+    "projects": build_projects_section,
+    "education": build_education_section,
+    "template_config": build_template_config,
+    "customizations": build_customizations,
+}
+
+# Customization keys each section reads. A section not listed here only
+# depends on cv_data; "*" means it changes whenever any customization does.
+SECTION_DEPENDENCIES = {
+    "hero": {"personal_info"},
+    "about": {"personal_info"},
+    "template_config": {"colors", "layout"},
+    "customizations": {"*"},
+}
+
+def affected_sections(changed_keys) -> List[str]:
+    """Return the sections that must be recomputed after the given customization keys change."""
+    if not changed_keys:
+        return []
+    return [
+        name for name in SECTION_BUILDERS
+        if "*" in SECTION_DEPENDENCIES.get(name, ()) or SECTION_DEPENDENCIES.get(name, set()) & set(changed_keys)
+    ]
+
+def regenerate_sections(
+    sections: Dict[str, Any],
+    cv_data: Dict[str, Any],
+    template: CompiledTemplate,
+    customizations: Dict[str, Any],
+    changed_keys
+):
+    """Recompute the sections affected by changed_keys.
+
+    Returns the updated sections and a dict of only the sections whose
+    content actually changed. Sections missing from the stored portfolio
+    are always generated.
+    """
+    to_build = set(affected_sections(changed_keys)) | {name for name in SECTION_BUILDERS if name not in sections}
+    updated = dict(sections)
+    changed = {}
+    for name in SECTION_BUILDERS:
+        if name not in to_build:
+            continue
+        value = SECTION_BUILDERS[name](cv_data, template, customizations)
+        if sections.get(name) != value:
+            updated[name] = value
+            changed[name] = value
+    return updated, changed
+
+def generate_portfolio_content(cv_data: Dict[str, Any], template: CompiledTemplate, customizations: Dict[str, Any]) -> Dict[str, Any]:
+    """Generate portfolio content based on CV data and template."""
     return {
-        "hero": hero_section,
-        "about": about_section,
-        "skills": skills_section,
-        "experience": experience_section,
-        "projects": projects_section,
-        "education": education_section,
-        "template_config": template,
-        "customizations": customizations
+        name: builder(cv_data, template, customizations)
+        for name, builder in SECTION_BUILDERS.items()
     }
@@ -0,0 +1,143 @@
+# Server-side rendering of portfolios into static HTML/CSS
+from html import escape
+from typing import Dict, Any, List
+
+# Shared by every template; theme colors are layered on top with CSS variables
+BASE_STYLESHEET = """*,*::before,*::after{box-sizing:border-box}
+body{margin:0;font-family:system-ui,-apple-system,"Segoe UI",Roboto,sans-serif;line-height:1.6;background:var(--background);color:var(--text)}
+main{max-width:960px;margin:0 auto;padding:2rem 1.25rem}
+section{padding:2rem 0;border-bottom:1px solid color-mix(in srgb,var(--text) 12%,transparent)}
+h1,h2,h3{line-height:1.2;margin:0 0 .5rem}
+h1{font-size:2.5rem;color:var(--primary)}
+h2{font-size:1.5rem;color:var(--secondary)}
+a{color:var(--accent)}
+ul.tags{list-style:none;padding:0;display:flex;flex-wrap:wrap;gap:.5rem}
+ul.tags li{padding:.2rem .6rem;border-radius:999px;background:color-mix(in srgb,var(--primary) 15%,transparent)}
+.item{margin-bottom:1.25rem}
+.muted{opacity:.75}
+@media (max-width:600px){h1{font-size:1.9rem}}
+"""
+
+def render_theme_stylesheet(template_config: Dict[str, Any]) -> str:
+    """Render the per-template CSS variables from the (customized) color scheme."""
+    colors = template_config.get("color_scheme", {})
+    declarations = "".join(
+        f"--{escape(str(name))}:{escape(str(value))};" for name, value in colors.items()
+    )
+    return f":root{{{declarations}}}\n"
+
+def _list_items(items: List[Any], css_class: str = "tags") -> str:
+    if not items:
+        return ""
+    return f'<ul class="{css_class}">' + "".join(f"<li>{escape(str(item))}</li>" for item in items) + "</ul>"
+
+def _render_hero(sections: Dict[str, Any]) -> str:
+    hero = sections.get("hero", {})
+    return (
+        '<section id="hero">'
+        f'<h1>{escape(str(hero.get("name", "")))}</h1>'
+        f'<p class="muted">{escape(str(hero.get("title", "")))}</p>'
+        f'<p>{escape(str(hero.get("summary", "")))}</p>'
+        "</section>"
+    )
+
+def _render_about(sections: Dict[str, Any]) -> str:
+    about = sections.get("about", {})
+    return (
+        '<section id="about"><h2>About</h2>'
+        f'<p>{escape(str(about.get("description", "")))}</p>'
+        f'{_list_items(about.get("highlights", []), "highlights")}'
+        "</section>"
+    )
+
+def _render_skills(sections: Dict[str, Any]) -> str:
+    skills = sections.get("skills", {})
+    return (
+        '<section id="skills"><h2>Skills</h2>'
+        f'{_list_items(skills.get("technical_skills", []))}'
+        f'{_list_items(skills.get("soft_skills", []))}'
+        "</section>"
+    )
+
+def _render_experience(sections: Dict[str, Any]) -> str:
+    items = "".join(
+        '<div class="item">'
+        f'<h3>{escape(str(exp.get("position", "")))} &middot; {escape(str(exp.get("company", "")))}</h3>'
+        f'<p class="muted">{escape(str(exp.get("duration", "")))}</p>'
+        f'<p>{escape(str(exp.get("description", "")))}</p>'
+        f'{_list_items(exp.get("achievements", []), "achievements")}'
+        "</div>"
+        for exp in sections.get("experience", [])
+    )
+    return f'<section id="experience"><h2>Experience</h2>{items}</section>'
+
+def _render_projects(sections: Dict[str, Any]) -> str:
+    items = "".join(
+        '<div class="item">'
+        f'<h3>{escape(str(proj.get("name", "")))}</h3>'
+        f'<p>{escape(str(proj.get("description", "")))}</p>'
+        f'{_list_items(proj.get("technologies", []))}'
+        + (f'<a href="{escape(str(proj["link"]))}" rel="noopener">View project</a>' if proj.get("link") else "")
+        + "</div>"
+        for proj in sections.get("projects", [])
+    )
+    return f'<section id="projects"><h2>Projects</h2>{items}</section>'
+
+def _render_education(sections: Dict[str, Any]) -> str:
+    items = "".join(
+        '<div class="item">'
+        f'<h3>{escape(str(edu.get("degree", "")))} {escape(str(edu.get("field", "")))}</h3>'
+        f'<p class="muted">{escape(str(edu.get("institution", "")))} &middot; {escape(str(edu.get("year", "")))}</p>'
+        "</div>"
+        for edu in sections.get("education", [])
+    )
+    return f'<section id="education"><h2>Education</h2>{items}</section>'
+
+def _render_contact(sections: Dict[str, Any]) -> str:
+    contact = sections.get("hero", {}).get("contact", {})
+    entries = "".join(
+        f"<li>{escape(str(label))}: {escape(str(value))}</li>"
+        for label, value in contact.items() if value
+    )
+    return f'<section id="contact"><h2>Contact</h2><ul>{entries}</ul></section>'
+
+# Layout section names mapped to renderers; several template sections share the projects data
+SECTION_RENDERERS = {
+    "hero": _render_hero,
+    "about": _render_about,
+    "skills": _render_skills,
+    "experience": _render_experience,
+    "projects": _render_projects,
+    "work": _render_projects,
+    "portfolio": _render_projects,
+    "education": _render_education,
+    "contact": _render_contact,
+}
+
+def render_sections_html(sections: Dict[str, Any]) -> str:
+    """Render the page body in the order given by the template layout."""
+    layout = sections.get("template_config", {}).get("layout", {})
+    order = list(layout.get("sections", [])) or ["hero", "about", "skills", "experience", "projects", "education", "contact"]
+    # Education is not part of every template layout but is always shown when present
+    if sections.get("education") and "education" not in order:
+        order.insert(max(len(order) - 1, 0), "education")
+    return "".join(SECTION_RENDERERS[name](sections) for name in order if name in SECTION_RENDERERS)
+
+def render_portfolio_html(title: str, sections: Dict[str, Any], inline_styles: bool = True) -> str:
+    """Render a complete static HTML page for a portfolio.
+
+    With inline_styles the stylesheets are embedded so the page is a single
+    file; otherwise it links to assets/base.css and assets/theme.css.
+    """
+    template_config = sections.get("template_config", {})
+    if inline_styles:
+        styles = f"<style>{BASE_STYLESHEET}{render_theme_stylesheet(template_config)}</style>"
+    else:
+        styles = '<link rel="stylesheet" href="assets/base.css"><link rel="stylesheet" href="assets/theme.css">'
+    return (
+        "<!DOCTYPE html>"
+        '<html lang="en"><head><meta charset="utf-8">'
+        '<meta name="viewport" content="width=device-width,initial-scale=1">'
+        f"<title>{escape(title)}</title>{styles}</head>"
+        f"<body><main>{render_sections_html(sections)}</main></body></html>"
+    )
@@ -0,0 +1,72 @@
+# Database persistence for generated portfolios
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+from datetime import datetime
+from typing import Dict, Any, Optional
+from models import Portfolio
+
+def create_portfolio(
+    db: Session,
+    public_id: str,
+    user_id: int,
+    title: str,
+    template_id: str,
+    cv_data: Dict[str, Any],
+    customizations: Dict[str, Any],
+    sections: Dict[str, Any],
+) -> Portfolio:
+    """Insert a new portfolio row and return it."""
+    portfolio = Portfolio(
+        public_id=public_id,
+        user_id=user_id,
+        title=title,
+        template_name=template_id,
+        cv_data=cv_data,
+        customizations=customizations,
+        sections=sections,
+        version=1,
+    )
+    db.add(portfolio)
+    db.commit()
+    db.refresh(portfolio)
+    return portfolio
+
+def get_portfolio(db: Session, public_id: str) -> Optional[Portfolio]:
+    """Load a portfolio by its public ID, always reading the latest committed row."""
+    return (
+        db.query(Portfolio)
+        .filter(Portfolio.public_id == public_id)
+        .populate_existing()
+        .first()
+    )
+
+def update_portfolio(db: Session, portfolio: Portfolio, **values) -> bool:
+    """Write only the given columns if nobody else has updated the portfolio since it was read.
+
+    The UPDATE is conditional on the version the caller loaded, so a concurrent
+    writer makes this return False instead of silently overwriting its changes.
+    Callers should reload the portfolio and retry.
+    """
+    result = db.execute(
+        update(Portfolio)
+        .where(Portfolio.id == portfolio.id, Portfolio.version == portfolio.version)
+        .values(version=Portfolio.version + 1, updated_at=datetime.utcnow(), **values)
+    )
+    db.commit()
+    return result.rowcount == 1
+
+def portfolio_to_dict(portfolio: Portfolio, template_info: Dict[str, Any]) -> Dict[str, Any]:
+    """Build the API representation of a stored portfolio."""
+    return {
+        "id": portfolio.public_id,
+        "template_id": portfolio.template_name,
+        "template_info": template_info,
+        "cv_data": portfolio.cv_data,
+        "customizations": portfolio.customizations or {},
+        "sections": portfolio.sections or {},
+        "is_public": portfolio.is_public,
+        "version": portfolio.version,
+        "created_at": portfolio.created_at.isoformat() if portfolio.created_at else None,
+        "updated_at": portfolio.updated_at.isoformat() if portfolio.updated_at else None,
+        "status": "generated"
+    }
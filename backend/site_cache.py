@@ -0,0 +1,151 @@
+# Cache of rendered static sites for published portfolios
+import json
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Optional
+from http_cache import make_etag, compress_variants
+from storage_utils import shard_directory
+
+SITE_DIR = "rendered_sites"
+SITE_CACHE_SIZE = int(os.getenv("SITE_CACHE_SIZE", "1024"))
+
+# File suffix of each stored variant, keyed by content coding ("identity" is uncompressed)
+VARIANT_SUFFIXES = {"identity": "html", "gzip": "html.gz", "br": "html.br"}
+
+class RenderedSite:
+    """A rendered portfolio page with its precompressed variants."""
+    __slots__ = ("public_id", "version", "etag", "bodies", "meta_mtime")
+
+    def __init__(self, public_id: str, version: int, etag: str, bodies: Dict[str, bytes], meta_mtime: int = 0):
+        self.public_id = public_id
+        self.version = version
+        self.etag = etag
+        self.bodies = bodies
+        self.meta_mtime = meta_mtime
+
+class SiteCache:
+    """Rendered sites stored on disk, with a bounded in-memory LRU in front.
+
+    The meta file written last is the commit point for a render: a site is
+    only visible once its meta file points at complete variant files. Memory
+    entries are revalidated with a stat of the meta file, so a re-render or
+    unpublish done by another worker process is picked up on the next request.
+    """
+
+    def __init__(self, root: str = SITE_DIR, max_entries: int = SITE_CACHE_SIZE):
+        self.root = root
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, RenderedSite]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _meta_path(self, public_id: str) -> str:
+        return os.path.join(shard_directory(self.root, public_id), f"{public_id}.json")
+
+    def _variant_path(self, public_id: str, etag: str, coding: str) -> str:
+        # Variant files are named after the render's ETag so a new render never overwrites files being read
+        tag = etag.strip('"')[:16]
+        return os.path.join(shard_directory(self.root, public_id), f"{public_id}.{tag}.{VARIANT_SUFFIXES[coding]}")
+
+    def _remember(self, site: RenderedSite):
+        with self._lock:
+            self._entries[site.public_id] = site
+            self._entries.move_to_end(site.public_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _forget(self, public_id: str):
+        with self._lock:
+            self._entries.pop(public_id, None)
+
+    def store(self, public_id: str, version: int, html: str) -> RenderedSite:
+        """Store a freshly rendered page and its gzip/brotli variants."""
+        body = html.encode("utf-8")
+        etag = make_etag(body)
+        bodies = {"identity": body, **compress_variants(body)}
+        directory = shard_directory(self.root, public_id)
+        os.makedirs(directory, exist_ok=True)
+
+        old_meta = self._read_meta(public_id)
+        for coding, data in bodies.items():
+            path = self._variant_path(public_id, etag, coding)
+            with open(path + ".tmp", "wb") as f:
+                f.write(data)
+            os.replace(path + ".tmp", path)
+
+        meta_path = self._meta_path(public_id)
+        meta = {
+            "public_id": public_id,
+            "version": version,
+            "etag": etag,
+            "encodings": sorted(bodies),
+            "rendered_at": datetime.utcnow().isoformat()
+        }
+        with open(meta_path + ".tmp", "w") as f:
+            json.dump(meta, f)
+        os.replace(meta_path + ".tmp", meta_path)
+
+        # Remove the previous render's files now that the new meta is in place
+        if old_meta and old_meta.get("etag") != etag:
+            self._remove_variants(public_id, old_meta)
+
+        site = RenderedSite(public_id, version, etag, bodies, os.stat(meta_path).st_mtime_ns)
+        self._remember(site)
+        return site
+
+    def _read_meta(self, public_id: str) -> Optional[dict]:
+        try:
+            with open(self._meta_path(public_id), "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _remove_variants(self, public_id: str, meta: dict):
+        for coding in meta.get("encodings", []):
+            try:
+                os.remove(self._variant_path(public_id, meta["etag"], coding))
+            except (OSError, KeyError):
+                pass
+
+    def get(self, public_id: str) -> Optional[RenderedSite]:
+        """Return the rendered site for a published portfolio, or None if it is not cached."""
+        try:
+            meta_mtime = os.stat(self._meta_path(public_id)).st_mtime_ns
+        except OSError:
+            self._forget(public_id)
+            return None
+
+        with self._lock:
+            site = self._entries.get(public_id)
+            if site is not None and site.meta_mtime == meta_mtime:
+                self._entries.move_to_end(public_id)
+                return site
+
+        meta = self._read_meta(public_id)
+        if not meta:
+            return None
+        bodies = {}
+        try:
+            for coding in meta["encodings"]:
+                with open(self._variant_path(public_id, meta["etag"], coding), "rb") as f:
+                    bodies[coding] = f.read()
+        except (OSError, KeyError):
+            # A concurrent re-render replaced the files; treat it as a miss
+            return None
+        site = RenderedSite(public_id, meta["version"], meta["etag"], bodies, meta_mtime)
+        self._remember(site)
+        return site
+
+    def invalidate(self, public_id: str):
+        """Drop a site from memory and disk, e.g. when it is unpublished."""
+        meta = self._read_meta(public_id)
+        try:
+            os.remove(self._meta_path(public_id))
+        except OSError:
+            pass
+        if meta:
+            self._remove_variants(public_id, meta)
+        self._forget(public_id)
+
+site_cache = SiteCache()
@@ -0,0 +1,135 @@
+# Streaming zip export of a portfolio as a self-hostable static site
+import json
+import struct
+import time
+import zlib
+from functools import lru_cache
+from typing import Dict, Any, Iterable, Iterator, List, Tuple
+from portfolio_renderer import BASE_STYLESHEET, render_theme_stylesheet, render_portfolio_html
+
+CHUNK_SIZE = 64 * 1024
+
+_DEFLATED = 8
+_FLAG_DATA_DESCRIPTOR = 0x08
+_FLAG_UTF8 = 0x800
+_ZIP32_LIMIT = 0xFFFFFFFF
+
+def _dos_timestamp(timestamp: float) -> Tuple[int, int]:
+    t = time.localtime(timestamp)
+    dos_time = (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2)
+    dos_date = ((max(t.tm_year, 1980) - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+    return dos_time, dos_date
+
+def _raw_deflate():
+    # Negative wbits produce a raw deflate stream, which is what zip entries contain
+    return zlib.compressobj(6, zlib.DEFLATED, -15)
+
+class CompressedEntry:
+    """A file whose deflated bytes are computed once and reused by every export."""
+    __slots__ = ("data", "crc", "size")
+
+    def __init__(self, content: bytes):
+        compressor = _raw_deflate()
+        self.data = compressor.compress(content) + compressor.flush()
+        self.crc = zlib.crc32(content)
+        self.size = len(content)
+
+class ZipStreamWriter:
+    """Builds a zip archive incrementally, yielding bytes as each entry is written.
+
+    Only the central directory records (a few dozen bytes per entry) are kept
+    in memory, so the archive size is not bounded by worker memory. Entries
+    with unknown size are written with a trailing data descriptor, so the
+    output never has to be seeked back into.
+    """
+
+    def __init__(self):
+        self._offset = 0
+        self._central_directory: List[bytes] = []
+        self._timestamp = _dos_timestamp(time.time())
+
+    def _emit(self, data: bytes) -> bytes:
+        self._offset += len(data)
+        return data
+
+    def _local_header(self, name: bytes, flags: int, crc: int, compressed_size: int, size: int) -> bytes:
+        dos_time, dos_date = self._timestamp
+        return struct.pack(
+            "<IHHHHHIIIHH", 0x04034B50, 20, flags, _DEFLATED, dos_time, dos_date,
+            crc, compressed_size, size, len(name), 0
+        ) + name
+
+    def _record(self, name: bytes, flags: int, crc: int, compressed_size: int, size: int, header_offset: int):
+        if max(compressed_size, size, header_offset) > _ZIP32_LIMIT:
+            raise ValueError("Export exceeds the 4 GB zip32 limit")
+        dos_time, dos_date = self._timestamp
+        self._central_directory.append(struct.pack(
+            "<IHHHHHHIIIHHHHHII", 0x02014B50, 20, 20, flags, _DEFLATED, dos_time, dos_date,
+            crc, compressed_size, size, len(name), 0, 0, 0, 0, 0o644 << 16, header_offset
+        ) + name)
+
+    def add_compressed(self, name: str, entry: CompressedEntry) -> Iterator[bytes]:
+        """Write an entry from precomputed deflated bytes without recompressing it."""
+        encoded_name = name.encode("utf-8")
+        header_offset = self._offset
+        yield self._emit(self._local_header(encoded_name, _FLAG_UTF8, entry.crc, len(entry.data), entry.size))
+        yield self._emit(entry.data)
+        self._record(encoded_name, _FLAG_UTF8, entry.crc, len(entry.data), entry.size, header_offset)
+
+    def add_stream(self, name: str, chunks: Iterable[bytes]) -> Iterator[bytes]:
+        """Compress and write an entry chunk by chunk."""
+        encoded_name = name.encode("utf-8")
+        flags = _FLAG_UTF8 | _FLAG_DATA_DESCRIPTOR
+        header_offset = self._offset
+        yield self._emit(self._local_header(encoded_name, flags, 0, 0, 0))
+        compressor = _raw_deflate()
+        crc = size = compressed_size = 0
+        for chunk in chunks:
+            crc = zlib.crc32(chunk, crc)
+            size += len(chunk)
+            data = compressor.compress(chunk)
+            if data:
+                compressed_size += len(data)
+                yield self._emit(data)
+        data = compressor.flush()
+        compressed_size += len(data)
+        yield self._emit(data)
+        yield self._emit(struct.pack("<IIII", 0x08074B50, crc, compressed_size, size))
+        self._record(encoded_name, flags, crc, compressed_size, size, header_offset)
+
+    def finish(self) -> Iterator[bytes]:
+        """Write the central directory and end-of-archive record."""
+        directory_offset = self._offset
+        directory = b"".join(self._central_directory)
+        yield self._emit(directory)
+        count = len(self._central_directory)
+        yield self._emit(struct.pack(
+            "<IHHHHIIH", 0x06054B50, 0, 0, count, count, len(directory), directory_offset, 0
+        ))
+
+def _chunked(content: str) -> Iterator[bytes]:
+    data = content.encode("utf-8")
+    for start in range(0, len(data), CHUNK_SIZE):
+        yield data[start:start + CHUNK_SIZE]
+
+@lru_cache(maxsize=1)
+def shared_assets() -> Dict[str, CompressedEntry]:
+    """Assets identical for every template and portfolio, compressed once per process."""
+    readme = (
+        "This folder is a static export of your PORTMAN portfolio.\n"
+        "Upload its contents to any static web host, or open index.html locally.\n"
+    )
+    return {
+        "assets/base.css": CompressedEntry(BASE_STYLESHEET.encode("utf-8")),
+        "README.txt": CompressedEntry(readme.encode("utf-8")),
+    }
+
+def stream_site_zip(title: str, sections: Dict[str, Any]) -> Iterator[bytes]:
+    """Yield a zip archive of the portfolio's static site, one chunk at a time."""
+    writer = ZipStreamWriter()
+    yield from writer.add_stream("index.html", _chunked(render_portfolio_html(title, sections, inline_styles=False)))
+    yield from writer.add_stream("assets/theme.css", _chunked(render_theme_stylesheet(sections.get("template_config", {}))))
+    for name, entry in shared_assets().items():
+        yield from writer.add_compressed(name, entry)
+    yield from writer.add_stream("data/portfolio.json", _chunked(json.dumps(sections)))
+    yield from writer.finish()
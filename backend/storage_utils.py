@@ -0,0 +1,96 @@
+# Artifact ID generation and sharded on-disk storage for generated files
+import hashlib
+import os
+import re
+import secrets
+import threading
+import time
+
+# Crockford base32, as used by ULIDs: sortable and free of ambiguous characters
+_CROCKFORD_ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+_RANDOM_BITS = 80
+_ID_LENGTH = 26
+
+# Generated IDs are embedded in file paths, so only allow a safe character set
+_SAFE_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,128}$")
+
+_id_lock = threading.Lock()
+_last_timestamp_ms = 0
+_last_random = 0
+
+def _encode_crockford(value: int, length: int) -> str:
+    chars = []
+    for _ in range(length):
+        value, remainder = divmod(value, 32)
+        chars.append(_CROCKFORD_ALPHABET[remainder])
+    return "".join(reversed(chars))
+
+def new_artifact_id(prefix: str) -> str:
+    """Return a unique, time-sortable ID (ULID-style) such as ``ats_01J9Z...``.
+
+    The first 48 bits are the millisecond timestamp and the remaining 80 bits
+    are random. IDs generated in the same millisecond by this process are
+    strictly increasing, so they never collide and always sort in creation order.
+    """
+    global _last_timestamp_ms, _last_random
+    with _id_lock:
+        timestamp_ms = int(time.time() * 1000)
+        if timestamp_ms <= _last_timestamp_ms:
+            timestamp_ms = _last_timestamp_ms
+            _last_random += 1
+            if _last_random >= 1 << _RANDOM_BITS:
+                # Random component exhausted within one millisecond: borrow the next one
+                timestamp_ms += 1
+                _last_random = secrets.randbits(_RANDOM_BITS)
+        else:
+            _last_random = secrets.randbits(_RANDOM_BITS)
+        _last_timestamp_ms = timestamp_ms
+        value = (timestamp_ms << _RANDOM_BITS) | _last_random
+    return f"{prefix}_{_encode_crockford(value, _ID_LENGTH)}"
+
+def is_safe_artifact_id(artifact_id: str) -> bool:
+    """Check that an ID taken from a request can be used as a file name."""
+    return bool(_SAFE_ID_PATTERN.match(artifact_id or ""))
+
+def shard_directory(root: str, artifact_id: str) -> str:
+    """Return the two-level shard directory for an artifact, e.g. ``root/3f/a2``.
+
+    Shards are derived from a hash of the ID rather than its timestamp prefix,
+    so artifacts created at the same time spread evenly over 65536 directories.
+    """
+    digest = hashlib.sha1(artifact_id.encode("utf-8")).hexdigest()
+    return os.path.join(root, digest[:2], digest[2:4])
+
+def artifact_path(root: str, artifact_id: str, extension: str, create_dirs: bool = False) -> str:
+    """Return the sharded path of an artifact file, optionally creating its directory."""
+    directory = shard_directory(root, artifact_id)
+    if create_dirs:
+        os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, f"{artifact_id}.{extension}")
+
+def legacy_artifact_path(root: str, artifact_id: str, extension: str) -> str:
+    """Return the pre-sharding flat path of an artifact file."""
+    return os.path.join(root, f"{artifact_id}.{extension}")
+
+def find_artifact(root: str, artifact_id: str, extension: str):
+    """Locate an artifact, falling back to the flat layout for files not yet migrated.
+
+    Returns the path of the existing file, or None if it does not exist.
+    """
+    if not is_safe_artifact_id(artifact_id):
+        return None
+    path = artifact_path(root, artifact_id, extension)
+    if os.path.exists(path):
+        return path
+    legacy_path = legacy_artifact_path(root, artifact_id, extension)
+    if os.path.exists(legacy_path):
+        return legacy_path
+    return None
+
+def count_artifacts(root: str, extension: str) -> int:
+    """Count stored artifacts with the given extension, in shard directories and the legacy flat layout."""
+    suffix = f".{extension}"
+    total = 0
+    for _, _, files in os.walk(root):
+        total += sum(1 for name in files if name.endswith(suffix))
+    return total
@@ -7,7 +7,9 @@ import psutil
 import datetime
 import json
 import socket
+import time
 from pathlib import Path
+from storage_utils import count_artifacts
 
 router = APIRouter(prefix="/system", tags=["system"])
 
@@ -326,19 +328,35 @@ def portfolio_health():
         health_data["checks"]["portfolio_module"] = {"status": "error", "error": str(e)}
         health_data["status"] = "error"
     
-    # Check generated portfolio count
+    # Check generated portfolio count (portfolios are stored in the database)
     try:
-        portfolio_count = len(list(portfolio_dir.glob("*.html"))) if portfolio_dir.exists() else 0
+        from models import Portfolio
+        db = SessionLocal()
+        try:
+            portfolio_count = db.query(Portfolio).count()
+        finally:
+            db.close()
         health_data["checks"]["generated_portfolios"] = {
             "status": "ok",
             "count": portfolio_count,
-            "directory_exists": portfolio_dir.exists()
+            "storage": "database"
         }
     except Exception as e:
         health_data["checks"]["generated_portfolios"] = {"status": "error", "error": str(e)}
     
     return health_data
 
+# Counting resumes walks every shard directory, so the total is reused for this many seconds
+RESUME_COUNT_TTL = 300
+_resume_count_cache = {"counted_at": 0.0, "count": 0}
+
+def _resume_count(ats_dir: Path) -> int:
+    now = time.monotonic()
+    if now - _resume_count_cache["counted_at"] >= RESUME_COUNT_TTL:
+        _resume_count_cache["count"] = count_artifacts(str(ats_dir), "docx")
+        _resume_count_cache["counted_at"] = now
+    return _resume_count_cache["count"]
+
 @router.get("/ats")
 def ats_health():
     """Detailed ATS Resume service health check"""
@@ -381,12 +399,12 @@ def ats_health():
         health_data["checks"]["ats_module"] = {"status": "error", "error": str(e)}
         health_data["status"] = "error"
     
-    # Check generated resume count
+    # Check generated resume count (walking the shards is cached, see _resume_count)
     try:
-        resume_count = len(list(ats_dir.glob("*.docx"))) if ats_dir.exists() else 0
         health_data["checks"]["generated_resumes"] = {
             "status": "ok",
-            "count": resume_count,
+            "count": _resume_count(ats_dir) if ats_dir.exists() else 0,
+            "layout": "sharded",
             "directory_exists": ats_dir.exists()
         }
     except Exception as e:
@@ -475,6 +493,15 @@ def users_health():
         }
         health_data["status"] = "error"
     
+    # Check password hashing pool saturation
+    try:
+        from auth_utils import password_pool
+        pool_stats = password_pool.stats()
+        pool_status = "warning" if pool_stats["queued"] >= pool_stats["queue_limit"] // 2 else "ok"
+        health_data["checks"]["password_hash_pool"] = {"status": pool_status, **pool_stats}
+    except Exception as e:
+        health_data["checks"]["password_hash_pool"] = {"status": "error", "error": str(e)}
+    
     return health_data
 
 @router.get("/ai")
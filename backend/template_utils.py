@@ -0,0 +1,70 @@
+# Immutable portfolio templates with copy-on-write customization overlays
+from typing import Dict, Any, Mapping
+
+# Customization keys and the template section each one overrides
+OVERLAY_KEYS = {
+    "colors": "color_scheme",
+    "layout": "layout",
+}
+
+def invalid_overlay_keys(customizations: Dict[str, Any]) -> list:
+    """Overlay customizations whose value is not an object, and so cannot be merged into a template section."""
+    return [
+        key for key in OVERLAY_KEYS
+        if (customizations or {}).get(key) is not None and not isinstance(customizations[key], dict)
+    ]
+
+class FrozenDict(dict):
+    """A dict that refuses modification.
+
+    It subclasses dict so it still serializes with json, SQLAlchemy JSON
+    columns and FastAPI responses, but any attempt to change a shared
+    template raises instead of leaking into other requests.
+    """
+    __slots__ = ()
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("Compiled templates are read-only; use CompiledTemplate.with_customizations()")
+
+    __setitem__ = __delitem__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+    __ior__ = _readonly
+
+    def __reduce__(self):
+        return (FrozenDict, (dict(self),))
+
+def freeze(value: Any) -> Any:
+    """Recursively convert dicts to FrozenDict and lists to tuples."""
+    if isinstance(value, dict):
+        return FrozenDict((key, freeze(item)) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    return value
+
+class CompiledTemplate:
+    """A read-only template that is compiled once and shared by every request."""
+    __slots__ = ("template_id", "config")
+
+    def __init__(self, template_id: str, config: Dict[str, Any]):
+        self.template_id = template_id
+        self.config = freeze(config)
+
+    def with_customizations(self, customizations: Dict[str, Any]) -> Mapping[str, Any]:
+        """Return the template with per-portfolio customizations applied.
+
+        Only the top-level mapping and the overridden sections are copied;
+        everything else is shared with the compiled template. Without any
+        applicable customization the compiled config itself is returned.
+        """
+        overrides = {}
+        for customization_key, section in OVERLAY_KEYS.items():
+            values = (customizations or {}).get(customization_key)
+            if values:
+                overrides[section] = FrozenDict({**self.config.get(section, {}), **freeze(values)})
+        if not overrides:
+            return self.config
+        return FrozenDict({**self.config, **overrides})
+
+def compile_templates(templates: Dict[str, Dict[str, Any]]) -> Dict[str, CompiledTemplate]:
+    """Compile a template catalog into immutable CompiledTemplate objects."""
+    return {template_id: CompiledTemplate(template_id, config) for template_id, config in templates.items()}
@@ -0,0 +1,212 @@
+# Bulk user provisioning from CSV or NDJSON files
+import asyncio
+import csv
+import io
+import json
+import os
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from sqlalchemy import insert, or_, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from auth_utils import get_password_hash, password_pool, pwd_context
+from models import User
+
+IMPORT_CHUNK_SIZE = int(os.getenv("USER_IMPORT_CHUNK_SIZE", "1000"))
+MAX_IMPORT_ROWS = int(os.getenv("USER_IMPORT_MAX_ROWS", "50000"))
+# Rows reported individually in the response; the counts always cover every row
+MAX_REPORTED_ERRORS = 1000
+
+# Columns accepted in an import file besides email/username/password/password_hash
+OPTIONAL_COLUMNS = ("full_name", "phone", "address")
+FLAG_COLUMNS = ("is_active", "is_premium")
+
+class ImportRowError(ValueError):
+    pass
+
+def _parse_flag(value: Any, column: str) -> bool:
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in ("1", "true", "yes", "y"):
+        return True
+    if text in ("0", "false", "no", "n"):
+        return False
+    raise ImportRowError(f"Invalid value for {column}: {value!r}")
+
+def read_rows(content: bytes, file_format: str) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """Yield (row number, fields) from a CSV file with a header row or from NDJSON."""
+    text = content.decode("utf-8-sig")
+    if file_format == "csv":
+        reader = csv.DictReader(io.StringIO(text))
+        # Row numbers match what a spreadsheet shows, the header being row 1
+        for row_number, row in enumerate(reader, start=2):
+            yield row_number, {key.strip().lower(): value for key, value in row.items() if key}
+    else:
+        for row_number, line in enumerate(text.splitlines(), start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                yield row_number, None
+                continue
+            yield row_number, row if isinstance(row, dict) else None
+
+def validate_row(row: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Turn an import row into users column values, raising ImportRowError if it is unusable."""
+    if row is None:
+        raise ImportRowError("Row is not a JSON object")
+    email = str(row.get("email") or "").strip()
+    if "@" not in email or email.startswith("@") or email.endswith("@"):
+        raise ImportRowError("Missing or invalid email")
+    username = str(row.get("username") or "").strip() or email.split("@")[0]
+    values = {"username": username, "email": email}
+
+    password = row.get("password")
+    password_hash = row.get("password_hash")
+    if password_hash:
+        # Pre-hashed passwords (e.g. exported from another system) skip hashing entirely
+        if pwd_context.identify(password_hash) is None:
+            raise ImportRowError("password_hash is not a supported hash format")
+        values["hashed_password"] = password_hash
+    elif password:
+        if len(str(password)) < 6:
+            raise ImportRowError("Password must be at least 6 characters")
+        values["password"] = str(password)
+    else:
+        raise ImportRowError("Either password or password_hash is required")
+
+    for column in OPTIONAL_COLUMNS:
+        if row.get(column):
+            values[column] = str(row[column]).strip()
+    for column in FLAG_COLUMNS:
+        if row.get(column) not in (None, ""):
+            values[column] = _parse_flag(row[column], column)
+    return values
+
+def find_existing(db: Session, usernames: List[str], emails: List[str]) -> Tuple[set, set]:
+    """Return the usernames and emails that are already taken, one query per chunk of candidates."""
+    taken_usernames, taken_emails = set(), set()
+    for start in range(0, max(len(usernames), len(emails)), IMPORT_CHUNK_SIZE):
+        username_chunk = usernames[start:start + IMPORT_CHUNK_SIZE]
+        email_chunk = emails[start:start + IMPORT_CHUNK_SIZE]
+        rows = db.execute(
+            select(User.username, User.email)
+            .where(or_(User.username.in_(username_chunk), User.email.in_(email_chunk)))
+        ).all()
+        for username, email in rows:
+            taken_usernames.add(username)
+            taken_emails.add(email)
+    return taken_usernames, taken_emails
+
+async def hash_passwords(rows: List[Dict[str, Any]]) -> None:
+    """Hash plain-text passwords on the shared password pool, a few jobs per worker at a time.
+
+    Submitting a window at a time keeps the pool's queue short, so logins
+    are not rejected while a large import is running.
+    """
+    pending = [row for row in rows if "password" in row]
+    window = password_pool.workers * 2
+    for start in range(0, len(pending), window):
+        batch = pending[start:start + window]
+        hashes = await asyncio.gather(*(password_pool.run(get_password_hash, row["password"]) for row in batch))
+        for row, hashed in zip(batch, hashes):
+            row["hashed_password"] = hashed
+            del row["password"]
+
+def insert_users(db: Session, rows: List[Tuple[int, Dict[str, Any]]]) -> List[Tuple[int, Dict[str, Any], str]]:
+    """Insert users in chunked multi-row INSERTs, one transaction per chunk.
+
+    If a chunk is rejected (e.g. someone registered one of the names since
+    the duplicate check), its rows are retried one by one so only the
+    conflicting rows fail. Returns (row number, values, error) for failures.
+    """
+    failures = []
+    now = datetime.utcnow()
+    for start in range(0, len(rows), IMPORT_CHUNK_SIZE):
+        chunk = rows[start:start + IMPORT_CHUNK_SIZE]
+        params = [{"created_at": now, "is_active": True, "is_admin": False, "is_premium": False, **values} for _, values in chunk]
+        try:
+            db.execute(insert(User), params)
+            db.commit()
+            continue
+        except IntegrityError:
+            db.rollback()
+        for (row_number, values), row_params in zip(chunk, params):
+            try:
+                db.execute(insert(User), [row_params])
+                db.commit()
+            except IntegrityError:
+                db.rollback()
+                failures.append((row_number, values, "Username or email already registered"))
+    return failures
+
+def prepare_import(db: Session, content: bytes, file_format: str) -> Tuple[int, List[Tuple[int, Dict[str, Any]]], List[Dict[str, Any]]]:
+    """Parse, validate and de-duplicate an import file against itself and the users table.
+
+    Returns the row count, the rows that can be created and the per-row errors.
+    """
+    errors = []
+    candidates: List[Tuple[int, Dict[str, Any]]] = []
+    seen_usernames, seen_emails = set(), set()
+    total = 0
+
+    def fail(row_number, row, message):
+        errors.append({"row": row_number, "email": (row or {}).get("email"), "error": message})
+
+    for row_number, row in read_rows(content, file_format):
+        total += 1
+        if total > MAX_IMPORT_ROWS:
+            raise ImportRowError(f"Import files are limited to {MAX_IMPORT_ROWS} rows")
+        try:
+            values = validate_row(row)
+        except ImportRowError as e:
+            fail(row_number, row, str(e))
+            continue
+        if values["username"] in seen_usernames or values["email"] in seen_emails:
+            fail(row_number, row, "Duplicate username or email within the file")
+            continue
+        seen_usernames.add(values["username"])
+        seen_emails.add(values["email"])
+        candidates.append((row_number, values))
+
+    taken_usernames, taken_emails = find_existing(
+        db, [values["username"] for _, values in candidates], [values["email"] for _, values in candidates]
+    )
+    new_rows = []
+    for row_number, values in candidates:
+        if values["username"] in taken_usernames or values["email"] in taken_emails:
+            fail(row_number, values, "Username or email already registered")
+        else:
+            new_rows.append((row_number, values))
+    return total, new_rows, errors
+
+async def import_users(db: Session, content: bytes, file_format: str, dry_run: bool = False) -> Dict[str, Any]:
+    """Validate, de-duplicate, hash and insert the users in an import file and report per-row errors.
+
+    Parsing, the duplicate queries and the INSERTs are blocking, so they run in
+    the threadpool; password hashing runs on the password pool. The event loop
+    stays free for other requests throughout a large import.
+    """
+    total, new_rows, errors = await run_in_threadpool(prepare_import, db, content, file_format)
+
+    created = 0
+    if not dry_run and new_rows:
+        await hash_passwords([values for _, values in new_rows])
+        failures = await run_in_threadpool(insert_users, db, new_rows)
+        for row_number, values, message in failures:
+            errors.append({"row": row_number, "email": values.get("email"), "error": message})
+        created = len(new_rows) - len(failures)
+
+    errors.sort(key=lambda error: error["row"])
+    return {
+        "total_rows": total,
+        "created": created,
+        "valid": len(new_rows),
+        "failed": len(errors),
+        "dry_run": dry_run,
+        "errors": errors[:MAX_REPORTED_ERRORS],
+        "errors_truncated": len(errors) > MAX_REPORTED_ERRORS,
+    }
@@ -1,19 +1,35 @@
 # Handles user registration, login, and profile endpoints (stubs)
-from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, UploadFile, File, status
+from fastapi.responses import StreamingResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from datetime import datetime, timedelta
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
+import csv
 import os
 import secrets
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from pydantic import BaseModel
-from auth_utils import verify_password, get_password_hash, create_access_token, get_current_user, get_current_admin_user
+from auth_utils import (
+    create_access_token, get_current_user, get_current_admin_user, invalidate_cached_user,
+    get_password_hash_async, verify_and_update_password
+)
 import json
 
 # Import database components directly to avoid circular imports
-from models import User
+from models import User, UploadedFile, CVProfile
+from cv_profile_store import (
+    CV_DOCUMENT_FIELDS,
+    get_current_cv_profile,
+    get_cv_profile_version,
+    list_cv_profile_versions,
+    save_cv_profile,
+    cv_profile_to_dict,
+    diff_cv_profiles,
+)
+from user_import import ImportRowError, import_users
+from analytics_events import EVENT_LOGIN, EVENT_USER_REGISTERED, record_event
 from database import SessionLocal
 
 def get_db():
@@ -43,6 +59,12 @@ class ResetPasswordRequest(BaseModel):
 
 class UpdateProfileWithCVRequest(BaseModel):
     parsed_data: Dict[str, Any]
+    file_id: Optional[int] = None  # uploaded CV the data was parsed from
+
+class AdminUserUpdateRequest(BaseModel):
+    is_active: Optional[bool] = None
+    is_admin: Optional[bool] = None
+    is_premium: Optional[bool] = None
 
 def generate_reset_token():
     """Generate a secure random token for password reset"""
@@ -98,43 +120,54 @@ def send_reset_email(email: str, reset_token: str):
     
     return True  # Mock success
 
+async def check_password(db, user: User, password: str) -> bool:
+    """Verify a login password, upgrading the stored hash if its cost factor is outdated"""
+    valid, new_hash = await verify_and_update_password(password, user.hashed_password)
+    if valid and new_hash:
+        user.hashed_password = new_hash
+        db.commit()
+    return valid
+
 @router.post("/register/", status_code=201)
-async def register_user(payload: RegisterRequest, db=Depends(get_db)):
+async def register_user(payload: RegisterRequest, request: Request, db=Depends(get_db)):
     # Use email as username if username not provided
     username = payload.username or payload.email.split("@")[0]
     user = db.query(User).filter((User.username == username) | (User.email == payload.email)).first()
     if user:
         raise HTTPException(status_code=400, detail="Username or email already registered")
-    hashed_password = get_password_hash(payload.password)
+    hashed_password = await get_password_hash_async(payload.password)
     new_user = User(username=username, email=payload.email, hashed_password=hashed_password)
     db.add(new_user)
     db.commit()
     db.refresh(new_user)
+    record_event(EVENT_USER_REGISTERED, new_user.id, request=request)
     return {"username": new_user.username, "email": new_user.email, "registered": True}
 
 @router.post("/login/")
-async def login_user(payload: LoginRequest, db=Depends(get_db)):
+async def login_user(payload: LoginRequest, request: Request, db=Depends(get_db)):
     user = db.query(User).filter(User.email == payload.email).first()
-    if not user or not verify_password(payload.password, user.hashed_password):
+    if not user or not await check_password(db, user, payload.password):
         raise HTTPException(status_code=401, detail="Incorrect credentials")
     access_token = create_access_token(data={"sub": user.username})
+    record_event(EVENT_LOGIN, user.id, request=request)
     return {"access_token": access_token, "token_type": "bearer", "user": {"email": user.email, "name": user.username}}
 
 @router.post("/token")
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db=Depends(get_db)):
+async def login_for_access_token(request: Request, form_data: OAuth2PasswordRequestForm = Depends(), db=Depends(get_db)):
     """OAuth2 compatible token endpoint for Swagger UI"""
     # Try to find user by username or email
     user = db.query(User).filter(
         (User.username == form_data.username) | (User.email == form_data.username)
     ).first()
     
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    if not user or not await check_password(db, user, form_data.password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
     access_token = create_access_token(data={"sub": user.username})
+    record_event(EVENT_LOGIN, user.id, request=request)
     return {"access_token": access_token, "token_type": "bearer"}
 
 @router.get("/me/")
@@ -205,28 +238,180 @@ async def reset_password(payload: ResetPasswordRequest, db=Depends(get_db)):
         )
     
     # Update password and clear reset token
-    user.hashed_password = get_password_hash(payload.new_password)
+    user.hashed_password = await get_password_hash_async(payload.new_password)
     user.reset_token = None
     user.reset_token_expires_at = None
     db.commit()
+    invalidate_cached_user(user.username)
     
     return {"message": "Password has been reset successfully. You can now log in with your new password."}
 
+# Only these columns are loaded for listings; CV data is never read
+ADMIN_LIST_COLUMNS = (
+    User.id, User.username, User.email, User.is_active, User.is_admin,
+    User.is_premium, User.created_at, User.last_login
+)
+ADMIN_LIST_MAX_LIMIT = 1000
+EXPORT_BATCH_SIZE = 1000
+
+def _admin_user_query(db, is_active, is_admin, is_premium, created_after, created_before):
+    query = db.query(*ADMIN_LIST_COLUMNS)
+    if is_active is not None:
+        query = query.filter(User.is_active == is_active)
+    if is_admin is not None:
+        query = query.filter(User.is_admin == is_admin)
+    if is_premium is not None:
+        query = query.filter(User.is_premium == is_premium)
+    if created_after is not None:
+        query = query.filter(User.created_at >= created_after)
+    if created_before is not None:
+        query = query.filter(User.created_at < created_before)
+    return query.order_by(User.id)
+
+def _user_row_to_dict(row) -> Dict[str, Any]:
+    return {
+        "id": row.id,
+        "username": row.username,
+        "email": row.email,
+        "is_active": row.is_active,
+        "is_admin": row.is_admin,
+        "is_premium": row.is_premium,
+        "created_at": row.created_at.isoformat() if row.created_at else None,
+        "last_login": row.last_login.isoformat() if row.last_login else None
+    }
+
+def _stream_users_ndjson(filters):
+    """Yield every matching user as one JSON line, reading through a server-side cursor"""
+    db = SessionLocal()
+    try:
+        query = _admin_user_query(db, *filters).execution_options(stream_results=True, yield_per=EXPORT_BATCH_SIZE)
+        batch = []
+        for row in query:
+            batch.append(json.dumps(_user_row_to_dict(row)))
+            if len(batch) >= EXPORT_BATCH_SIZE:
+                yield "\n".join(batch) + "\n"
+                batch = []
+        if batch:
+            yield "\n".join(batch) + "\n"
+    finally:
+        db.close()
+
 @router.get("/admin/users/")
-async def get_all_users(db=Depends(get_db), current_user: User = Depends(get_current_admin_user)):
-    """Get all users (admin only)"""
-    users = db.query(User).all()
-    return [
-        {
-            "id": user.id,
-            "username": user.username,
-            "email": user.email,
-            "is_active": user.is_active,
-            "is_admin": user.is_admin,
-            "created_at": user.created_at
-        }
-        for user in users
-    ]
+async def get_all_users(
+    cursor: Optional[int] = Query(default=None, description="Return users with an id greater than this (next_cursor of the previous page)"),
+    limit: int = Query(default=100, ge=1, le=ADMIN_LIST_MAX_LIMIT),
+    is_active: Optional[bool] = None,
+    is_admin: Optional[bool] = None,
+    is_premium: Optional[bool] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    format: str = Query(default="json", pattern="^(json|ndjson)$"),
+    db=Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
+):
+    """List users page by page, or export all matching users as NDJSON (admin only)"""
+    filters = (is_active, is_admin, is_premium, created_after, created_before)
+    if format == "ndjson":
+        return StreamingResponse(
+            _stream_users_ndjson(filters),
+            media_type="application/x-ndjson",
+            headers={"Content-Disposition": 'attachment; filename="users.ndjson"'}
+        )
+    
+    query = _admin_user_query(db, *filters)
+    if cursor is not None:
+        query = query.filter(User.id > cursor)
+    # Fetch one extra row to know whether another page exists
+    rows = query.limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return {
+        "users": [_user_row_to_dict(row) for row in rows],
+        "next_cursor": rows[-1].id if has_more else None
+    }
+
+@router.patch("/admin/users/{user_id}")
+async def update_user_status(
+    user_id: int,
+    payload: AdminUserUpdateRequest,
+    db=Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
+):
+    """Activate/deactivate, promote/demote or change the plan of a user (admin only)"""
+    user = db.get(User, user_id)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    for field, value in payload.model_dump(exclude_none=True).items():
+        setattr(user, field, value)
+    db.commit()
+    # Cached principals still carry the old flags
+    invalidate_cached_user(user.username)
+    return {
+        "id": user.id,
+        "username": user.username,
+        "is_active": user.is_active,
+        "is_admin": user.is_admin,
+        "is_premium": user.is_premium
+    }
+
+MAX_IMPORT_BYTES = 20 * 1024 * 1024
+
+@router.post("/admin/users/import")
+async def import_users_endpoint(
+    file: UploadFile = File(...),
+    format: Optional[str] = Query(default=None, pattern="^(csv|ndjson)$", description="Defaults to the file extension"),
+    dry_run: bool = False,
+    db=Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
+):
+    """Create many users from a CSV or NDJSON file and report per-row errors (admin only)
+
+    Each row needs an email and either a password or a bcrypt password_hash;
+    username, full_name, phone, address, is_active and is_premium are optional.
+    """
+    file_format = format or ("ndjson" if (file.filename or "").lower().endswith((".ndjson", ".jsonl")) else "csv")
+    content = await file.read(MAX_IMPORT_BYTES + 1)
+    if len(content) > MAX_IMPORT_BYTES:
+        raise HTTPException(status_code=413, detail="Import file is too large")
+    try:
+        return await import_users(db, content, file_format, dry_run=dry_run)
+    except (ImportRowError, UnicodeDecodeError, csv.Error) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid import file: {str(e)}")
+
+# Parsed CV keys stored on the user row; everything else lives in versioned CV profiles
+PROFILE_FIELD_COLUMNS = {
+    "name": "full_name",
+    "phone": "phone",
+    "address": "address",
+}
+
+class CVProfilePatchRequest(BaseModel):
+    name: Optional[str] = None
+    phone: Optional[str] = None
+    address: Optional[str] = None
+    summary: Optional[str] = None
+    experience: Optional[List[Any]] = None
+    education: Optional[List[Any]] = None
+    skills: Optional[List[Any]] = None
+    languages: Optional[List[Any]] = None
+    certifications: Optional[List[Any]] = None
+    links: Optional[List[Any]] = None
+    file_id: Optional[int] = None
+
+def _check_file_owner(db, user: User, file_id: Optional[int]):
+    if file_id is None:
+        return
+    owner_id = db.query(UploadedFile.user_id).filter(UploadedFile.id == file_id).scalar()
+    if owner_id != user.id:
+        raise HTTPException(status_code=404, detail="Uploaded file not found")
+
+def _write_cv_fields(db, user: User, fields: Dict[str, Any], file_id: Optional[int] = None) -> CVProfile:
+    """Update the profile columns on the user row and store the CV fields as a new profile version, in one transaction"""
+    values = {PROFILE_FIELD_COLUMNS[key]: fields[key] for key in PROFILE_FIELD_COLUMNS if key in fields}
+    profile = save_cv_profile(db, user.id, fields, file_id=file_id, user_values=values)
+    if values:
+        invalidate_cached_user(user.username)
+    return profile
 
 @router.put("/update-profile-from-cv/")
 async def update_profile_from_cv(
@@ -235,46 +420,26 @@ async def update_profile_from_cv(
     db=Depends(get_db)
 ):
     """Update user profile with parsed CV data"""
+    _check_file_owner(db, current_user, payload.file_id)
     try:
         parsed_data = payload.parsed_data
-          # Update user fields with parsed CV data
-        if parsed_data.get('name'):
-            setattr(current_user, 'full_name', parsed_data['name'])
-        if parsed_data.get('phone'):
-            setattr(current_user, 'phone', parsed_data['phone'])
-        if parsed_data.get('address'):
-            setattr(current_user, 'address', parsed_data['address'])
-        if parsed_data.get('summary'):
-            setattr(current_user, 'summary', parsed_data['summary'])
-        
-        # Store complex data as JSON strings
-        if parsed_data.get('experience'):
-            setattr(current_user, 'experience_json', json.dumps(parsed_data['experience']))
-        if parsed_data.get('education'):
-            setattr(current_user, 'education_json', json.dumps(parsed_data['education']))
-        if parsed_data.get('skills'):
-            setattr(current_user, 'skills_json', json.dumps(parsed_data['skills']))
-        if parsed_data.get('languages'):
-            setattr(current_user, 'languages_json', json.dumps(parsed_data['languages']))
-        if parsed_data.get('certifications'):
-            setattr(current_user, 'certifications_json', json.dumps(parsed_data['certifications']))
-        if parsed_data.get('links'):
-            setattr(current_user, 'links_json', json.dumps(parsed_data['links']))
-        
-        # Update timestamp        setattr(current_user, 'cv_updated_at', datetime.utcnow())
-        
-        # Commit changes
-        db.commit()
-        db.refresh(current_user)
+        # Fields missing or empty in the parsed CV keep their current values
+        fields = {
+            key: parsed_data[key]
+            for key in (*PROFILE_FIELD_COLUMNS, *CV_DOCUMENT_FIELDS)
+            if parsed_data.get(key)
+        }
+        profile = _write_cv_fields(db, current_user, fields, file_id=payload.file_id)
         
         return {
             "message": "Profile updated successfully with CV data",
             "updated_fields": {
-                "name": getattr(current_user, 'full_name', None),
-                "phone": getattr(current_user, 'phone', None),
-                "address": getattr(current_user, 'address', None),
-                "summary": getattr(current_user, 'summary', None),
-                "cv_updated_at": getattr(current_user, 'cv_updated_at', None)
+                "name": fields.get("name", current_user.full_name),
+                "phone": fields.get("phone", current_user.phone),
+                "address": fields.get("address", current_user.address),
+                "summary": profile.summary,
+                "cv_version": profile.version,
+                "cv_updated_at": profile.created_at
             }
         }
         
@@ -285,8 +450,32 @@ async def update_profile_from_cv(
             detail=f"Failed to update profile: {str(e)}"
         )
 
+@router.patch("/profile/cv/")
+async def patch_cv_profile(
+    payload: CVProfilePatchRequest,
+    current_user: User = Depends(get_current_user),
+    db=Depends(get_db)
+):
+    """Update only the CV fields present in the request body"""
+    fields = payload.model_dump(exclude_unset=True)
+    file_id = fields.pop("file_id", None)
+    if not fields:
+        raise HTTPException(status_code=400, detail="No CV fields to update")
+    _check_file_owner(db, current_user, file_id)
+    try:
+        profile = _write_cv_fields(db, current_user, fields, file_id=file_id)
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"Failed to update profile: {str(e)}")
+    return {
+        "message": "Profile updated successfully",
+        "updated_fields": sorted(fields),
+        "cv_version": profile.version,
+        "cv_updated_at": profile.created_at
+    }
+
 @router.get("/profile/")
-async def get_user_profile(current_user: User = Depends(get_current_user)):
+async def get_user_profile(current_user: User = Depends(get_current_user), db=Depends(get_db)):
     """Get user profile including CV data"""
     try:
         profile_data = {
@@ -295,18 +484,12 @@ async def get_user_profile(current_user: User = Depends(get_current_user)):
             "email": current_user.email,
             "is_active": current_user.is_active,
             "is_admin": current_user.is_admin,
-            "created_at": current_user.created_at,            "cv_data": {
-                "full_name": getattr(current_user, 'full_name', None),
-                "phone": getattr(current_user, 'phone', None),
-                "address": getattr(current_user, 'address', None),
-                "summary": getattr(current_user, 'summary', None),
-                "experience": json.loads(getattr(current_user, 'experience_json', '[]')) if getattr(current_user, 'experience_json', None) else [],
-                "education": json.loads(getattr(current_user, 'education_json', '[]')) if getattr(current_user, 'education_json', None) else [],
-                "skills": json.loads(getattr(current_user, 'skills_json', '[]')) if getattr(current_user, 'skills_json', None) else [],
-                "languages": json.loads(getattr(current_user, 'languages_json', '[]')) if getattr(current_user, 'languages_json', None) else [],
-                "certifications": json.loads(getattr(current_user, 'certifications_json', '[]')) if getattr(current_user, 'certifications_json', None) else [],
-                "links": json.loads(getattr(current_user, 'links_json', '[]')) if getattr(current_user, 'links_json', None) else [],
-                "cv_updated_at": getattr(current_user, 'cv_updated_at', None)
+            "created_at": current_user.created_at,
+            "cv_data": {
+                "full_name": current_user.full_name,
+                "phone": current_user.phone,
+                "address": current_user.address,
+                **cv_profile_to_dict(get_current_cv_profile(db, current_user.id))
             }
         }
         
@@ -318,6 +501,41 @@ async def get_user_profile(current_user: User = Depends(get_current_user)):
             detail=f"Failed to retrieve profile: {str(e)}"
         )
 
+@router.get("/profile/cv/versions/")
+async def list_cv_versions(current_user: User = Depends(get_current_user), db=Depends(get_db)):
+    """List the stored versions of the current user's CV profile"""
+    return {"versions": list_cv_profile_versions(db, current_user.id)}
+
+@router.get("/profile/cv/versions/{version}")
+async def get_cv_version(version: int, current_user: User = Depends(get_current_user), db=Depends(get_db)):
+    """Get one stored version of the current user's CV profile"""
+    profile = get_cv_profile_version(db, current_user.id, version)
+    if not profile:
+        raise HTTPException(status_code=404, detail="CV version not found")
+    return cv_profile_to_dict(profile)
+
+@router.get("/profile/cv/diff/")
+async def diff_cv_versions(
+    from_version: int = Query(..., ge=1),
+    to_version: Optional[int] = Query(None, ge=1),
+    current_user: User = Depends(get_current_user),
+    db=Depends(get_db)
+):
+    """Compare two versions of the current user's CV profile (defaults to the current one)"""
+    old = get_cv_profile_version(db, current_user.id, from_version)
+    new = (
+        get_cv_profile_version(db, current_user.id, to_version)
+        if to_version is not None
+        else get_current_cv_profile(db, current_user.id)
+    )
+    if not old or not new:
+        raise HTTPException(status_code=404, detail="CV version not found")
+    return {
+        "from_version": old.version,
+        "to_version": new.version,
+        "changes": diff_cv_profiles(old, new)
+    }
+
 @router.post("/refresh/")
 async def refresh_access_token(current_user: User = Depends(get_current_user)):
     """Refresh access token for authenticated user"""
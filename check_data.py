@@ -19,7 +19,10 @@ with engine.connect() as conn:
     
     # Check if user has CV data
     if 'users' in tables:
-        cv_result = conn.execute(text("SELECT username, full_name, phone, summary FROM users WHERE full_name IS NOT NULL"))
+        cv_result = conn.execute(text(
+            "SELECT u.username, u.full_name, u.phone, p.summary FROM users u "
+            "JOIN cv_profiles p ON p.user_id = u.id AND p.is_current"
+        ))
         cv_users = cv_result.fetchall()
         print(f'\nUsers with CV data ({len(cv_users)} rows):')
         for cv_user in cv_users: